@@ -0,0 +1,253 @@
+"""
+end to end benchmark of the build backend on a synthetic project
+
+the project has many small modules, a deep tree, a few huge binary payloads
+and build scripts producing files. Every build runs in a fresh process,
+so peak RSS and I/O counters belong to that build only.
+
+    python benchmarks/backend.py --modules 5000 --payloads 2 --payload-size-mb 256 > result.json
+
+phases are accumulated time of the backend functions which do the work:
+    sources  stat and hash of source files against the build cache
+    scripts  build scripts
+    archive  reading, compressing and writing of archive members
+    records  RECORD and the zip central directory
+    copy     copying of files, e.g. the cached wheel to the target
+concurrent build scripts may add up to more than the wall time
+"""
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from functools import wraps
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import threading
+
+import toolspy
+
+BUILD_SCRIPT = '''
+import os
+
+
+def run(dirs, config):
+    root = dirs.data_purelib / "synthetic_payloads" / config["name"]
+    root.mkdir(parents=True, exist_ok=True)
+    chunk = os.urandom(1024 * 1024)
+    for index in range(config["files"]):
+        with (root / f"{index}.bin").open("wb") as f:
+            for _ in range(config["size_kb"] // 1024):
+                f.write(chunk)
+            f.write(chunk[:config["size_kb"] % 1024 * 1024])
+'''
+
+# kind of build, whether the build cache is on, whether the target is cleaned before the build
+CASES = [
+    ("wheel", "cold", True, True),
+    ("wheel", "warm", True, False),
+    ("wheel", "nocache", False, True),
+    ("editable", "cold", True, True),
+    ("editable", "warm", True, False),
+    ("sdist", "cold", False, True),
+]
+
+
+def make_project(
+    root: Path,
+    modules: int,
+    module_size: int,
+    depth: int,
+    payloads: int,
+    payload_size: int,
+    scripts: int,
+    script_files: int,
+    script_size_kb: int,
+):
+    package = root / "src" / "synthetic"
+    package.mkdir(parents=True)
+    (package / "__init__.py").write_text("")
+
+    # many small modules in a flat-ish tree
+    body = ("x = 1\n" * (module_size // 6 + 1))[:module_size]
+    for index in range(modules):
+        path = package / "flat" / f"m{index % 50:02}" / f"module_{index}.py"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(body)
+
+    # a deep tree
+    deep = package / "deep"
+    for level in range(depth):
+        deep = deep / f"level_{level}"
+        deep.mkdir(parents=True)
+        (deep / "__init__.py").write_text(body)
+
+    # a few huge binary payloads
+    chunk = os.urandom(1024 * 1024)
+    for index in range(payloads):
+        path = package / "payloads" / f"payload_{index}.bin"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("wb") as f:
+            for _ in range(payload_size // len(chunk)):
+                f.write(chunk)
+
+    (root / "tools").mkdir()
+    build_scripts = []
+    for index in range(scripts):
+        name = f"generate_{index}"
+        (root / "tools" / f"{name}.py").write_text(BUILD_SCRIPT)
+        build_scripts.append(
+            f'{name} = {{ name = "{name}", files = {script_files}, size_kb = {script_size_kb} }}'
+        )
+    (root / "pyproject.toml").write_text("\n".join([
+        "[project]",
+        'name = "synthetic"',
+        'version = "1.0.0"',
+        "",
+        "[tool.toolspy.build_scripts]",
+        *build_scripts,
+        "",
+    ]))
+
+
+class Phases:
+    """accumulates time spent in wrapped functions by phase"""
+
+    def __init__(self):
+        self.times: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def wrap(self, owner, name: str, phase: str):
+        func = getattr(owner, name)
+
+        @wraps(func)
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.times[phase] = self.times.get(phase, 0.0) + perf_counter() - start
+
+        setattr(owner, name, timed)
+
+
+def instrument() -> Phases:
+    from toolspy.project import cache
+    from toolspy.project.project import Project
+    from toolspy.project.wheel import WheelWriter
+    from toolspy.project.sdist import SdistWriter
+
+    phases = Phases()
+    phases.wrap(cache, "_check_sources", "sources")
+    phases.wrap(Project, "run_build_scripts", "scripts")
+    for writer in (WheelWriter, SdistWriter):
+        phases.wrap(writer, "add_file", "archive")
+        phases.wrap(writer, "add_bytes", "archive")
+    phases.wrap(SdistWriter, "close", "archive")
+    phases.wrap(WheelWriter, "close", "records")
+    phases.wrap(shutil, "copy2", "copy")
+    return phases
+
+
+def io_counters() -> dict[str, int]:
+    try:
+        lines = Path("/proc/self/io").read_text().splitlines()
+    except OSError:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return {"read_bytes": usage.ru_inblock * 512, "write_bytes": usage.ru_oublock * 512}
+    counters = dict(line.split(": ") for line in lines)
+    # rchar/wchar count all reads and writes, read_bytes/write_bytes only those hitting the storage
+    return {name: int(counters[name]) for name in ("rchar", "wchar", "read_bytes", "write_bytes")}
+
+
+def run_build(kind: str, project: Path, target: Path, cache: bool) -> dict:
+    """build in this process, called in a child process"""
+    from toolspy.project import build
+
+    os.chdir(project)
+    phases = instrument()
+    settings = {"cache": "true" if cache else "false"}
+    hook = {
+        "wheel": build.build_wheel,
+        "editable": build.build_editable,
+        "sdist": build.build_sdist,
+    }[kind]
+
+    io_before = io_counters()
+    start = perf_counter()
+    name = hook(str(target), settings)
+    wall = perf_counter() - start
+    io_after = io_counters()
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "wall": wall,
+        "phases": phases.times,
+        # kilobytes on Linux, bytes on macOS
+        "peak_rss_bytes": maxrss if sys.platform == "darwin" else maxrss * 1024,
+        "io": {counter: io_after[counter] - io_before[counter] for counter in io_after},
+        "size": (target / name).stat().st_size,
+    }
+
+
+def measure(kind: str, project: Path, target: Path, cache: bool) -> dict:
+    env = dict(os.environ)
+    src = str(Path(toolspy.__file__).parents[1])
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [src, env.get("PYTHONPATH")]))
+    command = [sys.executable, __file__, "--child", kind, str(project), str(target), str(int(cache))]
+    output = subprocess.run(command, env=env, check=True, stdout=subprocess.PIPE, text=True).stdout
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", type=int, default=2000)
+    parser.add_argument("--module-size", type=int, default=2048)
+    parser.add_argument("--depth", type=int, default=50)
+    parser.add_argument("--payloads", type=int, default=2)
+    parser.add_argument("--payload-size-mb", type=int, default=64)
+    parser.add_argument("--scripts", type=int, default=4)
+    parser.add_argument("--script-files", type=int, default=4)
+    parser.add_argument("--script-size-kb", type=int, default=4096)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--child", nargs=4, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        kind, project, target, cache = args.child
+        print(json.dumps(run_build(kind, Path(project), Path(target), cache == "1")))
+        return
+
+    results = {"cpus": os.cpu_count(), "python": sys.version.split()[0], "options": vars(args), "builds": {}}
+    del results["options"]["child"]
+    with TemporaryDirectory() as tmp:
+        project = Path(tmp) / "project"
+        make_project(
+            project,
+            args.modules,
+            args.module_size,
+            args.depth,
+            args.payloads,
+            args.payload_size_mb * 1024 * 1024,
+            args.scripts,
+            args.script_files,
+            args.script_size_kb,
+        )
+        for kind, state, cache, clean in CASES:
+            runs = []
+            for _ in range(args.repeat):
+                target = Path(tmp) / "target" / kind / ("cache" if cache else "nocache")
+                if clean:
+                    shutil.rmtree(target, ignore_errors=True)
+                target.mkdir(parents=True, exist_ok=True)
+                runs.append(measure(kind, project, target, cache))
+            results["builds"][f"{kind}_{state}"] = runs
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+compare import time with editable installs of "pth" and "finder" modes
+
+several synthetic projects are installed in editable mode into a fresh site folder,
+a new interpreter processes their .pth files, imports modules of all of them,
+a few of stdlib and probes modules which don't exist, every part is timed separately
+
+    python benchmarks/editable_import.py --projects 20 --modules 50 --repeat 20
+"""
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from statistics import median
+import argparse
+import compileall
+import json
+import os
+import subprocess
+import sys
+import zipfile
+
+import toolspy
+
+IMPORT_SCRIPT = """
+import json, site, time
+times = {{}}
+start = time.perf_counter()
+site.addsitedir({site_dir!r})
+times["startup"] = time.perf_counter() - start
+
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+times["project"] = time.perf_counter() - start
+
+start = time.perf_counter()
+for name in {stdlib!r}:
+    __import__(name)
+times["stdlib"] = time.perf_counter() - start
+
+# optional dependencies are probed this way, every miss scans all of sys.path
+start = time.perf_counter()
+for index in range({missing}):
+    try:
+        __import__(f"missing_module_{{index}}")
+    except ImportError:
+        pass
+times["missing"] = time.perf_counter() - start
+print(json.dumps(times))
+"""
+
+STDLIB_MODULES = ["json", "decimal", "email.message", "xml.dom.minidom", "http.client", "sqlite3"]
+
+
+def make_project(root: Path, index: int, modules: int):
+    package = root / "src" / f"synthetic_{index}"
+    package.mkdir(parents=True)
+    (package / "__init__.py").write_text("")
+    for module in range(modules):
+        (package / f"module_{module}.py").write_text(f"value = {module}\n")
+    (root / "pyproject.toml").write_text(f'[project]\nname = "synthetic-{index}"\nversion = "1.0.0"\n')
+
+
+def install_editable(project: Path, site_dir: Path, mode: str):
+    env = dict(os.environ)
+    src = str(Path(toolspy.__file__).parents[1])
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [src, env.get("PYTHONPATH")]))
+    target = project / "dist"
+    build = (
+        "from toolspy.project import build;"
+        f"print(build.build_editable({str(target)!r}, {{'editable-mode': {mode!r}, 'cache': 'false'}}))"
+    )
+    name = subprocess.run(
+        [sys.executable, "-c", build], cwd=project, env=env, check=True, stdout=subprocess.PIPE, text=True
+    ).stdout.split()[-1]
+    # the way installers lay out purelib data of the wheel
+    with zipfile.ZipFile(target / name) as wheel:
+        for member in wheel.namelist():
+            parts = member.split("/")
+            if parts[0].endswith(".data") and parts[1] == "purelib":
+                (site_dir / "/".join(parts[2:])).write_bytes(wheel.read(member))
+
+
+def measure(site_dir: Path, modules: list[str], missing: int) -> dict[str, float]:
+    script = IMPORT_SCRIPT.format(site_dir=str(site_dir), modules=modules, stdlib=STDLIB_MODULES, missing=missing)
+    output = subprocess.run([sys.executable, "-S", "-c", script], check=True, stdout=subprocess.PIPE, text=True)
+    return json.loads(output.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--projects", type=int, default=20)
+    parser.add_argument("--modules", type=int, default=20)
+    parser.add_argument("--missing", type=int, default=100, help="imports of modules which don't exist")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    modules = [
+        f"synthetic_{index}.module_{module}"
+        for index in range(args.projects)
+        for module in range(args.modules)
+    ]
+    results = {"python": sys.version.split()[0], "options": vars(args), "modes": {}}
+    with TemporaryDirectory() as tmp:
+        for index in range(args.projects):
+            make_project(Path(tmp) / "projects" / str(index), index, args.modules)
+        compileall.compile_dir(Path(tmp) / "projects", quiet=1)
+        modes = ("pth", "finder")
+        for mode in modes:
+            site_dir = Path(tmp) / "site" / mode
+            site_dir.mkdir(parents=True)
+            for index in range(args.projects):
+                install_editable(Path(tmp) / "projects" / str(index), site_dir, mode)
+            # installers compile modules, so bytecode isn't compiled on every run
+            compileall.compile_dir(site_dir, quiet=1)
+
+        runs = {mode: [] for mode in modes}
+        # modes take turns, so both are equally affected by the noise of the machine
+        for _ in range(args.repeat):
+            for mode in modes:
+                runs[mode].append(measure(Path(tmp) / "site" / mode, modules, args.missing))
+        for mode in modes:
+            results["modes"][mode] = {
+                part: {"median": median(run[part] for run in runs[mode]), "min": min(run[part] for run in runs[mode])}
+                for part in runs[mode][0]
+            }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
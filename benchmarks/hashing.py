@@ -0,0 +1,76 @@
+"""
+compare serial and concurrent hashing of files used for RECORD generation
+
+    python benchmarks/hashing.py --small-files 5000 --big-files 2 --big-size-mb 2048
+"""
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+import argparse
+import json
+import os
+
+from toolspy.utils import file
+
+
+def make_tree(root: Path, small_files: int, small_size: int, big_files: int, big_size: int):
+    small = []
+    for index in range(small_files):
+        path = root / "small" / f"{index % 100:02}" / f"{index}.py"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(os.urandom(small_size))
+        small.append(path)
+    big = []
+    chunk = os.urandom(1024 * 1024)
+    for index in range(big_files):
+        path = root / "big" / f"{index}.bin"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("wb") as f:
+            for _ in range(big_size // len(chunk)):
+                f.write(chunk)
+        big.append(path)
+    return small, big
+
+
+def measure(func, *args) -> float:
+    start = perf_counter()
+    func(*args)
+    return perf_counter() - start
+
+
+def serial(paths: list[Path]):
+    for path in paths:
+        file.sha256(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--small-files", type=int, default=5000)
+    parser.add_argument("--small-size-kb", type=int, default=4)
+    parser.add_argument("--big-files", type=int, default=4)
+    parser.add_argument("--big-size-mb", type=int, default=256)
+    parser.add_argument("--workers", type=int, nargs="*", default=[1, 2, 4, 8, os.cpu_count()])
+    args = parser.parse_args()
+
+    results = {"cpus": os.cpu_count(), "small": {}, "big": {}}
+    with TemporaryDirectory() as tmp:
+        small, big = make_tree(
+            Path(tmp),
+            args.small_files,
+            args.small_size_kb * 1024,
+            args.big_files,
+            args.big_size_mb * 1024 * 1024,
+        )
+        for name, paths in (("small", small), ("big", big)):
+            # warm up page cache, so the disk doesn't dominate
+            serial(paths)
+            results[name]["serial"] = measure(serial, paths)
+            for workers in args.workers:
+                # min_size=0 puts every file in threads, the default keeps small ones serial
+                results[name][f"parallel_{workers}"] = measure(file.sha256_many, paths, workers, 0)
+                results[name][f"default_{workers}"] = measure(file.sha256_many, paths, workers)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
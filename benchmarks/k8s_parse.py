@@ -0,0 +1,90 @@
+"""
+compare parsing of a large kubectl list as YAML and as JSON
+
+a list of synthetic pods is serialized the way `kubectl get pods -o yaml` and `-o json` print it,
+every parser reads it from text, the best of `--repeat` runs is reported
+
+    python benchmarks/k8s_parse.py --objects 10000 --repeat 3
+"""
+from time import perf_counter
+import argparse
+import json
+
+import yaml
+
+from toolspy.utils import parsing
+
+
+def make_pod(index: int) -> dict:
+    name = f"web-{index:05}"
+    return {
+        "apiVersion": "v1",
+        "kind": "Pod",
+        "metadata": {
+            "name": name,
+            "namespace": "default",
+            "uid": f"00000000-0000-0000-0000-{index:012}",
+            "resourceVersion": str(1000 + index),
+            "creationTimestamp": "2024-01-01T00:00:00Z",
+            "labels": {"app": "web", "pod-template-hash": "5d4f8c7b9", "tier": "frontend"},
+            "ownerReferences": [{"apiVersion": "apps/v1", "kind": "ReplicaSet", "name": "web-5d4f8c7b9"}],
+        },
+        "spec": {
+            "containers": [{
+                "name": "web",
+                "image": "nginx:1.25",
+                "ports": [{"containerPort": 80, "protocol": "TCP"}],
+                "resources": {"limits": {"cpu": "500m", "memory": "128Mi"}},
+                "env": [{"name": f"VAR_{var}", "value": str(var)} for var in range(5)],
+            }],
+            "nodeName": f"node-{index % 50}",
+            "restartPolicy": "Always",
+        },
+        "status": {
+            "phase": "Running",
+            "podIP": f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}",
+            "conditions": [{"type": "Ready", "status": "True"}],
+        },
+    }
+
+
+def best(func, text: str, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        func(text)
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--objects", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pods = {"apiVersion": "v1", "kind": "List", "metadata": {}, "items": [make_pod(i) for i in range(args.objects)]}
+    yaml_text = parsing.dump_yaml(pods)
+    json_text = json.dumps(pods, indent=4)
+
+    cases = {
+        "yaml.safe_load": (yaml.safe_load, yaml_text),
+        "parsing.load_yaml": (parsing.load_yaml, yaml_text),
+        "parsing.load_json": (parsing.load_json, json_text),
+    }
+    results = {
+        "objects": args.objects,
+        "yaml_mb": len(yaml_text) / 1024 ** 2,
+        "json_mb": len(json_text) / 1024 ** 2,
+        "libyaml": parsing.SafeLoader is not yaml.SafeLoader,
+        "seconds": {},
+    }
+    for name, (func, text) in cases.items():
+        results["seconds"][name] = best(func, text, args.repeat)
+    baseline = results["seconds"]["yaml.safe_load"]
+    results["speedup"] = {name: baseline / seconds for name, seconds in results["seconds"].items()}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
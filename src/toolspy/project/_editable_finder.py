@@ -0,0 +1,143 @@
+"""
+meta path finder of an editable install
+
+the source of this module is copied into editable wheels, so it must depend on stdlib only.
+Top level modules of the project are found in a map precomputed when the wheel is built,
+instead of scanning one more `sys.path` entry on every import.
+The finder goes after `PathFinder`, so as with the src folder at the end of `sys.path`
+the project can't shadow stdlib or installed modules.
+Submodules are found by the regular machinery in `__path__` of their packages.
+The map is refreshed when modification time of the source folder has changed since the build,
+i.e. a top level module is added or removed, at startup and on `importlib.invalidate_caches()`.
+"""
+from importlib.machinery import (
+    BYTECODE_SUFFIXES,
+    EXTENSION_SUFFIXES,
+    ExtensionFileLoader,
+    ModuleSpec,
+    PathFinder,
+    SourceFileLoader,
+    SourcelessFileLoader,
+    all_suffixes,
+)
+import os
+import sys
+
+MODULE = "module"
+PACKAGE = "package"
+NAMESPACE = "namespace"
+
+
+def scan(src: str) -> dict[str, list[str]]:
+    """top level modules of the source folder, `name: [kind, path]`, none if it doesn't exist"""
+    suffixes = sorted(all_suffixes(), key=len, reverse=True)
+    mapping = {}
+    try:
+        entries = list(os.scandir(src))
+    except (FileNotFoundError, NotADirectoryError):
+        # e.g. the project is moved, it must not break startup of the interpreter
+        return mapping
+    for entry in sorted(entries, key=lambda entry: entry.name):
+        if entry.is_dir():
+            if not entry.name.isidentifier() or entry.name == "__pycache__":
+                continue
+            init = os.path.join(entry.path, "__init__.py")
+            if os.path.exists(init):
+                mapping[entry.name] = [PACKAGE, init]
+            else:
+                mapping.setdefault(entry.name, [NAMESPACE, entry.path])
+            continue
+        for suffix in suffixes:
+            if entry.name.endswith(suffix):
+                # extension modules have suffixes like .cpython-312-x86_64-linux-gnu.so
+                name = entry.name[:-len(suffix)]
+                if name.isidentifier() and name not in mapping:
+                    mapping[name] = [MODULE, entry.path]
+                break
+    return mapping
+
+
+def _loader(fullname: str, path: str):
+    if path.endswith(tuple(EXTENSION_SUFFIXES)):
+        return ExtensionFileLoader(fullname, path)
+    if path.endswith(tuple(BYTECODE_SUFFIXES)):
+        return SourcelessFileLoader(fullname, path)
+    return SourceFileLoader(fullname, path)
+
+
+class EditableFinder:
+    """finder shared by all editable projects installed this way"""
+
+    # finders of the same version found in `sys.meta_path` are joined
+    version = 1
+
+    def __init__(self):
+        # src folder: [map of its modules, modification time the map is made for]
+        self.sources: dict[str, list] = {}
+        self.mapping: dict[str, list[str]] = {}
+
+    def add(self, src: str, mapping: dict[str, list[str]], mtime_ns: int):
+        self.sources[src] = [mapping, mtime_ns]
+        self._refresh(src)
+        self._merge()
+
+    def find_spec(self, fullname: str, path=None, target=None):
+        location = self.mapping.get(fullname)
+        if location is None:
+            return None
+
+        kind, module_path = location
+        if kind == NAMESPACE:
+            spec = ModuleSpec(fullname, None, is_package=True)
+            spec.submodule_search_locations = [module_path]
+            return spec
+        # the same spec as `importlib.util.spec_from_file_location` makes, without importing it at startup
+        spec = ModuleSpec(fullname, _loader(fullname, module_path), origin=module_path, is_package=kind == PACKAGE)
+        spec.has_location = True
+        if kind == PACKAGE:
+            spec.submodule_search_locations = [os.path.dirname(module_path)]
+        return spec
+
+    def invalidate_caches(self):
+        """called by `importlib.invalidate_caches()`, which is required after creating modules anyway"""
+        for src in self.sources:
+            self._refresh(src)
+        self._merge()
+
+    def _refresh(self, src: str):
+        """rescan the source folder if it changed, a single stat otherwise"""
+        try:
+            mtime_ns = os.stat(src).st_mtime_ns
+        except OSError:
+            # removed source folder has no modules, it is scanned again once it's back
+            self.sources[src] = [{}, None]
+            return
+        if mtime_ns != self.sources[src][1]:
+            self.sources[src] = [scan(src), mtime_ns]
+
+    def _merge(self):
+        # modules of the project installed first win, as if its src was earlier in sys.path
+        self.mapping = {}
+        for mapping, _ in reversed(self.sources.values()):
+            self.mapping.update(mapping)
+
+
+def install(src: str, mapping: dict[str, list[str]], mtime_ns: int) -> EditableFinder:
+    """
+    add the project to the finder, every import of a module not found on `sys.path`
+    costs a single dictionary lookup regardless of the number of installed projects
+    """
+    for finder in sys.meta_path:
+        if type(finder).__name__ == EditableFinder.__name__ and getattr(finder, "version", None) == EditableFinder.version:
+            break
+    else:
+        finder = EditableFinder()
+        # right after `PathFinder`, like src appended to `sys.path` by a .pth file,
+        # so modules of the project never shadow stdlib and installed ones
+        index = next(
+            (index + 1 for index, meta_finder in enumerate(sys.meta_path) if meta_finder is PathFinder),
+            len(sys.meta_path),
+        )
+        sys.meta_path.insert(index, finder)
+    finder.add(src, mapping, mtime_ns)
+    return finder
@@ -0,0 +1,276 @@
+"""
+archive engine which compresses on a thread pool
+
+data of every member is split into chunks deflated concurrently (zlib releases the GIL),
+each chunk is primed with the tail of the previous one and flushed to a byte boundary,
+so compressed chunks are concatenated into a single valid deflate stream the way pigz does.
+Chunks are written in their original order, the number of chunks in flight is bounded.
+"""
+from pathlib import Path
+from dataclasses import dataclass, replace
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import deque
+from collections.abc import Iterable, Iterator
+from typing import Callable, Union
+import os
+import struct
+import zipfile
+import zlib
+
+CHUNK_SIZE = 1024 * 1024
+DICT_SIZE = 32 * 1024
+
+
+@dataclass
+class Compression:
+    """
+    Args:
+        level: zlib compression level from 0 to 9
+        store: don't compress at all
+        workers: number of compressing threads, number of CPUs by default
+    """
+    level: int = 6
+    store: bool = False
+    workers: int = None
+
+    @property
+    def parallel(self) -> bool:
+        return not self.store and self.max_workers > 1
+
+    @property
+    def max_workers(self) -> int:
+        return self.workers or os.cpu_count() or 1
+
+
+def read_chunks(path: Path, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    with path.open("rb") as source:
+        for chunk in iter(lambda: source.read(chunk_size), b""):
+            yield chunk
+
+
+def _deflate(chunk: bytes, zdict: bytes, level: int, last: bool) -> bytes:
+    if zdict:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=zdict)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(chunk) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class _OrderedWriter:
+    """writes results of submitted jobs and callbacks strictly in submission order"""
+
+    def __init__(self, write: Callable[[bytes], None], compression: Compression):
+        self._write = write
+        self._compression = compression
+        self._executor = None
+        if compression.parallel:
+            self._executor = ThreadPoolExecutor(compression.max_workers)
+        self._pending: deque[Union[Future, bytes, Callable[[], None]]] = deque()
+        self._max_pending = compression.max_workers * 2
+        self._zdict = b""
+
+    def deflate(self, chunks: Iterable[bytes], on_chunk: Callable[[bytes], None] = None, finish=True):
+        """
+        queue compressed chunks of the current deflate stream
+
+        Args:
+            chunks: uncompressed data
+            on_chunk: called with every chunk of uncompressed data in order
+            finish: end the stream after the chunks, otherwise it continues with the next call
+        """
+        previous = None
+        for chunk in chunks:
+            if previous is not None:
+                self._deflate_chunk(previous, last=False)
+            if on_chunk:
+                on_chunk(chunk)
+            previous = chunk
+        if finish:
+            self._deflate_chunk(previous or b"", last=True)
+            self._zdict = b""
+        elif previous is not None:
+            self._deflate_chunk(previous, last=False)
+
+    def _deflate_chunk(self, chunk: bytes, last: bool):
+        if self._compression.store:
+            self._put(chunk)
+        elif self._executor:
+            level = self._compression.level
+            self._put(self._executor.submit(_deflate, chunk, self._zdict, level, last))
+        else:
+            self._put(_deflate(chunk, self._zdict, self._compression.level, last))
+        if len(chunk) >= DICT_SIZE:
+            self._zdict = chunk[-DICT_SIZE:]
+        elif chunk:
+            self._zdict = (self._zdict + chunk)[-DICT_SIZE:]
+
+    def call(self, callback: Callable[[], None]):
+        """queue callback to run after everything queued before is written"""
+        self._put(callback)
+
+    def _put(self, item):
+        self._pending.append(item)
+        while len(self._pending) > self._max_pending:
+            self._flush_one()
+
+    def _flush_one(self):
+        item = self._pending.popleft()
+        if isinstance(item, Future):
+            self._write(item.result())
+        elif isinstance(item, bytes):
+            self._write(item)
+        else:
+            item()
+
+    def flush(self):
+        while self._pending:
+            self._flush_one()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            if self._executor:
+                self._executor.shutdown(cancel_futures=True)
+
+
+class ZipArchive:
+    """zip archive with members compressed on a thread pool"""
+
+    def __init__(self, path: Path, compression: Compression):
+        self.compression = compression
+        self._zip = zipfile.ZipFile(path, "w")
+        self._writer = _OrderedWriter(self._write, compression)
+        self._member: zipfile.ZipInfo = None
+
+    def add(self, zinfo: zipfile.ZipInfo, chunks: Iterable[bytes]):
+        """
+        add member of `zinfo.file_size` bytes
+
+        chunks are read by the calling thread, so they are consumed once add returns
+        """
+        zinfo.compress_type = zipfile.ZIP_STORED if self.compression.store else zipfile.ZIP_DEFLATED
+        zinfo.compress_size = 0
+        zinfo.CRC = 0
+        expected_size = zinfo.file_size
+        # same decision as in zipfile, header is rewritten with actual sizes
+        zip64 = expected_size * 1.05 > zipfile.ZIP64_LIMIT
+        zinfo.file_size = 0
+
+        def update(chunk: bytes):
+            zinfo.CRC = zlib.crc32(chunk, zinfo.CRC)
+            zinfo.file_size += len(chunk)
+
+        self._writer.call(lambda: self._start_member(zinfo, zip64))
+        self._writer.deflate(chunks, update)
+        self._writer.call(lambda: self._finish_member(zinfo, zip64))
+
+    def add_raw(self, source: zipfile.ZipFile, name: str):
+        """add member of another archive as it is, its data isn't decompressed and compressed again"""
+        source_info = source.getinfo(name)
+        zinfo = zipfile.ZipInfo(source_info.filename, source_info.date_time)
+        zinfo.external_attr = source_info.external_attr
+        zinfo.compress_type = source_info.compress_type
+        zinfo.CRC = source_info.CRC
+        zinfo.file_size = source_info.file_size
+        zinfo.compress_size = 0
+        zip64 = max(source_info.file_size, source_info.compress_size) * 1.05 > zipfile.ZIP64_LIMIT
+
+        def copy():
+            # data follows the local header which has its own name and extra field lengths
+            fp = source.fp
+            fp.seek(source_info.header_offset)
+            header = fp.read(zipfile.sizeFileHeader)
+            name_length, extra_length = struct.unpack("<HH", header[26:30])
+            fp.seek(source_info.header_offset + zipfile.sizeFileHeader + name_length + extra_length)
+            self._start_member(zinfo, zip64)
+            remaining = source_info.compress_size
+            while remaining:
+                data = fp.read(min(remaining, CHUNK_SIZE))
+                if not data:
+                    raise RuntimeError(f"'{name}' is truncated in {source.filename}")
+                self._write(data)
+                remaining -= len(data)
+            self._finish_member(zinfo, zip64)
+
+        self._writer.call(copy)
+
+    def _start_member(self, zinfo: zipfile.ZipInfo, zip64: bool):
+        # zipfile itself doesn't accept compressed data,
+        # so local headers are written here and the central directory by zipfile
+        fp = self._zip.fp
+        zinfo.header_offset = fp.tell()
+        fp.write(zinfo.FileHeader(zip64))
+        self._member = zinfo
+
+    def _write(self, data: bytes):
+        self._zip.fp.write(data)
+        self._member.compress_size += len(data)
+
+    def _finish_member(self, zinfo: zipfile.ZipInfo, zip64: bool):
+        fp = self._zip.fp
+        if not zip64 and max(zinfo.file_size, zinfo.compress_size) > zipfile.ZIP64_LIMIT:
+            raise RuntimeError(f"'{zinfo.filename}' has grown while it was archived")
+        end = fp.tell()
+        fp.seek(zinfo.header_offset)
+        fp.write(zinfo.FileHeader(zip64))
+        fp.seek(end)
+        self._zip.filelist.append(zinfo)
+        self._zip.NameToInfo[zinfo.filename] = zinfo
+        self._zip.start_dir = end
+        self._member = None
+
+    def close(self):
+        try:
+            self._writer.close()
+        finally:
+            self._zip.close()
+
+
+class GzipFile:
+    """
+    write-only gzip file compressed on a thread pool
+
+    produces a single gzip member without name and mtime, so output depends only on data
+    """
+
+    def __init__(self, path: Path, compression: Compression):
+        if compression.store:
+            # gzip has no stored mode, deflate level 0 stores data in raw blocks
+            compression = replace(compression, store=False, level=0)
+        self._file = path.open("wb")
+        self._buffer = bytearray()
+        self._crc = 0
+        self._size = 0
+        # no flags, no mtime, unknown OS
+        self._file.write(b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff")
+        self._writer = _OrderedWriter(self._file.write, compression)
+
+    def __enter__(self) -> "GzipFile":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        if len(self._buffer) >= CHUNK_SIZE:
+            self._writer.deflate(self._take_chunks(), self._update, finish=False)
+        return len(data)
+
+    def _take_chunks(self) -> Iterator[bytes]:
+        while len(self._buffer) >= CHUNK_SIZE:
+            yield bytes(self._buffer[:CHUNK_SIZE])
+            del self._buffer[:CHUNK_SIZE]
+
+    def _update(self, chunk: bytes):
+        self._crc = zlib.crc32(chunk, self._crc)
+        self._size += len(chunk)
+
+    def close(self):
+        try:
+            self._writer.deflate([bytes(self._buffer)], self._update)
+            self._writer.close()
+            self._file.write(struct.pack("<II", self._crc, self._size & 0xFFFFFFFF))
+        finally:
+            self._file.close()
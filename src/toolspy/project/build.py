@@ -1,7 +1,5 @@
 from pathlib import Path
-import shutil
-import sys
-import importlib
+from functools import partial
 
 
 REQUIREMENTS = ["tomlkit", "httpx"]
@@ -18,70 +16,189 @@ get_requires_for_build_editable = _get_requires
 
 def build_sdist(wheel_dir: str, settings: dict = None, metadata_dir: str = None):
     from toolspy.project.project import Project
-    from toolspy.utils import file
+    from toolspy.project.sdist import SdistWriter
 
-    sdist_path: Path = None
     project = Project(Path(wheel_dir), Path())
+    dirs = project.dirs
 
-    with file.temp_dir(project.dirs.wheel):
+    # members are streamed from the source tree
+    # and placed as if `dirs.wheel` was the root of the sdist
+    with SdistWriter(dirs.sdist_file, dirs.wheel.name, _compression(project, settings)) as writer:
         # SOURCE
-        shutil.copy(project.dirs.source_pyproject_toml, project.dirs.wheel)
-        if project.dirs.source_src.exists():
-            shutil.copytree(
-                project.dirs.source_src,
-                project.dirs.wheel_src,
-                ignore=shutil.ignore_patterns(*IGNORE_SRC_PATTERNS)
-            )
-        for build_script_name in project.build_scripts.keys():
-            script_path = project.dirs.source_tools / f"{build_script_name}.py"
+        writer.add_file(dirs.source_pyproject_toml, dirs.arcname(dirs.wheel / dirs.source_pyproject_toml.name))
+        writer.add_tree(dirs.source_src, dirs.arcname(dirs.wheel_src), IGNORE_SRC_PATTERNS)
+        for build_script_name in (project.build_scripts or {}).keys():
+            script_path = dirs.source_tools / f"{build_script_name}.py"
             if not script_path.exists():
                 raise RuntimeError(f"cannot find {build_script_name} in 'tools' folder")
-            project.dirs.wheel_build_scripts.mkdir(exist_ok=True, parents=True)
-            shutil.copy(script_path, project.dirs.wheel_build_scripts)
+            writer.add_file(script_path, dirs.arcname(dirs.wheel_build_scripts / script_path.name))
 
         # METADATA
-        file.from_iterable(project.dirs.wheel_PKG_INFO, project.core_metadata())
-
-        # PACKAGE
-        sdist_path_str = shutil.make_archive(
-            str(project.dirs.sdist_file.with_suffix("").absolute()),
-            format="gztar",
-            root_dir=project.dirs.target,
-            base_dir=project.dirs.wheel.name,
-        )
-        sdist_path = Path(sdist_path_str)
+        metadata = "\n".join(project.core_metadata())
+        writer.add_bytes(dirs.arcname(dirs.wheel_PKG_INFO), metadata.encode())
+
+    return dirs.sdist_file.name
+
+
+def _setting(project, settings: dict, name: str, default=None):
+    """option passed via frontend's config_settings or defined in [tool.toolspy]"""
+    if settings and name in settings:
+        return settings[name]
+    return project.settings.get(name, default)
+
+
+def _flag(value) -> bool:
+    if isinstance(value, str):
+        return value.lower() not in ("", "0", "false", "no", "off")
+    return bool(value)
+
+
+def _compression(project, settings: dict, editable: bool = False):
+    """
+    compression of archive members, configured by
+        compression: "deflate" or "store", editable wheels are stored by default
+        compression-level: from 0 to 9
+        compression-workers: number of compressing threads
+    """
+    from toolspy.project.archive import Compression
+
+    default_method = "store" if editable else "deflate"
+    method = _setting(project, settings, "compression", default_method)
+    if method not in ("deflate", "store"):
+        raise ValueError(f"unknown compression '{method}', expected 'deflate' or 'store'")
+    workers = _setting(project, settings, "compression-workers")
+    return Compression(
+        level=int(_setting(project, settings, "compression-level", Compression.level)),
+        store=method == "store",
+        workers=int(workers) if workers else None,
+    )
+
+
+def _platform(settings: dict = None):
+    """platform tag passed via frontend's config_settings, otherwise it is taken from [tool.toolspy]"""
+    return (settings or {}).get("platform")
+
+
+def _prepare_metadata(metadata_dir: str, settings: dict = None):
+    """
+    write `{name_version}.dist-info` without building the wheel,
+    so frontends resolve dependencies without running build scripts
+    """
+    from toolspy.project.project import Project
+    from toolspy.project.wheel import DirectoryWriter
 
-    return sdist_path.name
+    project = Project(Path(metadata_dir), Path(), platform=_platform(settings))
+    project.add_dist_info(DirectoryWriter(Path(metadata_dir)))
+    return project.dirs.dist_info.name
+
+prepare_metadata_for_build_wheel = _prepare_metadata
+prepare_metadata_for_build_editable = _prepare_metadata
 
 
 def build_editable(wheel_dir: str, settings: dict = None, metadata_dir: str = None):
-    return _build_wheel(wheel_dir, editable=True)
+    return _build_wheel(wheel_dir, editable=True, settings=settings, metadata_dir=metadata_dir)
 
 
 def build_wheel(wheel_dir: str, settings: dict = None, metadata_dir: str = None):
-    return _build_wheel(wheel_dir, editable=False)
+    return _build_wheel(wheel_dir, editable=False, settings=settings, metadata_dir=metadata_dir)
 
-def _build_wheel(wheel_dir: str, editable: bool):
-    from toolspy.project.project import Project
+def _build_wheel(wheel_dir: str, editable: bool, settings: dict = None, metadata_dir: str = None):
+    from toolspy.project.project import Project, Directories
+    from toolspy.project.wheel import WheelWriter
+    from toolspy.project import cache
+    from toolspy.project.editable import members as editable_members
     from toolspy.utils import file
 
     wheel_path: Path = None
-    project = Project(Path(wheel_dir), Path())
+    project = Project(Path(wheel_dir), Path(), platform=_platform(settings))
+    metadata_path = Path(metadata_dir) if metadata_dir else None
+
+    compression = _compression(project, settings, editable)
+    scripts_workers = _setting(project, settings, "build-scripts-workers")
+    scripts_workers = int(scripts_workers) if scripts_workers else None
+    # "pth" or "finder", which speeds up imports but slows down startup, see `toolspy.project.editable`
+    editable_mode = _setting(project, settings, "editable-mode", "pth")
+
+    if _flag(_setting(project, settings, "cache", True)):
+        # every platform has its own stage and manifest, files of per-platform scripts differ
+        stage = project.dirs.cache / project.platform_tag / ("editable" if editable else "wheel")
+        project.dirs = Directories(project.dirs.target, project, stage)
+        wheel_path = cache.build_wheel(
+            project, editable, IGNORE_SRC_PATTERNS, compression, scripts_workers, metadata_path, editable_mode
+        )
+        return wheel_path.name
 
-    with file.temp_dir(project.dirs.wheel):
+    writer = WheelWriter(project.dirs.wheel_file, project.dirs.dist_info.name, compression)
+    # files put by build scripts into `project.dirs` are staged
+    with file.temp_dir(project.dirs.wheel), writer:
         if editable:
-            # put link to project's src folder
-            src_pth = project.dirs.data_purelib_src_pth
-            src_pth.parent.mkdir(parents=True, exist_ok=True)
-            src_pth.write_text(str(project.dirs.source_src.absolute()))
+            # put link to project's src folder or the finder of its modules
+            for arcname, data in editable_members(project, editable_mode).items():
+                writer.add_bytes(arcname, data)
         else:
-            if project.dirs.source_src.exists():
-                shutil.copytree(project.dirs.source_src, project.dirs.data_purelib)
-
-        project.run_build_scripts()
-        project.generate_dist_info()
+            purelib = project.dirs.arcname(project.dirs.data_purelib)
+            writer.add_tree(project.dirs.source_src, purelib, IGNORE_SRC_PATTERNS)
 
-        # PACKAGE
-        wheel_path = project.wheel_archive()
+        project.run_build_scripts(max_workers=scripts_workers)
+        project.add_build_scripts_output(writer)
+        project.add_dist_info(writer, metadata_path)
+        wheel_path = writer.path
 
     return wheel_path.name
+
+
+def build_wheels(wheel_dir: str, settings: dict = None, platforms: list[str] = None) -> list[str]:
+    """
+    build wheels for several platforms in one pass, it isn't a PEP 517 hook
+
+    sources and files of build scripts which aren't `per_platform` are read, hashed and compressed once
+    into an archive which members are copied into every wheel as they are,
+    per-platform build scripts run once for every platform, wheels are written concurrently
+
+    Args:
+        platforms: platform tags, e.g. "manylinux_2_17_x86_64", `platforms` of [tool.toolspy] by default
+
+    Returns:
+        names of the wheels in order of platforms
+    """
+    from toolspy.project.project import Project
+    from toolspy.project.wheel import ArchiveWriter
+    from toolspy.utils import file
+    from toolspy.utils.tasks import run_graph
+
+    project = Project(Path(wheel_dir), Path())
+    platforms = list(platforms or _setting(project, settings, "platforms", []))
+    if not platforms:
+        raise ValueError("no platforms to build wheels for, set 'platforms' in [tool.toolspy]")
+    compression = _compression(project, settings)
+    scripts_workers = _setting(project, settings, "build-scripts-workers")
+    scripts_workers = int(scripts_workers) if scripts_workers else None
+
+    # files put by build scripts into `project.dirs` are staged
+    with file.temp_dir(project.dirs.wheel):
+        project.run_build_scripts(max_workers=scripts_workers, platforms=platforms)
+        with ArchiveWriter(project.dirs.wheel / "shared.zip", compression) as shared:
+            purelib = project.dirs.arcname(project.dirs.data_purelib)
+            shared.add_tree(project.dirs.source_src, purelib, IGNORE_SRC_PATTERNS)
+            project.add_build_scripts_output(shared, per_platform=False)
+
+        tasks = {
+            platform: partial(_build_platform_wheel, project.for_platform(platform), shared, compression)
+            for platform in platforms
+        }
+        graph = run_graph(tasks)
+        if graph.errors:
+            message = f"wheels failed: {', '.join(graph.errors)}"
+            raise RuntimeError(message) from next(iter(graph.errors.values()))
+
+    return [graph.results[platform] for platform in platforms]
+
+
+def _build_platform_wheel(project, shared, compression) -> str:
+    from toolspy.project.wheel import WheelWriter
+
+    with WheelWriter(project.dirs.wheel_file, project.dirs.dist_info.name, compression) as writer:
+        writer.add_archive(shared)
+        project.add_build_scripts_output(writer, per_platform=True, platform=project.platform_tag)
+        project.add_dist_info(writer)
+    return writer.path.name
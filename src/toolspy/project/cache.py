@@ -0,0 +1,261 @@
+"""
+persistent build cache
+
+the cache lives in `target/.toolspy-cache/{name_version}/{platform}/{wheel or editable}` of the project's
+source folder, not in the folder wheels are built to, and keeps
+files produced by build scripts and a copy of the last built wheel together with a manifest of
+- source files: stat and sha256, so unchanged files aren't hashed again
+- build scripts: hash of the script, its config and the platform plus files it produced,
+  so scripts run again only if something of it changed
+- wheel: hash of all members of the last built wheel, so unchanged wheel is reused
+
+so it takes about the size of the wheel and of files of build scripts for every platform and kind of wheel,
+it's off with `cache = false` in [tool.toolspy] or config_settings
+"""
+from pathlib import Path
+from typing import Any, Optional
+import hashlib
+import json
+import shutil
+import sys
+
+from toolspy.project.project import Project
+from toolspy.project.wheel import WheelWriter, walk
+from toolspy.project.editable import members as editable_members
+from toolspy.project.archive import Compression
+from toolspy.utils import file
+from toolspy.utils.tasks import topological_order
+
+MANIFEST_VERSION = 4
+
+
+class BuildCache:
+    def __init__(self, path: Path):
+        self.path = path
+        self.manifest_path = path / "manifest.json"
+        self.report_path = path / "report.json"
+        self.previous = self._load()
+        self.manifest: dict[str, Any] = {
+            "version": MANIFEST_VERSION,
+            "sources": {},
+            "scripts": {},
+            "wheel": None,
+        }
+        self.report: dict[str, dict[str, int]] = {}
+
+    def _load(self) -> dict:
+        try:
+            manifest = json.loads(self.manifest_path.read_text())
+        except (FileNotFoundError, ValueError):
+            return {}
+        if manifest.get("version") != MANIFEST_VERSION:
+            return {}
+        return manifest
+
+    def count(self, category: str, hit: bool):
+        counters = self.report.setdefault(category, {"hit": 0, "miss": 0})
+        counters["hit" if hit else "miss"] += 1
+
+    def save(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.manifest_path.write_text(json.dumps(self.manifest, indent=1))
+        self.report_path.write_text(json.dumps(self.report, indent=1))
+
+    def summary(self) -> str:
+        return "; ".join(
+            f"{category} {counters['hit']} hit, {counters['miss']} miss"
+            for category, counters in self.report.items()
+        )
+
+
+def build_wheel(
+    project: Project,
+    editable: bool,
+    ignore_patterns: tuple[str, ...],
+    compression: Compression,
+    max_workers: int = None,
+    metadata_dir: Path = None,
+    editable_mode: str = "pth",
+) -> Path:
+    """
+    build wheel of the project reusing results of previous build
+
+    files produced by build scripts are kept in `project.dirs.wheel`,
+    so the project must be created with a persistent `stage`
+
+    Args:
+        max_workers: number of build scripts running at the same time
+        metadata_dir: folder with dist-info prepared by `prepare_metadata_for_build_wheel`
+        editable_mode: how editable wheel finds project's modules, see `toolspy.project.editable`
+    """
+    cache = BuildCache(project.dirs.wheel.parent)
+    if not cache.previous:
+        # nothing is known about staged files
+        shutil.rmtree(project.dirs.wheel, ignore_errors=True)
+
+    members: dict[str, Optional[tuple[str, int]]] = {}
+    sources: list[tuple[Path, str]] = []
+    generated: dict[str, bytes] = {}
+    if editable:
+        # put link to project's src folder or the finder of its modules
+        generated = editable_members(project, editable_mode)
+        for arcname, data in generated.items():
+            members[arcname] = (file.encode_digest(hashlib.sha256(data)), len(data))
+    else:
+        sources = _check_sources(project, cache, ignore_patterns, members)
+    members.update(_run_build_scripts(project, cache, max_workers))
+
+    metadata = _metadata(project, metadata_dir)
+    cached_wheel = cache.path / project.dirs.wheel_file.name
+    previous_wheel = cache.previous.get("wheel") or {}
+    wheel_hit = (
+        None not in members.values()
+        and previous_wheel.get("key") == _wheel_key(members, metadata, compression)
+        and cached_wheel.exists()
+    )
+    cache.count("wheel", wheel_hit)
+
+    if wheel_hit:
+        shutil.copy2(cached_wheel, project.dirs.wheel_file)
+    else:
+        writer = WheelWriter(project.dirs.wheel_file, project.dirs.dist_info.name, compression)
+        with writer:
+            for arcname, data in generated.items():
+                writer.add_bytes(arcname, data)
+            for path, arcname in sources:
+                writer.add_file(path, arcname)
+            project.add_build_scripts_output(writer)
+            project.add_dist_info(writer, metadata_dir)
+        cache.path.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(project.dirs.wheel_file, cached_wheel)
+
+        # sources which weren't hashed in advance got hashed while written
+        for path, arcname in sources:
+            relative_path = path.relative_to(project.dirs.source_src).as_posix()
+            cache.manifest["sources"][relative_path][2] = writer.records[arcname][0]
+            members[arcname] = writer.records[arcname]
+    cache.manifest["wheel"] = {"key": _wheel_key(members, metadata, compression)}
+
+    cache.save()
+    print(f"toolspy cache: {cache.summary()}", file=sys.stderr)
+    return project.dirs.wheel_file
+
+
+def _wheel_key(members: dict[str, tuple[str, int]], metadata: list, compression: Compression) -> str:
+    content = [
+        sorted(members.items()),
+        metadata,
+        [compression.store, compression.level],
+    ]
+    return hashlib.sha256(json.dumps(content).encode()).hexdigest()
+
+
+def _metadata(project: Project, metadata_dir: Path = None) -> list:
+    """what dist-info of the wheel is made of, files prepared by the frontend are added instead of generated ones"""
+    prepared = metadata_dir / project.dirs.dist_info.name if metadata_dir else None
+    if prepared and prepared.is_dir():
+        return [[relative_path, file.sha256(path)] for path, relative_path in walk(prepared) if relative_path != "RECORD"]
+    return [list(project.core_metadata()), list(project.wheel_metadata())]
+
+
+def _check_sources(
+    project: Project,
+    cache: BuildCache,
+    ignore_patterns: tuple[str, ...],
+    members: dict[str, Optional[tuple[str, int]]],
+) -> list[tuple[Path, str]]:
+    """
+    collect source files and their digests without reading unchanged ones
+
+    changed files are hashed in advance only if the wheel still may be reused,
+    otherwise their digests are `None` and get known while the wheel is written
+    """
+    previous = cache.previous.get("sources", {})
+    sources = cache.manifest["sources"]
+    purelib = project.dirs.arcname(project.dirs.data_purelib)
+    files = list(walk(project.dirs.source_src, ignore_patterns))
+    stamps = {}
+    for path, relative_path in files:
+        stat = path.stat()
+        stamps[relative_path] = [stat.st_mtime_ns, stat.st_size]
+    outdated = [
+        path
+        for path, relative_path in files
+        if relative_path in previous and previous[relative_path][:2] != stamps[relative_path]
+    ]
+    digests = {}
+    if stamps.keys() == previous.keys():
+        # the wheel still may be reused if only mtime of files changed
+        digests = file.sha256_many(outdated)
+
+    result = []
+    for path, relative_path in files:
+        arcname = f"{purelib}/{relative_path}"
+        mtime, size = stamps[relative_path]
+        entry = previous.get(relative_path)
+        digest = digests.get(path)
+        if entry and entry[:2] == [mtime, size]:
+            digest = entry[2]
+        cache.count("sources", entry is not None and digest == entry[2])
+        sources[relative_path] = [mtime, size, digest]
+        members[arcname] = (digest, size) if digest else None
+        result.append((path, arcname))
+    return result
+
+
+def _run_build_scripts(project: Project, cache: BuildCache, max_workers: int = None) -> dict[str, tuple[str, int]]:
+    """run build scripts which script or config or any of their dependencies changed since previous build"""
+    previous = cache.previous.get("scripts", {})
+    scripts = cache.manifest["scripts"]
+    build_scripts = project.build_scripts or {}
+    for script_name in previous.keys() - build_scripts.keys():
+        shutil.rmtree(project.script_dirs(script_name).wheel, ignore_errors=True)
+
+    dependencies = project.script_dependencies()
+    keys = {}
+    outdated = []
+    for script_name in topological_order(dependencies):
+        script_path = project.dirs.source_tools / f"{script_name}.py"
+        if not script_path.exists():
+            raise RuntimeError(f"cannot find {script_name} in 'tools' folder")
+        keys[script_name] = hashlib.sha256(
+            json.dumps(
+                [
+                    script_name,
+                    project.platform_tag,
+                    file.sha256(script_path),
+                    build_scripts[script_name],
+                    [keys[dependency] for dependency in dependencies[script_name]],
+                ],
+                sort_keys=True,
+                default=str,
+            ).encode()
+        ).hexdigest()
+        entry = previous.get(script_name)
+        root = project.script_dirs(script_name).wheel
+        hit = (
+            entry is not None
+            and entry["key"] == keys[script_name]
+            and all((root / output).exists() for output in entry["outputs"])
+        )
+        cache.count("build scripts", hit)
+        if not hit:
+            outdated.append(script_name)
+
+    project.run_build_scripts(outdated, max_workers)
+
+    members = {}
+    for script_name in build_scripts:
+        root = project.script_dirs(script_name).wheel
+        if script_name in outdated:
+            produced = dict(walk(root))
+            digests = file.sha256_many(produced.keys())
+            outputs = {
+                relative_path: [digests[path], path.stat().st_size]
+                for path, relative_path in produced.items()
+            }
+        else:
+            outputs = previous[script_name]["outputs"]
+        scripts[script_name] = {"key": keys[script_name], "outputs": outputs}
+        members.update((output, tuple(digest_size)) for output, digest_size in outputs.items())
+    return members
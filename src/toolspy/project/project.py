@@ -1,25 +1,38 @@
-from dataclasses import dataclass
-import shutil
-from typing import Any, Callable
+from functools import partial
+from typing import Any, Iterable, TYPE_CHECKING
 from pathlib import Path
 import tomlkit
-from toolspy.utils import file
+from toolspy.utils.tasks import run_graph
 
+import copy
 import sys
+import shutil
 import importlib
+import inspect
+
+if TYPE_CHECKING:
+    from toolspy.project.wheel import WheelWriter
 
 
 BUILD_SCRIPTS_PREFIX = "tools"
+TARGET_DIR_NAME = "target"
+CACHE_DIR_NAME = ".toolspy-cache"
 
 class Directories:
-    def __init__(self, target: Path, project: "Project"):
+    def __init__(self, target: Path, project: "Project", stage: Path = None):
         # target
         self.target = target
+        # platform tag of the wheel, e.g. "any" or "manylinux_2_17_x86_64"
+        self.platform = project.platform_tag
         self.wheel_file = target / f"{project.name_version}-{project.platform}.whl"
-        self.sdist_file = target/ f"{project.name_version}.tgz"
+        self.sdist_file = target/ f"{project.name_version}.tar.gz"
+
+        # source/target/.toolspy-cache/{name_version}, in the project rather than in the target,
+        # which frontends often make temporary or share between projects
+        self.cache = project.source / TARGET_DIR_NAME / CACHE_DIR_NAME / project.name_version
 
-        # target/wheel
-        self.wheel = target / project.name_version
+        # target/wheel, or stage/wheel if wheel is staged somewhere else
+        self.wheel = (stage or target) / project.name_version
         self.wheel_src = self.wheel / "src"
         self.wheel_build_scripts = self.wheel / BUILD_SCRIPTS_PREFIX
         self.wheel_PKG_INFO = self.wheel / "PKG-INFO"
@@ -48,23 +61,32 @@ class Directories:
         self.source_src = self.source / "src"
         self.source_tools = self.source / "tools"
 
+        # directories of build scripts the script depends on by their names, see `Project.script_dirs`
+        self.dependencies: dict[str, Directories] = {}
+
+    def arcname(self, path: Path) -> str:
+        """name of the staged file inside of the wheel"""
+        return path.relative_to(self.wheel).as_posix()
+
 
 class Project:
-    def __init__(self, target: Path, source: Path):
+    def __init__(self, target: Path, source: Path, stage: Path = None, platform: str = None):
         pyproject_path = source / "pyproject.toml"
         pyproject = tomlkit.parse(pyproject_path.read_text())
 
         self.name: str = pyproject["project"]["name"]
         self.version: str = pyproject["project"]["version"]
-        self.build_scripts: dict[str, Any] = pyproject.get("tool", {}).get("toolspy", {}).get("build_scripts")
+        self.settings: dict[str, Any] = pyproject.get("tool", {}).get("toolspy", {})
+        self.build_scripts: dict[str, Any] = self.settings.get("build_scripts")
 
         norm_name = self.name.replace("-", "_")
         norm_version = self.version.replace("-", "_")
         self.name_version = f"{norm_name}-{norm_version}"
-        self.platform = "py3-none-any" # TODO: detect platform instead of hardcode
+        self.platform_tag: str = platform or self.settings.get("platform", "any")
+        self.platform = f"py3-none-{self.platform_tag}"
 
         self.source = source
-        self.dirs = Directories(target, self)
+        self.dirs = Directories(target, self, stage)
 
     def core_metadata(self):
         yield f"Metadata-Version: 2.4"
@@ -75,49 +97,185 @@ class Project:
     def wheel_metadata(self):
         yield f"Wheel-Version: 1.0"
         yield f"Generator: tools-py"
-        yield f"Root-Is-Purelib: true"
+        yield f"Root-Is-Purelib: {'true' if self.platform_tag == 'any' else 'false'}"
+        yield f"Tag: {self.platform}"
         yield f""
 
-    def records(self):
-        for path in self.dirs.wheel.rglob("*"):
-            if not path.is_file():
-                continue
-            yield f"{path.relative_to(self.dirs.wheel)},sha256={file.sha256(path)},{path.stat().st_size}"
-        yield f"{self.dirs.dist_info.name}/RECORD,,"
-        yield f""
+    def for_platform(self, platform: str) -> "Project":
+        """the same project built for another platform, staged in the same folder"""
+        project = copy.copy(self)
+        project.platform_tag = platform
+        project.platform = f"py3-none-{platform}"
+        project.dirs = Directories(self.dirs.target, project, self.dirs.wheel.parent)
+        return project
+
+    def add_dist_info(self, writer: "WheelWriter", metadata_dir: Path = None):
+        """
+        add METADATA and WHEEL, RECORD is written by the writer itself
+
+        dist-info prepared by `prepare_metadata_for_build_wheel` in `metadata_dir`
+        is added as it is, so the wheel has exactly the metadata the frontend has seen
+        """
+        from toolspy.project.wheel import walk
+
+        prepared = metadata_dir / self.dirs.dist_info.name if metadata_dir else None
+        if prepared and prepared.is_dir():
+            for path, relative_path in walk(prepared):
+                if relative_path != "RECORD":
+                    writer.add_file(path, f"{self.dirs.dist_info.name}/{relative_path}")
+            return
+
+        metadata = "\n".join(self.core_metadata())
+        wheel_metadata = "\n".join(self.wheel_metadata())
+        writer.add_bytes(self.dirs.arcname(self.dirs.dist_info_METADATA), metadata.encode())
+        writer.add_bytes(self.dirs.arcname(self.dirs.dist_info_WHEEL), wheel_metadata.encode())
+
+
+    def script_dirs(self, script_name: str, platform: str = None) -> Directories:
+        """
+        directories of the build script
 
+        every script stages its files separately,
+        so scripts running concurrently don't interfere
+        and the wheel is assembled in the same order regardless of timing.
+        A per-platform script run for another platform has its own folder too.
+        Files of scripts it depends on are in `dependencies`, e.g.
+        `dirs.dependencies["download"].wheel`, these scripts are done before it runs
+        """
+        dirs = self._script_stage(script_name, platform)
+        for dependency in self.script_dependencies().get(script_name, []):
+            dependency_platform = platform if platform and self.is_per_platform(dependency) else None
+            dirs.dependencies[dependency] = self._script_stage(dependency, dependency_platform)
+        return dirs
 
-    def generate_dist_info(self):
-        file.from_iterable(self.dirs.dist_info_METADATA, self.core_metadata())
-        file.from_iterable(self.dirs.dist_info_WHEEL, self.wheel_metadata())
-        file.from_iterable(self.dirs.dist_info_RECORD, self.records())
+    def _script_stage(self, script_name: str, platform: str = None) -> Directories:
+        stage = self.dirs.wheel / BUILD_SCRIPTS_PREFIX / script_name
+        if platform is None:
+            return Directories(self.dirs.target, self, stage)
+        project = self.for_platform(platform)
+        return Directories(self.dirs.target, project, stage / platform)
 
+    def is_per_platform(self, script_name: str) -> bool:
+        """script produces files of a platform, declared by its `per_platform` option"""
+        script_config = (self.build_scripts or {})[script_name]
+        return isinstance(script_config, dict) and bool(script_config.get("per_platform", False))
 
-    def wheel_archive(self):
-        path_without_ext: Callable[[Path], Path] = lambda path: path.with_suffix("")
-        archive_name = shutil.make_archive(
-            str(path_without_ext(self.dirs.wheel_file)),
-            format="zip",
-            root_dir=self.dirs.wheel
-        )
-        wheel_file = shutil.move(
-            src=archive_name,
-            dst=self.dirs.wheel_file,
-        )
-        return wheel_file
 
+    def script_dependencies(self) -> dict[str, list[str]]:
+        """scripts which every script depends on, declared by its `depends_on` option"""
+        dependencies = {}
+        for script_name, script_config in (self.build_scripts or {}).items():
+            depends_on = []
+            if isinstance(script_config, dict):
+                depends_on = list(script_config.get("depends_on", []))
+            unknown = set(depends_on) - (self.build_scripts or {}).keys()
+            if unknown:
+                unknown_names = ", ".join(sorted(unknown))
+                raise RuntimeError(f"build script {script_name} depends on unknown scripts: {unknown_names}")
+            dependencies[script_name] = depends_on
+        return dependencies
 
-    def run_build_scripts(self):
-        if not self.build_scripts:
+
+    def run_build_scripts(
+        self,
+        script_names: Iterable[str] = None,
+        max_workers: int = None,
+        platforms: Iterable[str] = None,
+    ):
+        """
+        run build scripts, independent scripts run concurrently
+
+        a script runs in a thread or, if its `executor` option is "process", in a process pool.
+        Scripts depending on a failed one don't run.
+
+        Args:
+            script_names: scripts to run, all by default,
+                they may depend on other scripts which are considered done
+            max_workers: number of scripts running at the same time
+            platforms: run per-platform scripts once for every platform, see `script_dirs`,
+                other scripts run once for all of them
+        """
+        build_scripts = self.build_scripts or {}
+        script_names = list(build_scripts if script_names is None else script_names)
+        if not script_names:
             return
 
-        src_path = self.dirs.source.absolute()
-        # trg_path = self.dirs.target.absolute()
+        tasks = {}
+        process_tasks = []
+        for script_name in script_names:
+            script_config = build_scripts[script_name]
+            script_platforms = [None]
+            if platforms is not None and self.is_per_platform(script_name):
+                script_platforms = list(platforms)
+            for platform in script_platforms:
+                key = _script_key(script_name, platform)
+                dirs = self.script_dirs(script_name, platform)
+                shutil.rmtree(dirs.wheel, ignore_errors=True)
+                dirs.wheel.mkdir(parents=True)
+                if isinstance(script_config, dict) and script_config.get("executor") == "process":
+                    process_tasks.append(key)
+                tasks[key] = partial(
+                    run_build_script,
+                    self.dirs.source.absolute(),
+                    script_name,
+                    _plain(script_config),
+                    dirs,
+                )
+        dependencies = self._script_task_dependencies(tasks, platforms)
+
+        graph = run_graph(tasks, dependencies, max_workers, process_tasks)
+        for key in tasks:
+            if key in graph.durations:
+                print(f"build script {key}: {graph.durations[key]:.2f}s", file=sys.stderr)
+        if graph.errors:
+            message = f"build scripts failed: {', '.join(graph.errors)}"
+            if graph.skipped:
+                message += f", not run: {', '.join(graph.skipped)}"
+            raise RuntimeError(message) from next(iter(graph.errors.values()))
 
-        sys.path.insert(0, str(src_path))
-        for script_name, script_config in self.build_scripts.items():
-            module = importlib.import_module(f"{BUILD_SCRIPTS_PREFIX}.{script_name}")
-            module.run(self.dirs, script_config)
+    def _script_task_dependencies(self, tasks: dict, platforms: Iterable[str] = None) -> dict[str, list[str]]:
+        """
+        dependencies between script runs,
+        a per-platform script run depends on runs of its dependencies for the same platform
+        """
+        script_dependencies = self.script_dependencies()
+        dependencies = {}
+        for script_name, depends_on in script_dependencies.items():
+            script_platforms = [None]
+            if platforms is not None and self.is_per_platform(script_name):
+                script_platforms = list(platforms)
+            for platform in script_platforms:
+                key = _script_key(script_name, platform)
+                if key not in tasks:
+                    continue
+                dependencies[key] = []
+                for dependency in depends_on:
+                    if platforms is not None and self.is_per_platform(dependency):
+                        if platform is None:
+                            raise RuntimeError(
+                                f"build script {script_name} runs once for all platforms,"
+                                f" it cannot depend on per-platform script {dependency}"
+                            )
+                        dependency_key = _script_key(dependency, platform)
+                    else:
+                        dependency_key = dependency
+                    if dependency_key in tasks:
+                        dependencies[key].append(dependency_key)
+        return dependencies
+
+
+    def add_build_scripts_output(self, writer: "WheelWriter", per_platform: bool = None, platform: str = None):
+        """
+        Args:
+            per_platform: add output of per-platform (True) or other (False) scripts only, all by default
+            platform: add output of per-platform scripts run for this platform
+        """
+        for script_name in self.build_scripts or {}:
+            script_per_platform = self.is_per_platform(script_name)
+            if per_platform is not None and script_per_platform != per_platform:
+                continue
+            script_platform = platform if script_per_platform else None
+            writer.add_tree(self.script_dirs(script_name, script_platform).wheel)
 
 
     # def __init__(self, target: Path, project: Project):
@@ -125,3 +283,35 @@ class Project:
     #     self.work = target / project.name_version
     #     self.data = self.work / f"{project.name_version}.data"
     #     self.dist_info = self.work / f"{project.name_version}.dist-info"
+
+
+def run_build_script(source: Path, script_name: str, script_config: Any, dirs: Directories):
+    """
+    run `tools/{script_name}.py`
+
+    the script's `run(dirs, config)` puts files into `dirs`, see `Project.script_dirs`.
+    Sources of the project aren't staged, the script reads them from `dirs.source_src`.
+    A script which defines `run(dirs, config, writer)` may also add members
+    with `writer.add_file(path, arcname)` and `writer.add_bytes(arcname, data)`
+    """
+    from toolspy.project.wheel import DirectoryWriter
+
+    src_path = str(source)
+    if src_path not in sys.path:
+        sys.path.insert(0, src_path)
+    module = importlib.import_module(f"{BUILD_SCRIPTS_PREFIX}.{script_name}")
+    if "writer" in inspect.signature(module.run).parameters:
+        module.run(dirs, script_config, writer=DirectoryWriter(dirs.wheel))
+    else:
+        module.run(dirs, script_config)
+
+
+def _script_key(script_name: str, platform: str = None) -> str:
+    return f"{script_name}[{platform}]" if platform else script_name
+
+
+def _plain(value: Any) -> Any:
+    """tomlkit item as plain python value, so it can be passed to another process"""
+    if hasattr(value, "unwrap"):
+        return value.unwrap()
+    return value
@@ -0,0 +1,71 @@
+"""
+sdist writer
+
+members are streamed straight from the source tree into the tar.gz,
+they are sorted and have fixed owner and mtime, so the same sources give the same sdist
+"""
+from pathlib import Path
+import io
+import os
+import tarfile
+
+from toolspy.project.archive import GzipFile, Compression
+from toolspy.project.wheel import walk
+
+# any fixed time makes sdist reproducible, SOURCE_DATE_EPOCH overrides it
+DEFAULT_MTIME = 1580601600  # 2020-02-02
+
+
+class SdistWriter:
+    def __init__(self, path: Path, root: str, compression: Compression = None):
+        """
+        Args:
+            path: sdist file
+            root: top folder of all members, `{name_version}`
+        """
+        self.path = path
+        self.root = root
+        self.mtime = int(os.environ.get("SOURCE_DATE_EPOCH", DEFAULT_MTIME))
+        self._part_path = path.with_name(f"{path.name}.part")
+        self._part_path.parent.mkdir(parents=True, exist_ok=True)
+        self._gzip = GzipFile(self._part_path, compression or Compression())
+        self._tar = tarfile.open(fileobj=self._gzip, mode="w|", format=tarfile.PAX_FORMAT)
+
+    def __enter__(self) -> "SdistWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._tar.close()
+            self._gzip.close()
+            self._part_path.unlink(missing_ok=True)
+
+    def add_file(self, path: Path, arcname: str):
+        tarinfo = self._tarinfo(arcname, path.stat().st_size)
+        if os.access(path, os.X_OK):
+            tarinfo.mode = 0o755
+        with path.open("rb") as source:
+            self._tar.addfile(tarinfo, source)
+
+    def add_bytes(self, arcname: str, data: bytes):
+        self._tar.addfile(self._tarinfo(arcname, len(data)), io.BytesIO(data))
+
+    def add_tree(self, root: Path, arcname: str = "", ignore_patterns: tuple[str, ...] = ()):
+        for path, relative_path in walk(root, ignore_patterns):
+            self.add_file(path, f"{arcname}/{relative_path}" if arcname else relative_path)
+
+    def close(self):
+        self._tar.close()
+        self._gzip.close()
+        os.replace(self._part_path, self.path)
+
+    def _tarinfo(self, arcname: str, size: int) -> tarfile.TarInfo:
+        tarinfo = tarfile.TarInfo(f"{self.root}/{arcname}")
+        tarinfo.size = size
+        tarinfo.mtime = self.mtime
+        tarinfo.mode = 0o644
+        tarinfo.uid = tarinfo.gid = 0
+        tarinfo.uname = tarinfo.gname = ""
+        return tarinfo
@@ -0,0 +1,162 @@
+"""
+wheel writers
+
+`WheelWriter` streams every member straight into the wheel archive
+hashing it on the way, so building a wheel costs a single read of its files.
+`ArchiveWriter` does the same without RECORD, its members are copied into several wheels as they are.
+`DirectoryWriter` has the same API but puts members into a folder,
+which allows build scripts to stage files without knowing where they go.
+"""
+from pathlib import Path
+from fnmatch import fnmatch
+from collections.abc import Iterable, Iterator
+import hashlib
+import os
+import shutil
+import time
+import zipfile
+
+from toolspy.project.archive import ZipArchive, Compression, read_chunks, CHUNK_SIZE
+from toolspy.utils import file
+
+
+class ArchiveWriter:
+    """zip archive of wheel members which keeps their digests and sizes in `records`"""
+
+    def __init__(self, path: Path, compression: Compression = None):
+        self.path = path
+        self.records: dict[str, tuple[str, int]] = {}
+        self._part_path = path.with_name(f"{path.name}.part")
+        self._part_path.parent.mkdir(parents=True, exist_ok=True)
+        self._archive = ZipArchive(self._part_path, compression or Compression())
+        # archives which members are copied, they are read until this one is closed
+        self._sources: list[zipfile.ZipFile] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._close_archive()
+            self._part_path.unlink(missing_ok=True)
+
+    def add_file(self, path: Path, arcname: str):
+        self._check_arcname(arcname)
+        zinfo = zipfile.ZipInfo.from_file(path, arcname)
+        sha = hashlib.sha256()
+        self._archive.add(zinfo, _hashing(read_chunks(path), sha))
+        self.records[arcname] = (file.encode_digest(sha), zinfo.file_size)
+
+    def add_bytes(self, arcname: str, data: bytes):
+        self._check_arcname(arcname)
+        self._add_bytes(arcname, data)
+        self.records[arcname] = (file.encode_digest(hashlib.sha256(data)), len(data))
+
+    def _add_bytes(self, arcname: str, data: bytes):
+        zinfo = zipfile.ZipInfo(arcname, time.localtime()[:6])
+        zinfo.external_attr = 0o644 << 16
+        zinfo.file_size = len(data)
+        chunks = (data[start:start + CHUNK_SIZE] for start in range(0, len(data), CHUNK_SIZE))
+        self._archive.add(zinfo, chunks)
+
+    def add_tree(self, root: Path, arcname: str = "", ignore_patterns: tuple[str, ...] = ()):
+        for path, relative_path in walk(root, ignore_patterns):
+            self.add_file(path, _join(arcname, relative_path))
+
+    def add_archive(self, archive: "ArchiveWriter"):
+        """
+        add all members of a closed archive without compressing them again,
+        so members shared by several wheels are read, hashed and compressed once
+        """
+        for arcname in archive.records:
+            self._check_arcname(arcname)
+        source = zipfile.ZipFile(archive.path)
+        self._sources.append(source)
+        for arcname, record in archive.records.items():
+            self._archive.add_raw(source, arcname)
+            self.records[arcname] = record
+
+    def close(self):
+        self._close_archive()
+        os.replace(self._part_path, self.path)
+
+    def _close_archive(self):
+        try:
+            self._archive.close()
+        finally:
+            for source in self._sources:
+                source.close()
+
+    def _check_arcname(self, arcname: str):
+        if arcname in self.records:
+            raise ValueError(f"'{arcname}' is already added to {self.path.name}")
+
+
+class WheelWriter(ArchiveWriter):
+    def __init__(self, path: Path, dist_info: str, compression: Compression = None):
+        super().__init__(path, compression)
+        self.record_arcname = f"{dist_info}/RECORD"
+
+    def __enter__(self) -> "WheelWriter":
+        return self
+
+    def close(self):
+        file_records = (
+            f"{arcname},sha256={digest},{size}"
+            for arcname, (digest, size) in self.records.items()
+        )
+        record = "\n".join([*file_records, f"{self.record_arcname},,", ""])
+        self._add_bytes(self.record_arcname, record.encode())
+        super().close()
+
+    def _check_arcname(self, arcname: str):
+        if arcname == self.record_arcname:
+            raise ValueError(f"'{arcname}' is already added to {self.path.name}")
+        super()._check_arcname(arcname)
+
+
+class DirectoryWriter:
+    def __init__(self, root: Path):
+        self.root = root
+
+    def add_file(self, path: Path, arcname: str):
+        target = self.root / arcname
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(path, target)
+
+    def add_bytes(self, arcname: str, data: bytes):
+        target = self.root / arcname
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(data)
+
+    def add_tree(self, root: Path, arcname: str = "", ignore_patterns: tuple[str, ...] = ()):
+        for path, relative_path in walk(root, ignore_patterns):
+            self.add_file(path, _join(arcname, relative_path))
+
+
+def walk(root: Path, ignore_patterns: tuple[str, ...] = ()) -> Iterable[tuple[Path, str]]:
+    """files of the tree in stable order together with their posix relative paths"""
+    if not root.exists():
+        return
+    for path in sorted(root.rglob("*")):
+        relative_path = path.relative_to(root)
+        if any(
+            fnmatch(part, pattern)
+            for part in relative_path.parts
+            for pattern in ignore_patterns
+        ):
+            continue
+        if path.is_file():
+            yield path, relative_path.as_posix()
+
+
+def _hashing(chunks: Iterable[bytes], sha) -> Iterator[bytes]:
+    for chunk in chunks:
+        sha.update(chunk)
+        yield chunk
+
+
+def _join(arcname: str, relative_path: str) -> str:
+    return f"{arcname}/{relative_path}" if arcname else relative_path
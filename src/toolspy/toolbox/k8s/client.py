@@ -0,0 +1,647 @@
+"""
+in-process client of the Kubernetes API
+
+reads a kubeconfig the way kubectl does and keeps a pooled HTTPS connection per cluster,
+so a command costs a request instead of a kubectl process with its own TLS handshake and discovery:
+
+    client = K8sConfig.find("prod").client()
+    services = client.list("services", namespace="default")["items"]
+    client.apply(manifests, namespace="default")
+    for event in client.watch("endpoints", namespace="default"):
+        ...
+
+resources are named by their plural like in kubectl, optionally with the group (`deployments.apps`).
+Reads made with `cache=True` are taken from the command cache like outputs of `Env.run(..., cache=True)`,
+any change made by the client invalidates it, see `toolspy.utils.process.cache`
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Iterable, Iterator, List, Optional, Union
+import base64
+import hashlib
+import json
+import os
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+import logging
+
+import httpx
+
+from toolspy.toolbox.k8s import labels
+from toolspy.utils.parsing import load_json, load_yaml, load_yaml_all
+from toolspy.utils.process.cache import CommandCache, DEFAULT_CACHE
+
+log = logging.getLogger(__name__)
+
+DEFAULT_KUBECONFIG = Path("~/.kube/config")
+FIELD_MANAGER = "toolspy"
+
+# selector, its text or labels which must match
+LabelSelector = Union[labels.Selector, str, dict, None]
+
+
+@dataclass(frozen=True)
+class Resource:
+    """
+    Args:
+        name: plural name, e.g. "deployments"
+        kind: kind of objects, e.g. "Deployment"
+        group_version: "v1" for the core group, "apps/v1" otherwise
+    """
+    name: str
+    kind: str
+    group_version: str
+    namespaced: bool
+
+    @property
+    def group(self) -> str:
+        return self.group_version.rpartition("/")[0]
+
+    def path(self, namespace: str = None, name: str = None) -> str:
+        prefix = "/api" if "/" not in self.group_version else "/apis"
+        path = f"{prefix}/{self.group_version}"
+        if self.namespaced and namespace:
+            path += f"/namespaces/{namespace}"
+        path += f"/{self.name}"
+        if name:
+            path += f"/{name}"
+        return path
+
+
+# resources used by the toolbox, others are discovered on the first use
+BUILTIN_RESOURCES = [
+    Resource("configmaps", "ConfigMap", "v1", True),
+    Resource("endpoints", "Endpoints", "v1", True),
+    Resource("events", "Event", "v1", True),
+    Resource("namespaces", "Namespace", "v1", False),
+    Resource("nodes", "Node", "v1", False),
+    Resource("persistentvolumeclaims", "PersistentVolumeClaim", "v1", True),
+    Resource("pods", "Pod", "v1", True),
+    Resource("secrets", "Secret", "v1", True),
+    Resource("serviceaccounts", "ServiceAccount", "v1", True),
+    Resource("services", "Service", "v1", True),
+    Resource("daemonsets", "DaemonSet", "apps/v1", True),
+    Resource("deployments", "Deployment", "apps/v1", True),
+    Resource("replicasets", "ReplicaSet", "apps/v1", True),
+    Resource("statefulsets", "StatefulSet", "apps/v1", True),
+    Resource("endpointslices", "EndpointSlice", "discovery.k8s.io/v1", True),
+    Resource("jobs", "Job", "batch/v1", True),
+    Resource("cronjobs", "CronJob", "batch/v1", True),
+    Resource("ingresses", "Ingress", "networking.k8s.io/v1", True),
+]
+
+
+class ApiError(RuntimeError):
+    """
+    error response of the API server
+
+    Args:
+        status: HTTP status, e.g. 404 if the object doesn't exist, 410 if a watch has expired
+        reason: reason of the Status object, e.g. "NotFound"
+    """
+
+    def __init__(self, status: int, reason: str, message: str, body: Any = None):
+        super().__init__(f"{status} {reason}: {message}")
+        self.status = status
+        self.reason = reason
+        self.body = body
+
+    @classmethod
+    def from_status(cls, status: dict) -> "ApiError":
+        return cls(status.get("code", 0), status.get("reason", ""), status.get("message", ""), status)
+
+    @classmethod
+    def from_response(cls, response: httpx.Response) -> "ApiError":
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        if isinstance(body, dict) and body.get("kind") == "Status":
+            return cls(response.status_code, body.get("reason", ""), body.get("message", ""), body)
+        return cls(response.status_code, response.reason_phrase, response.text[:1000], body)
+
+
+@dataclass
+class ClusterConfig:
+    """
+    connection settings of a context of a kubeconfig
+
+    Args:
+        server: URL of the API server
+        namespace: namespace of the context, "default" if it has none
+        ca_data, cert_data, key_data: PEM data of CA, client certificate and key
+        token: bearer token, `token_file` or `exec` take precedence, they are read on every refresh
+        exec: ExecConfig of the user, a credential plugin like `aws eks get-token`
+    """
+    server: str
+    namespace: str = "default"
+    insecure: bool = False
+    ca_data: Optional[bytes] = None
+    cert_data: Optional[bytes] = None
+    key_data: Optional[bytes] = None
+    token: Optional[str] = None
+    token_file: Optional[Path] = None
+    username: Optional[str] = None
+    password: Optional[str] = None
+    exec: Optional[dict] = None
+    tls_server_name: Optional[str] = None
+
+    @classmethod
+    def from_kubeconfig(cls, paths: Union[Path, Iterable[Path]] = None, context: str = None) -> "ClusterConfig":
+        """
+        Args:
+            paths: kubeconfig files which are merged like in KUBECONFIG, from KUBECONFIG or ~/.kube/config by default
+            context: current context by default
+        """
+        if paths is None:
+            paths = default_kubeconfig_paths()
+        elif isinstance(paths, (str, Path)):
+            paths = [Path(paths)]
+        config = _merge_kubeconfigs(paths)
+
+        context_name = context or config["current-context"]
+        if not context_name:
+            raise RuntimeError(f"kubeconfig {_names(paths)} has no current context")
+        context_entry = config["contexts"].get(context_name)
+        if context_entry is None:
+            raise RuntimeError(f"kubeconfig {_names(paths)} has no context '{context_name}'")
+        cluster, cluster_dir = config["clusters"].get(context_entry.get("cluster"), (None, None))
+        if cluster is None:
+            raise RuntimeError(f"kubeconfig {_names(paths)} has no cluster of context '{context_name}'")
+        user, user_dir = config["users"].get(context_entry.get("user"), ({}, cluster_dir))
+
+        return cls(
+            server=cluster["server"].rstrip("/"),
+            namespace=context_entry.get("namespace") or "default",
+            insecure=bool(cluster.get("insecure-skip-tls-verify")),
+            ca_data=_pem(cluster, "certificate-authority", cluster_dir),
+            cert_data=_pem(user, "client-certificate", user_dir),
+            key_data=_pem(user, "client-key", user_dir),
+            token=user.get("token"),
+            token_file=_path(user.get("tokenFile"), user_dir),
+            username=user.get("username"),
+            password=user.get("password"),
+            exec=user.get("exec"),
+            tls_server_name=cluster.get("tls-server-name"),
+        )
+
+    def ssl_context(self) -> ssl.SSLContext:
+        context = ssl.create_default_context(cadata=self.ca_data.decode() if self.ca_data else None)
+        if self.insecure:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        if self.cert_data and self.key_data:
+            # ssl loads client certificates only from files
+            with tempfile.TemporaryDirectory() as folder:
+                cert_path, key_path = Path(folder) / "cert.pem", Path(folder) / "key.pem"
+                for path, data in ((cert_path, self.cert_data), (key_path, self.key_data)):
+                    path.touch(mode=0o600)
+                    path.write_bytes(data)
+                context.load_cert_chain(cert_path, key_path)
+        return context
+
+
+def default_kubeconfig_paths() -> list[Path]:
+    kubeconfig = os.environ.get("KUBECONFIG")
+    if kubeconfig:
+        return [Path(path).expanduser() for path in kubeconfig.split(os.pathsep) if path]
+    return [DEFAULT_KUBECONFIG.expanduser()]
+
+
+def _names(paths: Iterable[Path]) -> str:
+    return ", ".join(str(path) for path in paths)
+
+
+def _merge_kubeconfigs(paths: Iterable[Path]) -> dict:
+    """entries of every name and the current context are taken from the first file which has them"""
+    merged = {"current-context": None, "clusters": {}, "contexts": {}, "users": {}}
+    for path in paths:
+        path = Path(path)
+        if not path.exists():
+            continue
+        config = load_yaml(path.read_text()) or {}
+        merged["current-context"] = merged["current-context"] or config.get("current-context")
+        for section, key in (("clusters", "cluster"), ("users", "user")):
+            for entry in config.get(section) or []:
+                merged[section].setdefault(entry["name"], (entry.get(key) or {}, path.parent))
+        for entry in config.get("contexts") or []:
+            merged["contexts"].setdefault(entry["name"], entry.get("context") or {})
+    return merged
+
+
+def _path(value: Optional[str], folder: Path) -> Optional[Path]:
+    # relative paths of a kubeconfig are relative to its folder
+    return None if not value else folder / Path(value).expanduser()
+
+
+def _pem(entry: dict, key: str, folder: Path) -> Optional[bytes]:
+    if entry.get(f"{key}-data"):
+        return base64.b64decode(entry[f"{key}-data"])
+    path = _path(entry.get(key), folder)
+    return path.read_bytes() if path else None
+
+
+class _Auth(httpx.Auth):
+    """bearer token of the user, it's taken again once the server rejects it"""
+
+    def __init__(self, config: ClusterConfig):
+        self._config = config
+        self._lock = threading.Lock()
+        self._token: Optional[str] = None
+        self._expires: Optional[float] = None
+
+    def auth_flow(self, request: httpx.Request):
+        token = self.token()
+        if token:
+            request.headers["Authorization"] = f"Bearer {token}"
+        elif self._config.username is not None:
+            credentials = f"{self._config.username}:{self._config.password or ''}".encode()
+            request.headers["Authorization"] = f"Basic {base64.b64encode(credentials).decode()}"
+        response = yield request
+        if response.status_code == 401 and (self._config.exec or self._config.token_file):
+            request.headers["Authorization"] = f"Bearer {self.token(refresh=True)}"
+            yield request
+
+    def token(self, refresh=False) -> Optional[str]:
+        with self._lock:
+            expired = self._expires is not None and self._expires < time.time()
+            if self._token is None or refresh or expired:
+                self._token, self._expires = self._load()
+            return self._token
+
+    def _load(self) -> tuple[Optional[str], Optional[float]]:
+        config = self._config
+        if config.exec:
+            return _exec_credential(config.exec)
+        if config.token_file:
+            # projected service account tokens are rotated, so the file is read again
+            return config.token_file.read_text().strip(), time.time() + 60
+        return config.token, None
+
+
+def _exec_credential(exec_config: dict) -> tuple[str, Optional[float]]:
+    """token of a client-go credential plugin and its unix expiration time"""
+    env = dict(os.environ)
+    for entry in exec_config.get("env") or []:
+        env[entry["name"]] = entry["value"]
+    cmd = [exec_config["command"], *(exec_config.get("args") or [])]
+    output = subprocess.run(cmd, env=env, check=True, capture_output=True, text=True).stdout
+    status = json.loads(output).get("status", {})
+    if "token" not in status:
+        raise RuntimeError(f"credential plugin '{exec_config['command']}' gave no token")
+    expires = None
+    if status.get("expirationTimestamp"):
+        expires = datetime.fromisoformat(status["expirationTimestamp"].replace("Z", "+00:00")).timestamp()
+        # refreshed a bit before it expires
+        expires -= 30
+    return status["token"], expires
+
+
+class K8sClient:
+    """
+    client of a single cluster, it's safe to use from several threads
+
+    objects are returned as parsed JSON, errors are raised as `ApiError`
+    """
+
+    def __init__(self, config: ClusterConfig, timeout: float = 30, max_connections: int = 16):
+        self.config = config
+        self.namespace = config.namespace
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        extensions = {}
+        if config.tls_server_name:
+            extensions["sni_hostname"] = config.tls_server_name
+        self._http = httpx.Client(
+            base_url=config.server,
+            verify=config.ssl_context(),
+            auth=_Auth(config),
+            timeout=timeout,
+            limits=limits,
+            headers={"Accept": "application/json", "User-Agent": "toolspy"},
+        )
+        self._extensions = extensions
+        self._resources: dict[str, Resource] = {}
+        self._discovered = False
+        self._lock = threading.Lock()
+        # responses of reads made with `cache=True` are reused, off unless set
+        self.cache: Optional[CommandCache] = DEFAULT_CACHE
+        for resource in BUILTIN_RESOURCES:
+            self._add_resource(resource)
+
+    @classmethod
+    def from_kubeconfig(cls, path: Path = None, context: str = None, **kwargs) -> "K8sClient":
+        """new client, see `client` for a pooled one"""
+        paths = None if path is None else [Path(path)]
+        return cls(ClusterConfig.from_kubeconfig(paths, context), **kwargs)
+
+    def __enter__(self) -> "K8sClient":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._http.close()
+
+    def request(self, method: str, path: str, **kwargs) -> Any:
+        """parsed JSON of the response to a request of any API path"""
+        response = self._http.request(method, path, extensions=self._extensions, **kwargs)
+        if response.is_error:
+            raise ApiError.from_response(response)
+        return response.json() if response.content else None
+
+    def _read(self, path: str, cache: bool, **kwargs) -> Any:
+        """GET of the path, its response is taken from `self.cache` if `cache` is set"""
+        if self.cache is None or not cache:
+            return self.request("GET", path, **kwargs)
+        content = json.dumps([self.config.server, path, kwargs], sort_keys=True, default=str)
+        key = hashlib.sha256(content.encode()).hexdigest()
+        text = self.cache.get(key)
+        if text is not None:
+            log.debug(f"cached: GET {path}")
+            return load_json(text)
+        result = self.request("GET", path, **kwargs)
+        self.cache.put(key, json.dumps(result))
+        return result
+
+    def _changed(self):
+        """the client changed objects, cached reads may describe the old state"""
+        if self.cache is not None:
+            self.cache.invalidate()
+
+    def version(self, timeout: float = None) -> dict:
+        kwargs = {} if timeout is None else {"timeout": timeout}
+        return self.request("GET", "/version", **kwargs)
+
+    def resource(self, name: str) -> Resource:
+        """
+        resource by its plural, singular or kind, optionally qualified with the group like "deployments.apps"
+
+        Raises:
+            KeyError: if the cluster has no such resource
+        """
+        key = name.lower()
+        with self._lock:
+            if key not in self._resources and not self._discovered:
+                self._discover()
+            try:
+                return self._resources[key]
+            except KeyError:
+                raise KeyError(f"the server doesn't have a resource type '{name}'") from None
+
+    def resource_of(self, api_version: str, kind: str) -> Resource:
+        """resource of objects of the kind, e.g. of a manifest"""
+        group = api_version.rpartition("/")[0]
+        name = f"{kind}.{group}" if group else kind
+        resource = self.resource(name)
+        if resource.group_version != api_version:
+            resource = Resource(resource.name, resource.kind, api_version, resource.namespaced)
+        return resource
+
+    def _add_resource(self, resource: Resource):
+        names = [resource.name, resource.kind.lower()]
+        for name in names:
+            if resource.group:
+                self._resources.setdefault(f"{name}.{resource.group}", resource)
+            # the core group and groups found first win for unqualified names, like in kubectl
+            self._resources.setdefault(name, resource)
+
+    def _discover(self):
+        self._discovered = True
+        group_versions = self.request("GET", "/api").get("versions", [])
+        for group in self.request("GET", "/apis").get("groups", []):
+            group_versions.append(group["preferredVersion"]["groupVersion"])
+        for group_version in group_versions:
+            prefix = "/api" if "/" not in group_version else "/apis"
+            try:
+                resources = self.request("GET", f"{prefix}/{group_version}")["resources"]
+            except ApiError as e:
+                # e.g. an unavailable aggregated API
+                log.debug(f"discovery of {group_version} failed: {e}")
+                continue
+            for resource in resources:
+                if "/" in resource["name"]:
+                    # subresources like pods/log
+                    continue
+                self._add_resource(
+                    Resource(resource["name"], resource["kind"], group_version, resource["namespaced"])
+                )
+
+    def _namespace(self, resource: Resource, namespace: Optional[str]) -> Optional[str]:
+        if not resource.namespaced:
+            return None
+        return namespace or self.namespace
+
+    def get(self, resource: str, name: str, namespace: str = None, cache=False) -> dict:
+        """
+        Args:
+            cache: the read may be served from `self.cache`
+        """
+        resource = self.resource(resource)
+        return self._read(resource.path(self._namespace(resource, namespace), name), cache)
+
+    def list(
+        self,
+        resource: str,
+        namespace: str = None,
+        all_namespaces=False,
+        label_selector: LabelSelector = None,
+        field_selector: str = None,
+        limit: int = None,
+        cache=False,
+    ) -> dict:
+        """
+        list object of the resource, its `items` are objects of all pages
+
+        Args:
+            namespace: namespace of the context by default
+            limit: objects per page, the whole list is returned in a single page by default
+            cache: the list may be served from `self.cache`
+        """
+        resource = self.resource(resource)
+        path = resource.path(None if all_namespaces else self._namespace(resource, namespace))
+        params = _params(labelSelector=labels.to_query(label_selector), fieldSelector=field_selector, limit=limit)
+        result = self._read(path, cache, params=params)
+        while result.get("metadata", {}).get("continue"):
+            page = self._read(path, cache, params={**params, "continue": result["metadata"]["continue"]})
+            result["items"] += page["items"]
+            result["metadata"] = page["metadata"]
+        return result
+
+    def list_metadata(
+        self,
+        resource: str,
+        namespace: str = None,
+        all_namespaces=False,
+        label_selector: LabelSelector = None,
+        cache=False,
+    ) -> dict:
+        """
+        list of objects of the resource with their metadata only, e.g. to compare their annotations
+
+        the server sends PartialObjectMetadataList, so the size of the objects doesn't matter
+        """
+        resource = self.resource(resource)
+        path = resource.path(None if all_namespaces else self._namespace(resource, namespace))
+        return self._read(
+            path,
+            cache,
+            params=_params(labelSelector=labels.to_query(label_selector)),
+            headers={"Accept": "application/json;as=PartialObjectMetadataList;v=v1;g=meta.k8s.io,application/json"},
+        )
+
+    def patch(
+        self,
+        resource: str,
+        name: str,
+        patch: Union[dict, list],
+        namespace: str = None,
+        patch_type: str = "merge",
+    ) -> dict:
+        """
+        Args:
+            patch_type: "merge", "strategic" or "json"
+        """
+        content_types = {
+            "merge": "application/merge-patch+json",
+            "strategic": "application/strategic-merge-patch+json",
+            "json": "application/json-patch+json",
+        }
+        resource = self.resource(resource)
+        try:
+            return self.request(
+                "PATCH",
+                resource.path(self._namespace(resource, namespace), name),
+                content=json.dumps(patch),
+                headers={"Content-Type": content_types[patch_type]},
+            )
+        finally:
+            self._changed()
+
+    def delete(self, resource: str, name: str, namespace: str = None) -> dict:
+        resource = self.resource(resource)
+        try:
+            return self.request("DELETE", resource.path(self._namespace(resource, namespace), name))
+        finally:
+            self._changed()
+
+    def apply(
+        self,
+        manifests: Union[str, dict, Iterable[dict]],
+        namespace: str = None,
+        field_manager: str = FIELD_MANAGER,
+        force=True,
+    ) -> List[dict]:
+        """
+        server-side apply of objects, like `kubectl apply --server-side`
+
+        Args:
+            manifests: objects or their YAML, documents of YAML are separated by `---`
+            namespace: namespace of objects which have none
+            force: take over fields which are managed by other managers, e.g. by kubectl client-side apply
+        """
+        if isinstance(manifests, str):
+            manifests = [manifest for manifest in load_yaml_all(manifests) if manifest]
+        elif isinstance(manifests, dict):
+            manifests = [manifests]
+        params = _params(fieldManager=field_manager, force="true" if force else None)
+
+        applied = []
+        try:
+            for manifest in manifests:
+                if manifest.get("kind", "").endswith("List") and "items" in manifest:
+                    applied += self.apply(manifest["items"], namespace, field_manager, force)
+                    continue
+                resource = self.resource_of(manifest["apiVersion"], manifest["kind"])
+                metadata = manifest["metadata"]
+                path = resource.path(self._namespace(resource, metadata.get("namespace") or namespace), metadata["name"])
+                applied.append(self.request(
+                    "PATCH",
+                    path,
+                    params=params,
+                    # JSON is YAML, so it's accepted as an apply patch
+                    content=json.dumps(manifest),
+                    headers={"Content-Type": "application/apply-patch+yaml"},
+                ))
+        finally:
+            # objects applied before a failure are changed too
+            self._changed()
+        return applied
+
+    def watch(
+        self,
+        resource: str,
+        namespace: str = None,
+        all_namespaces=False,
+        label_selector: LabelSelector = None,
+        field_selector: str = None,
+        resource_version: str = None,
+        timeout: int = None,
+    ) -> Iterator[dict]:
+        """
+        yield watch events `{"type": "ADDED" | "MODIFIED" | "DELETED" | "BOOKMARK", "object": {...}}` as they come
+
+        Args:
+            resource_version: events after this version, the current objects are sent as ADDED first if not set
+            timeout: seconds the server keeps the watch, the iteration ends then
+
+        Raises:
+            ApiError: with status 410 if `resource_version` is too old, the objects must be listed again
+        """
+        resource = self.resource(resource)
+        path = resource.path(None if all_namespaces else self._namespace(resource, namespace))
+        params = _params(
+            watch="true",
+            labelSelector=labels.to_query(label_selector),
+            fieldSelector=field_selector,
+            resourceVersion=resource_version,
+            timeoutSeconds=timeout,
+            allowWatchBookmarks="true",
+        )
+        # the connection is idle while nothing changes
+        request_timeout = httpx.Timeout(self._http.timeout.connect, read=None)
+        with self._http.stream(
+            "GET", path, params=params, timeout=request_timeout, extensions=self._extensions
+        ) as response:
+            if response.is_error:
+                response.read()
+                raise ApiError.from_response(response)
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event["type"] == "ERROR":
+                    raise ApiError.from_status(event["object"])
+                yield event
+
+
+def _params(**params) -> dict:
+    return {name: value for name, value in params.items() if value is not None}
+
+
+# clients by kubeconfig paths and context, with modification times of the files
+_clients: dict[tuple, tuple[tuple, K8sClient]] = {}
+_clients_lock = threading.Lock()
+
+
+def client(path: Path = None, context: str = None) -> K8sClient:
+    """
+    pooled client of the context of the kubeconfig, it's created once per process and kept open
+
+    the kubeconfig is read again if it has changed since, e.g. after `K8sConfig.rename_current_context`
+    """
+    paths = default_kubeconfig_paths() if path is None else [Path(path).expanduser().absolute()]
+    mtimes = tuple(path.stat().st_mtime_ns if path.exists() else None for path in paths)
+    key = (tuple(paths), context)
+    with _clients_lock:
+        cached = _clients.get(key)
+        if cached is not None and cached[0] == mtimes:
+            return cached[1]
+        k8s_client = K8sClient(ClusterConfig.from_kubeconfig(paths, context))
+        _clients[key] = (mtimes, k8s_client)
+    # the previous client may still be in use, its connections are closed once it's collected
+    return k8s_client
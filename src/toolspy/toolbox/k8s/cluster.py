@@ -1,13 +1,16 @@
 """functions in this module helps to manage multiple k8s clusters"""
 from pathlib import Path
 from toolspy.toolbox import ssh
+import httpx
+from toolspy.toolbox.k8s.client import ApiError
 from toolspy.toolbox.k8s.config import K8sConfig
 from toolspy.toolbox.k8s.helpers import env as k8s_env
-from subprocess import CalledProcessError
-from toolspy.utils.tasks import run_in_parallel
-from functools import partial
+from toolspy.utils.tasks import TaskResult, iter_in_parallel
+from dataclasses import dataclass
+from fnmatch import fnmatch
 from time import time
-from typing import Iterable, Tuple
+from typing import Callable, Iterable, List, Union
+import inspect
 
 
 import logging
@@ -52,41 +55,137 @@ def delete(name: str):
 
 def check(k8s_cfg: K8sConfig, timeout: int):
     """check if cluster is available"""
-    cmd = (
-        f"kubectl version "
-        f"--output yaml "
-        f"--request-timeout={timeout}s "
-    )
     try:
-        k8s_cfg.env().run(cmd)
-    except CalledProcessError:
+        k8s_cfg.client().version(timeout=timeout)
+    except (httpx.HTTPError, ApiError):
         return (k8s_cfg, False)
     return (k8s_cfg, True)
 
 
-def cleanup(timeout: int = 10):
+def select(clusters: Union[str, Iterable[str], None] = None) -> List[K8sConfig]:
+    """
+    Args:
+        clusters: names of kubeconfigs, found by `K8sConfig.find` like operations find them,
+            a glob of names in `KUBECONFIG_DIR`, all of them if None
+
+    Raises:
+        RuntimeError: if a listed kubeconfig doesn't exist
+    """
+    if clusters is None or isinstance(clusters, str) and any(char in clusters for char in "*?["):
+        pattern = clusters or "*"
+        return sorted(
+            (k8s_cfg for k8s_cfg in K8sConfig.find_all() if fnmatch(k8s_cfg.name, pattern)),
+            key=lambda k8s_cfg: k8s_cfg.name,
+        )
+    if isinstance(clusters, str):
+        clusters = clusters.split(",")
+    return [K8sConfig.find(name.strip()) for name in clusters]
+
+
+@dataclass
+class FanOutResult:
+    """TaskResult of every cluster, its item is the K8sConfig"""
+    tasks: List[TaskResult]
+
+    @property
+    def ok(self) -> bool:
+        return all(task.ok for task in self.tasks)
+
+    @property
+    def results(self) -> dict:
+        return {task.item.name: task.result for task in self.tasks if task.ok}
+
+    @property
+    def errors(self) -> dict:
+        return {task.item.name: task.error for task in self.tasks if not task.ok}
+
+    def table(self, width: int = 80) -> str:
+        """a row per cluster with its status, seconds and result or error"""
+        name_width = max((len(task.item.name) for task in self.tasks), default=7)
+        lines = [f"{'cluster':<{name_width}} {'status':>7} {'s':>8}  result"]
+        for task in self.tasks:
+            if task.ok:
+                status, output = "ok", "" if task.result is None else repr(task.result)
+            else:
+                status = "timeout" if isinstance(task.error, TimeoutError) else "error"
+                output = repr(task.error)
+            output = " ".join(output.split())
+            if len(output) > width:
+                output = output[:width - 3] + "..."
+            lines.append(f"{task.item.name:<{name_width}} {status:>7} {task.duration:8.3f}  {output}")
+        failed = len(self.errors)
+        lines.append(f"{len(self.tasks) - failed} ok, {failed} failed")
+        return "\n".join(lines)
+
+
+def fan_out(
+    operation: Callable,
+    *args,
+    clusters: Union[str, Iterable[str], None] = None,
+    max_workers: int = 16,
+    cluster_timeout: float = None,
+    **kwargs,
+) -> FanOutResult:
+    """
+    run a toolbox operation against every cluster concurrently
+
+    the kubeconfig name is passed as `kubeconfig_name` or `config_name` if the operation has one
+    of these arguments, otherwise K8sConfig is passed as the first argument:
+
+        result = fan_out(update_multi_cluster_proxy_endpoints, "proxy", clusters="prod-*", cluster_timeout=60)
+        print(result.table())
+
+    Args:
+        clusters: see `select`
+        max_workers: clusters handled at once
+        cluster_timeout: seconds for every cluster, a cluster which doesn't finish is reported as timed out.
+            The call can't be interrupted and keeps its worker, requests of the API client have their own timeouts
+    """
+    parameters = list(inspect.signature(operation).parameters)
+    name_arg = next((name for name in ("kubeconfig_name", "config_name") if name in parameters), None)
+
+    def run(k8s_cfg: K8sConfig):
+        if name_arg is None:
+            return operation(k8s_cfg, *args, **kwargs)
+        position = parameters.index(name_arg)
+        if position < len(args):
+            # e.g. `store(config_name, namespace)` called with the namespace
+            return operation(*args[:position], k8s_cfg.name, *args[position:], **kwargs)
+        return operation(*args, **{name_arg: k8s_cfg.name}, **kwargs)
+
+    tasks = iter_in_parallel(run, select(clusters), max_workers=max_workers, ordered=True, task_timeout=cluster_timeout)
+    result = FanOutResult(list(tasks))
+    for name, error in result.errors.items():
+        log.error(f"{getattr(operation, '__name__', operation)} failed on '{name}': {error!r}")
+    return result
+
+
+def cleanup(timeout: int = 10, max_workers: int = 32):
     """
     check if there are unavailable clusters.
     if there are, suggest removing them
     """
-    check_funcs = [
-        partial(check, k8s_cfg, timeout)
-        for k8s_cfg in K8sConfig.find_all()
-    ]
-    clusters_availability, _ = run_in_parallel(check_funcs)
-
+    non_working_k8s_configs = []
+    checks = fan_out(
+        check,
+        timeout=timeout,
+        max_workers=max_workers,
+        # requests give up after the timeout, the margin is for reading the kubeconfig and TLS
+        cluster_timeout=timeout * 2 + 5,
+    )
     k8s_cfg: K8sConfig
-    non_working_k8s_configs = [
-        k8s_cfg
-        for k8s_cfg, is_working in clusters_availability
-        if not is_working
-    ]
+    for task in checks.tasks:
+        k8s_cfg = task.item
+        # e.g. timed out or a broken kubeconfig or TLS setup, like any failure of kubectl before
+        if not task.ok or not task.result[1]:
+            non_working_k8s_configs.append(k8s_cfg)
+
     if not non_working_k8s_configs:
         log.info("all clusters are available")
         return
     do_cleanup = False
     if non_working_k8s_configs:
-        print(f"The following clusters didn't respond within {timeout} seconds:")
+        print(f"The following clusters didn't respond within {timeout} seconds or failed:")
         for k8s_cfg in non_working_k8s_configs:
             print(f" {k8s_cfg.name}")
         print()
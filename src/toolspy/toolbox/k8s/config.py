@@ -1,4 +1,5 @@
 from toolspy.utils.process import Env
+from toolspy.toolbox.k8s import client as k8s_client
 from pathlib import Path
 from dataclasses import dataclass
 from typing import Iterator
@@ -41,6 +42,10 @@ class K8sConfig:
         env = K8sEnv(KUBECONFIG=str(self.path))
         return env
 
+    def client(self, context: str = None) -> k8s_client.K8sClient:
+        """pooled API client of the cluster, see `toolspy.toolbox.k8s.client`"""
+        return k8s_client.client(self.path, context)
+
     def rename_current_context(self, new_name: str):
         k8s_env = self.env()
 
@@ -51,11 +56,18 @@ class K8sConfig:
 class K8sEnv(Env):
     namespace: str = None
 
+    @property
+    def client(self) -> k8s_client.K8sClient:
+        """pooled API client of KUBECONFIG of the env"""
+        kubeconfig = self.env_vars.get("KUBECONFIG")
+        return k8s_client.client(Path(kubeconfig) if kubeconfig else None)
+
     def kubectl(self, args: str, **kwargs):
+        """run kubectl, e.g. for commands which work with the kubeconfig itself, `client` is faster for API calls"""
         if self.namespace:
             args = f"--namespace {self.namespace} {args}"
         return self.run(f"kubectl {args}", **kwargs)
 
     def apply(self, manifests: str):
-        self.kubectl(f"apply -f -", input=manifests)
+        self.client.apply(manifests, self.namespace)
 
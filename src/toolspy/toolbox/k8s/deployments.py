@@ -1,47 +1,58 @@
 from toolspy.toolbox.k8s.config import K8sConfig
-import yaml
+from toolspy.utils.parsing import dump_yaml, load_yaml
 from pathlib import Path
+import threading
 
+# replicas of deployments by kubeconfig name and namespace
 DEPLOYMENTS_PATH = Path("deployments.yaml")
+# clusters stored at once, e.g. by `cluster.fan_out`, update the file in turn
+_lock = threading.Lock()
 
 def store(config_name: str, namespace: str):
-    k8s_env = K8sConfig.from_config_name(config_name).env()
+    k8s_env = K8sConfig.find(config_name).env()
     k8s_env.namespace = namespace
     
     # collect replicas info
     replicas_info = {}
-    deployments = yaml.safe_load(k8s_env.kubectl("get deployments -o yaml"))
+    deployments = k8s_env.client.list("deployments", namespace, cache=True)
     for deployment in deployments["items"]:
         name = deployment["metadata"]["name"]
         replicas = deployment["spec"]["replicas"]
         replicas_info[name] = replicas
 
-    # load deployments info if exists
-    deployments_info = {}
-    if DEPLOYMENTS_PATH.exists():
-        deployments_info = yaml.safe_load(DEPLOYMENTS_PATH.read_text())
+    with _lock:
+        # load deployments info if exists
+        deployments_info = {}
+        if DEPLOYMENTS_PATH.exists():
+            deployments_info = load_yaml(DEPLOYMENTS_PATH.read_text())
 
-    # update deployments info
-    deployments_info[namespace] = replicas_info
-    DEPLOYMENTS_PATH.write_text(yaml.dump(deployments_info))
+        # update deployments info
+        deployments_info.setdefault(config_name, {})[namespace] = replicas_info
+        DEPLOYMENTS_PATH.write_text(dump_yaml(deployments_info))
     # breakpoint()
 
 def scale_down(config_name: str, namespace: str):
-    k8s_env = K8sConfig.from_config_name(config_name).env()
+    k8s_env = K8sConfig.find(config_name).env()
     k8s_env.namespace = namespace
 
-    deployments_info = yaml.safe_load(DEPLOYMENTS_PATH.read_text())
-    replicas_info: dict[str, int] = deployments_info[namespace]
+    replicas_info = _stored_replicas(config_name, namespace)
 
     for deployment, replicas in replicas_info.items():
-        k8s_env.kubectl(f"scale deployment {deployment} --replicas=0")
+        k8s_env.client.patch("deployments", deployment, {"spec": {"replicas": 0}}, namespace)
 
 def scale_up(config_name: str, namespace: str):
-    k8s_env = K8sConfig.from_config_name(config_name).env()
+    k8s_env = K8sConfig.find(config_name).env()
     k8s_env.namespace = namespace
 
-    deployments_info = yaml.safe_load(DEPLOYMENTS_PATH.read_text())
-    replicas_info: dict[str, int] = deployments_info[namespace]
+    replicas_info = _stored_replicas(config_name, namespace)
 
     for deployment, replicas in replicas_info.items():
-        k8s_env.kubectl(f"scale deployment {deployment} --replicas={replicas}")
\ No newline at end of file
+        k8s_env.client.patch("deployments", deployment, {"spec": {"replicas": replicas}}, namespace)
+
+def _stored_replicas(config_name: str, namespace: str) -> dict[str, int]:
+    deployments_info = load_yaml(DEPLOYMENTS_PATH.read_text())
+    replicas_info = deployments_info.get(config_name, {}).get(namespace)
+    if isinstance(replicas_info, dict):
+        return replicas_info
+    # stored before the file was keyed by cluster
+    return deployments_info[namespace]
@@ -1,19 +1,17 @@
 from toolspy.toolbox.k8s.config import K8sConfig
+from toolspy.toolbox.k8s import client as k8s_client
+from toolspy.toolbox.k8s.labels import Selector
 from toolspy.utils.process import Env
 
 
-def match_labels(item: dict, labels: dict) -> bool:
-    item_labels = item.get("metadata", {}).get("labels")
-    if not item_labels:
-        return False
+def match_labels(item: dict, labels) -> bool:
+    """
+    Args:
+        labels: labels which must match, a selector or its text, see `toolspy.toolbox.k8s.labels`
 
-    for key, value in labels.items():
-        if key not in item_labels:
-            return False
-        if item_labels[key] != value:
-            return False
-
-    return True
+    an empty selector matches every item, also one without labels, like on the API server
+    """
+    return Selector.coerce(labels).matches_object(item)
 
 
 def env(kubeconfig_name: str = None):
@@ -24,9 +22,11 @@ def env(kubeconfig_name: str = None):
     return env
 
 
+def client(kubeconfig_name: str = None) -> k8s_client.K8sClient:
+    if kubeconfig_name:
+        return K8sConfig.find(kubeconfig_name).client()
+    return k8s_client.client()
+
+
 def apply(manifests: str, namespace: str = None, kubeconfig_name: str = None):
-    e = env(kubeconfig_name)
-    args = ""
-    if namespace:
-        args = f"--namespace {namespace}"
-    e.run(f"kubectl apply {args} -f -", input=manifests)
+    client(kubeconfig_name).apply(manifests, namespace)
@@ -0,0 +1,264 @@
+"""
+label selectors of Kubernetes
+
+`Selector` parses the syntax of `kubectl -l` and `labelSelector`, it's sent to the API server,
+so only matching objects are listed, and it matches labels in process with precompiled checks:
+
+    selector = Selector.parse("app.kubernetes.io/part-of=proxy,tier in (web,api),!canary")
+    services = client.list("services", label_selector=selector)["items"]
+    selector.matches(labels)
+
+`LabelIndex` keeps labels of a set of cached objects to select them without a scan
+"""
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, Mapping, Optional, Union
+import re
+
+IN = "In"
+NOT_IN = "NotIn"
+EXISTS = "Exists"
+DOES_NOT_EXIST = "DoesNotExist"
+OPERATORS = (IN, NOT_IN, EXISTS, DOES_NOT_EXIST)
+
+_KEY = re.compile(
+    r"^([a-z0-9]([-a-z0-9]*[a-z0-9])?(\.[a-z0-9]([-a-z0-9]*[a-z0-9])?)*/)?[A-Za-z0-9]([-A-Za-z0-9_.]*[A-Za-z0-9])?$"
+)
+_VALUE = re.compile(r"^(([A-Za-z0-9][-A-Za-z0-9_.]*)?[A-Za-z0-9])?$")
+_SET = re.compile(r"^(\S+)\s+(in|notin)\s*\((.*)\)$")
+_EQUALITY = re.compile(r"^([^\s=!]+)\s*(==|=|!=)\s*(\S*)$")
+
+Labels = Mapping[str, str]
+
+
+@dataclass(frozen=True)
+class Requirement:
+    """
+    Args:
+        operator: one of OPERATORS, `key=value` is In with a single value and `key!=value` is NotIn
+    """
+    key: str
+    operator: str
+    values: frozenset = frozenset()
+
+    def __post_init__(self):
+        if not _KEY.match(self.key) or len(self.key.rpartition("/")[2]) > 63:
+            raise ValueError(f"invalid label key '{self.key}'")
+        if self.operator not in OPERATORS:
+            raise ValueError(f"invalid operator '{self.operator}' of label '{self.key}'")
+        for value in self.values:
+            if not _VALUE.match(value) or len(value) > 63:
+                raise ValueError(f"invalid value '{value}' of label '{self.key}'")
+        if self.operator in (IN, NOT_IN) and not self.values:
+            raise ValueError(f"'{self.operator}' of label '{self.key}' has no values")
+
+    def __str__(self) -> str:
+        if self.operator == EXISTS:
+            return self.key
+        if self.operator == DOES_NOT_EXIST:
+            return f"!{self.key}"
+        if len(self.values) == 1:
+            (value,) = self.values
+            return f"{self.key}={value}" if self.operator == IN else f"{self.key}!={value}"
+        values = ",".join(sorted(self.values))
+        return f"{self.key} in ({values})" if self.operator == IN else f"{self.key} notin ({values})"
+
+    def compile(self) -> Callable[[Labels], bool]:
+        key = self.key
+        if self.operator == EXISTS:
+            return lambda labels: key in labels
+        if self.operator == DOES_NOT_EXIST:
+            return lambda labels: key not in labels
+        if len(self.values) == 1:
+            (value,) = self.values
+            if self.operator == IN:
+                return lambda labels: labels.get(key) == value
+            # objects without the label match != and notin, like on the server
+            return lambda labels: labels.get(key) != value
+        values = self.values
+        if self.operator == IN:
+            return lambda labels: labels.get(key) in values
+        return lambda labels: labels.get(key) not in values
+
+
+class Selector:
+    """all requirements must match, an empty selector matches everything"""
+
+    def __init__(self, requirements: Iterable[Requirement] = ()):
+        self.requirements = tuple(sorted(requirements, key=lambda requirement: (requirement.key, str(requirement))))
+        self._checks = tuple(requirement.compile() for requirement in self.requirements)
+
+    @classmethod
+    def parse(cls, text: str) -> "Selector":
+        """
+        Raises:
+            ValueError: if the text isn't a valid selector
+        """
+        requirements = []
+        for part in _split(text):
+            if part.startswith("!"):
+                requirements.append(Requirement(part[1:].strip(), DOES_NOT_EXIST))
+                continue
+            match = _SET.match(part)
+            if match:
+                key, operator, values = match.groups()
+                values = frozenset(value.strip() for value in values.split(","))
+                requirements.append(Requirement(key, IN if operator == "in" else NOT_IN, values))
+                continue
+            match = _EQUALITY.match(part)
+            if match:
+                key, operator, value = match.groups()
+                requirements.append(Requirement(key, NOT_IN if operator == "!=" else IN, frozenset([value])))
+                continue
+            if re.match(r"^[^\s=!(),]+$", part):
+                requirements.append(Requirement(part, EXISTS))
+                continue
+            raise ValueError(f"invalid label selector '{text}' at '{part}'")
+        return cls(requirements)
+
+    @classmethod
+    def from_labels(cls, labels: Labels) -> "Selector":
+        """selector of objects which have all the labels"""
+        return cls(Requirement(key, IN, frozenset([value])) for key, value in labels.items())
+
+    @classmethod
+    def from_label_selector(cls, label_selector: dict) -> "Selector":
+        """`matchLabels` and `matchExpressions` of a LabelSelector object, e.g. of a Deployment"""
+        selector = cls.from_labels(label_selector.get("matchLabels") or {})
+        expressions = [
+            Requirement(expression["key"], expression["operator"], frozenset(expression.get("values") or ()))
+            for expression in label_selector.get("matchExpressions") or []
+        ]
+        return cls(selector.requirements + tuple(expressions))
+
+    @classmethod
+    def coerce(cls, selector: Union["Selector", str, Labels, None]) -> "Selector":
+        """selector from its text or from labels which must match"""
+        if selector is None:
+            return cls()
+        if isinstance(selector, Selector):
+            return selector
+        if isinstance(selector, str):
+            return cls.parse(selector)
+        return cls.from_labels(selector)
+
+    def __str__(self) -> str:
+        return ",".join(map(str, self.requirements))
+
+    def __repr__(self) -> str:
+        return f"Selector({str(self)!r})"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Selector) and self.requirements == other.requirements
+
+    def __hash__(self) -> int:
+        return hash(self.requirements)
+
+    def __bool__(self) -> bool:
+        return bool(self.requirements)
+
+    def matches(self, labels: Optional[Labels]) -> bool:
+        labels = labels or {}
+        for check in self._checks:
+            if not check(labels):
+                return False
+        return True
+
+    def matches_object(self, obj: dict) -> bool:
+        return self.matches(obj.get("metadata", {}).get("labels"))
+
+    def filter(self, objects: Iterable[dict]) -> Iterator[dict]:
+        return (obj for obj in objects if self.matches_object(obj))
+
+
+def to_query(selector: Union[Selector, str, Labels, None]) -> Optional[str]:
+    """value of `labelSelector`, None if everything is selected"""
+    return str(Selector.coerce(selector)) or None
+
+
+def _split(text: str) -> Iterator[str]:
+    """requirements of the text, commas inside of value sets don't split them"""
+    depth = 0
+    start = 0
+    for index, char in enumerate(text):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            part = text[start:index].strip()
+            if not part:
+                raise ValueError(f"invalid label selector '{text}'")
+            yield part
+            start = index + 1
+    part = text[start:].strip()
+    if part:
+        yield part
+    elif start:
+        raise ValueError(f"invalid label selector '{text}'")
+
+
+class LabelIndex:
+    """
+    labels of objects by their names, indexed by label values
+
+    a selector with an equality, `in` or exists requirement is answered from the index,
+    only the candidates it gives are matched against the whole selector
+    """
+
+    def __init__(self):
+        self._labels: dict[str, Labels] = {}
+        # key: value: names
+        self._index: dict[str, dict[str, set]] = defaultdict(lambda: defaultdict(set))
+
+    def __len__(self) -> int:
+        return len(self._labels)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._labels
+
+    def set(self, name: str, labels: Optional[Labels]):
+        self.discard(name)
+        labels = dict(labels or {})
+        self._labels[name] = labels
+        for key, value in labels.items():
+            self._index[key][value].add(name)
+
+    def discard(self, name: str):
+        labels = self._labels.pop(name, None)
+        if labels is None:
+            return
+        for key, value in labels.items():
+            names = self._index[key][value]
+            names.discard(name)
+            if not names:
+                del self._index[key][value]
+                if not self._index[key]:
+                    del self._index[key]
+
+    def clear(self):
+        self._labels.clear()
+        self._index.clear()
+
+    def values(self, key: str) -> set:
+        """values of the label among the objects"""
+        return set(self._index.get(key, ()))
+
+    def select(self, selector: Union[Selector, str, Labels]) -> set:
+        """names of objects which match the selector"""
+        selector = Selector.coerce(selector)
+        candidates = None
+        for requirement in selector.requirements:
+            values = self._index.get(requirement.key, {})
+            if requirement.operator == IN:
+                names = set().union(*(values.get(value, ()) for value in requirement.values))
+            elif requirement.operator == EXISTS:
+                names = set().union(*values.values())
+            else:
+                continue
+            candidates = names if candidates is None else candidates & names
+            if not candidates:
+                return set()
+        if candidates is None:
+            candidates = self._labels.keys()
+        return {name for name in candidates if selector.matches(self._labels[name])}
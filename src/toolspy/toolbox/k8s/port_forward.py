@@ -1,5 +1,6 @@
 from toolspy.utils.process import Env
-import yaml
+from toolspy.toolbox.k8s import client as k8s_client
+from toolspy.utils.parsing import load_yaml
 from pathlib import Path
 from dataclasses import dataclass
 from subprocess import Popen
@@ -26,13 +27,16 @@ class Pod:
     localPort: int = None
 
     @classmethod
-    def from_config(cls, config: PortForwardConf, env: Env = None):
-        if not env:
-            env = Env()
-        endpoint_yaml = env.run(
-            f"kubectl get endpoints -n {config.namespace} {config.endpoint} -o yaml"
-        )
-        endpoint = yaml.safe_load(endpoint_yaml)
+    def from_config(cls, config: PortForwardConf, env: Env = None, client: k8s_client.K8sClient = None):
+        """
+        Args:
+            env: its KUBECONFIG selects the cluster
+            client: client of the cluster, it takes precedence over `env`
+        """
+        if client is None:
+            kubeconfig = env.env_vars.get("KUBECONFIG") if env else None
+            client = k8s_client.client(Path(kubeconfig) if kubeconfig else None)
+        endpoint = client.get("endpoints", config.endpoint, config.namespace, cache=True)
         pods: list["Pod"] = []
         for subset in endpoint["subsets"]:
             ports = subset["ports"]
@@ -65,7 +69,7 @@ def parse_port_forward_config(name: str) -> PortForwardConf:
     if not toolbox_conf_file.exists():
         raise FileNotFoundError(f"toolbox.yaml not found: {toolbox_conf_file}")
 
-    toolbox_conf = yaml.safe_load(toolbox_conf_file.read_text())
+    toolbox_conf = load_yaml(toolbox_conf_file.read_text())
     ports_forward_conf = toolbox_conf.get("kube", {}).get("port-forward", {})
     if not ports_forward_conf:
         raise ValueError(f"port-forward config not found in {toolbox_conf_file} file")
@@ -81,6 +85,7 @@ def parse_port_forward_config(name: str) -> PortForwardConf:
 def port_forward(name: str = None, tag: str = None):
     port_forward_config = parse_port_forward_config(name)
     env = Env()
+    kubeconfig = None
     if port_forward_config.kubeconfig:
         kubeconfig = Path(port_forward_config.kubeconfig)
         kubeconfig = kubeconfig.expanduser().absolute()
@@ -88,6 +93,8 @@ def port_forward(name: str = None, tag: str = None):
         env.env_vars["KUBECONFIG"] = str(kubeconfig)
     pods = Pod.from_config(port_forward_config, env)
 
+    # port-forward streams over SPDY/websockets, so it's still done by kubectl
+
     processes: dict[str, Popen] = {}
     while True:
         for pod in pods:
@@ -1,20 +1,51 @@
 from dataclasses import dataclass, asdict
-import yaml
+from toolspy.utils.parsing import dump_yaml
 from toolspy.toolbox import k8s
+from toolspy.toolbox.k8s.client import ApiError
+from toolspy.toolbox.k8s.labels import LabelIndex, Selector
 from collections import defaultdict
+from time import monotonic
+from typing import Iterable, Optional
+import hashlib
+import ipaddress
+import json
+import queue
+import threading
 import logging
 
 log = logging.getLogger(__name__)
 
+PROXY_LABELS = {
+    "app.kubernetes.io/part-of": "multi-cluster-proxy",
+}
+COMPONENT_LABEL = "app.kubernetes.io/component"
+# fingerprint of the subsets of an applied endpoint, so unchanged endpoints are found by their metadata only
+FINGERPRINT_ANNOTATION = "toolspy.io/endpoints-fingerprint"
 
+# "endpoints" writes a legacy Endpoints object per component, "endpointslices" writes EndpointSlices
+BACKENDS = ("endpoints", "endpointslices")
+SERVICE_NAME_LABEL = "kubernetes.io/service-name"
+MANAGED_BY_LABEL = "endpointslice.kubernetes.io/managed-by"
+SLICE_MANAGER = "multi-cluster-proxy.toolspy.io"
+# the same as the default of the EndpointSlice controller
+MAX_ENDPOINTS_PER_SLICE = 100
+
+
+def _digest(value) -> str:
+    return hashlib.sha256(json.dumps(value, separators=(",", ":")).encode()).hexdigest()[:32]
+
+
+# __slots__ keep instances small, a proxy may have thousands of services
 @dataclass
 class Address:
+    __slots__ = ("hostname", "ip")
     hostname: str
     ip: str
 
 
 @dataclass
 class Port:
+    __slots__ = ("name", "port", "protocol")
     name: str
     port: int
     protocol: str
@@ -25,6 +56,7 @@ class Port:
 
 @dataclass
 class Subset:
+    __slots__ = ("addresses", "ports", "_fingerprint")
     addresses: list[Address]
     ports: set[Port]
 
@@ -65,16 +97,24 @@ class Subset:
         )
         return subset
 
-    def __comparable_value(self) -> set:
-        value = set()
-        for address in self.addresses:
-            value.add((address.hostname, address.ip))
-        for port in self.ports:
-            value.add((port.port, port.protocol))
-        return value
+    @property
+    def fingerprint(self) -> str:
+        """
+        hash of addresses and of ports without their names, equal subsets have equal fingerprints
+
+        it's computed once, so the subset must not be changed after it's compared
+        """
+        try:
+            return self._fingerprint
+        except AttributeError:
+            pass
+        addresses = {(address.hostname or "", address.ip or "") for address in self.addresses}
+        ports = {(port.port or 0, port.protocol or "") for port in self.ports}
+        self._fingerprint = _digest([sorted(addresses), sorted(ports)])
+        return self._fingerprint
 
     def __eq__(self, other: "Subset") -> bool:
-        return self.__comparable_value() == other.__comparable_value()
+        return self.fingerprint == other.fingerprint
 
 
 @dataclass
@@ -83,79 +123,99 @@ class Endpoint:
     namespace: str
     subsets: list[Subset]
 
-    def __str__(self) -> str:
-        endpoints = {
+    @property
+    def fingerprint(self) -> str:
+        """hash of the subsets, it's kept in FINGERPRINT_ANNOTATION of applied endpoints"""
+        return _digest([subset.fingerprint for subset in self.subsets])
+
+    def manifest(self) -> dict:
+        return {
             "apiVersion": "v1",
             "kind": "Endpoints",
             "metadata": {
                 "name": self.name,
                 "namespace": self.namespace,
+                "annotations": {FINGERPRINT_ANNOTATION: self.fingerprint},
             },
-            "subsets": [asdict(subset) for subset in self.subsets],
+            "subsets": [
+                {
+                    "addresses": [asdict(address) for address in subset.addresses],
+                    # ports are a set, asdict would keep Port objects
+                    "ports": [asdict(port) for port in sorted(subset.ports, key=lambda port: (port.port, port.protocol))],
+                }
+                for subset in self.subsets
+            ],
         }
-        return yaml.dump(endpoints)
+
+    def __str__(self) -> str:
+        return dump_yaml(self.manifest())
 
     @classmethod
-    def list(cls, namespace: str, kubeconfig_name: str = None):
-        env = k8s.helpers.env(kubeconfig_name)
-        endpoints_yaml = env.run(
-            f"kubectl --namespace {namespace} get endpoints -o yaml"
+    def from_dict(cls, endpoint: dict, namespace: str) -> "Endpoint":
+        return cls(
+            name=endpoint["metadata"]["name"],
+            namespace=namespace,
+            subsets=[
+                Subset.from_dict(subset) for subset in endpoint.get("subsets") or []
+            ],
         )
-        endpoints_list = yaml.safe_load(endpoints_yaml)["items"]
+
+    @classmethod
+    def list(cls, namespace: str, kubeconfig_name: str = None):
+        client = k8s.helpers.client(kubeconfig_name)
+        endpoints_list = client.list("endpoints", namespace, cache=True)["items"]
         endpoints = {}
         for endpoint in endpoints_list:
-            name = endpoint["metadata"]["name"]
-            subsets = [
-                Subset.from_dict(subset) for subset in endpoint.get("subsets", [])
-            ]
-            endpoints[name] = Endpoint(
-                name=name,
-                namespace=namespace,
-                subsets=subsets,
-            )
+            endpoints[endpoint["metadata"]["name"]] = Endpoint.from_dict(endpoint, namespace)
         return endpoints
 
 
-def services_with_labels(namespace: str, labels: dict, kubeconfig_name: str = None):
-    env = k8s.helpers.env(kubeconfig_name)
-    services_yaml = env.run(f"kubectl --namespace {namespace} get services -o yaml")
-    services = yaml.safe_load(services_yaml)
-    sub_services = []
-    for service in services["items"]:
-        if k8s.helpers.match_labels(service, labels):
-            sub_services.append(service)
-    return sub_services
+def services_with_labels(namespace: str, labels, kubeconfig_name: str = None):
+    """
+    Args:
+        labels: labels which must match, a selector or its text, see `toolspy.toolbox.k8s.labels`,
+            it's sent to the server, so other services aren't listed
+    """
+    client = k8s.helpers.client(kubeconfig_name)
+    return client.list("services", namespace, label_selector=Selector.coerce(labels), cache=True)["items"]
 
 
-def update_multi_cluster_proxy_endpoints(namespace: str, kubeconfig_name: str = None):
-    labels = {
-        "app.kubernetes.io/part-of": "multi-cluster-proxy",
-    }
-    proxy_services = services_with_labels(namespace, labels, kubeconfig_name)
-    if not proxy_services:
-        log.info(f"No services found in {namespace} with labels: {labels}")
-        return
+def component_of(service: Optional[dict]) -> Optional[str]:
+    if not service:
+        return None
+    return (service["metadata"].get("labels") or {}).get(COMPONENT_LABEL)
+
+
+def group_by_component(services: Iterable[dict]) -> dict[str, list]:
     grouped_services = defaultdict(list)
-    for service in proxy_services:
-        component = (
-            service["metadata"].get("labels", {}).get("app.kubernetes.io/component")
-        )
+    for service in services:
+        component = component_of(service)
         if not component:
             log.warning(
                 f"Service {service['metadata']['name']} has no component label. Skipping"
             )
             continue
         grouped_services[component].append(service)
+    return grouped_services
+
+
+def desired_endpoint(namespace: str, component: str, services: list) -> Endpoint:
+    return Endpoint(
+        name=component,
+        namespace=namespace,
+        subsets=[Subset.from_services(services)],
+    )
 
-    existing_endpoints = Endpoint.list(namespace, kubeconfig_name)
+
+def outdated_endpoints(
+    namespace: str,
+    grouped_services: dict[str, list],
+    existing_endpoints: dict[str, Endpoint],
+) -> list[Endpoint]:
+    """endpoints of components which don't exist or differ from their services"""
     endpoints = []
     for service_name, services in grouped_services.items():
-        subset = Subset.from_services(services)
-        endpoint = Endpoint(
-            name=service_name,
-            namespace=namespace,
-            subsets=[subset],
-        )
+        endpoint = desired_endpoint(namespace, service_name, services)
 
         if service_name not in existing_endpoints:
             log.info(f"Endpoint {namespace}/{service_name} not found. Creating")
@@ -169,18 +229,457 @@ def update_multi_cluster_proxy_endpoints(namespace: str, kubeconfig_name: str =
             )
             continue
 
-        current_subset = existing_endpoint.subsets[0]
-        if subset != current_subset:
+        if endpoint.fingerprint != existing_endpoint.fingerprint:
             log.info(f"Endpoint {namespace}/{service_name} is outdated. Updating")
             endpoints.append(endpoint)
             continue
 
         log.info(f"Endpoint {namespace}/{service_name} is up-to-date. Nothing to do")
+    return endpoints
+
+
+def _address_type(ip: str) -> Optional[str]:
+    try:
+        return f"IPv{ipaddress.ip_address(ip).version}"
+    except ValueError:
+        return None
+
+
+def _slice_endpoint_key(endpoint: dict) -> tuple:
+    return endpoint.get("hostname") or "", tuple(endpoint.get("addresses") or ())
+
+
+def _slice_ports(ports: Iterable[dict]) -> list:
+    return sorted(
+        ({"name": port.get("name"), "port": port.get("port"), "protocol": port.get("protocol")} for port in ports),
+        key=lambda port: (port["port"] or 0, port["protocol"] or ""),
+    )
+
+
+def endpoint_slices_plan(
+    namespace: str,
+    component: str,
+    services: list,
+    existing_slices: Iterable[dict],
+    max_endpoints: int = MAX_ENDPOINTS_PER_SLICE,
+) -> tuple[list[dict], list[str]]:
+    """
+    EndpointSlices of the component to apply and names of its slices to delete
+
+    addresses stay in the slices they are in, removed ones leave gaps which are filled by new addresses,
+    so a change of a few services rewrites only the slices they belong to, like the EndpointSlice controller does.
+    All slices are rewritten if ports change, ports are a part of every slice
+    """
+    existing_slices = list(existing_slices)
+    subset = Subset.from_services(services)
+    ports = _slice_ports(asdict(port) for port in subset.ports)
+    desired: dict[str, dict[tuple, dict]] = defaultdict(dict)
+    for address in subset.addresses:
+        address_type = _address_type(address.ip)
+        if address_type is None:
+            log.warning(f"Service {namespace}/{address.hostname} has no cluster IP. Skipping")
+            continue
+        endpoint = {"addresses": [address.ip], "hostname": address.hostname, "conditions": {"ready": True}}
+        desired[address_type][_slice_endpoint_key(endpoint)] = endpoint
+
+    slices_by_type = defaultdict(list)
+    for endpoint_slice in existing_slices:
+        slices_by_type[endpoint_slice.get("addressType")].append(endpoint_slice)
+    taken_names = {endpoint_slice["metadata"]["name"] for endpoint_slice in existing_slices}
+
+    to_apply, to_delete = [], []
+    for address_type in sorted(desired.keys() | slices_by_type.keys()):
+        wanted = dict(desired.get(address_type, {}))
+        # [name, endpoints, changed]
+        slots = []
+        for endpoint_slice in sorted(slices_by_type[address_type], key=lambda item: item["metadata"]["name"]):
+            endpoints = endpoint_slice.get("endpoints") or []
+            kept = [wanted.pop(_slice_endpoint_key(endpoint)) for endpoint in endpoints if _slice_endpoint_key(endpoint) in wanted]
+            changed = len(kept) != len(endpoints) or _slice_ports(endpoint_slice.get("ports") or []) != ports
+            slots.append([endpoint_slice["metadata"]["name"], kept, changed])
+
+        new = [wanted[key] for key in sorted(wanted)]
+        # slices which are rewritten anyway take new addresses first
+        for slot in sorted(slots, key=lambda slot: not slot[2]):
+            room = max_endpoints - len(slot[1])
+            if new and room > 0:
+                slot[1] += new[:room]
+                new = new[room:]
+                slot[2] = True
+        index = 0
+        while new:
+            name = f"{component}-{address_type.lower()}-{index}"
+            index += 1
+            if name in taken_names:
+                continue
+            taken_names.add(name)
+            slots.append([name, new[:max_endpoints], True])
+            new = new[max_endpoints:]
+
+        for name, endpoints, changed in slots:
+            if not endpoints:
+                to_delete.append(name)
+            elif changed:
+                to_apply.append({
+                    "apiVersion": "discovery.k8s.io/v1",
+                    "kind": "EndpointSlice",
+                    "metadata": {
+                        "name": name,
+                        "namespace": namespace,
+                        "labels": {SERVICE_NAME_LABEL: component, MANAGED_BY_LABEL: SLICE_MANAGER},
+                    },
+                    "addressType": address_type,
+                    "endpoints": endpoints,
+                    "ports": ports,
+                })
+    return to_apply, to_delete
+
+
+def managed_endpoint_slices(namespace: str, kubeconfig_name: str = None) -> dict[str, list]:
+    """EndpointSlices written by the proxy backend by names of their components"""
+    client = k8s.helpers.client(kubeconfig_name)
+    selector = {MANAGED_BY_LABEL: SLICE_MANAGER}
+    slices = defaultdict(list)
+    for endpoint_slice in client.list("endpointslices", namespace, label_selector=selector)["items"]:
+        slices[endpoint_slice["metadata"]["labels"][SERVICE_NAME_LABEL]].append(endpoint_slice)
+    return slices
 
-    endpoints_manifest = "---".join(map(str, endpoints))
-    if not endpoints_manifest:
+
+def update_endpoint_slices(namespace: str, grouped_services: dict[str, list], kubeconfig_name: str = None):
+    client = k8s.helpers.client(kubeconfig_name)
+    existing_slices = managed_endpoint_slices(namespace, kubeconfig_name)
+    for component, services in grouped_services.items():
+        to_apply, to_delete = endpoint_slices_plan(namespace, component, services, existing_slices.get(component, []))
+        if not to_apply and not to_delete:
+            log.info(f"EndpointSlices of {namespace}/{component} are up-to-date. Nothing to do")
+            continue
+        log.info(
+            f"EndpointSlices of {namespace}/{component} are outdated. "
+            f"Applying {len(to_apply)}, deleting {len(to_delete)}"
+        )
+        client.apply(to_apply, namespace)
+        for name in to_delete:
+            _delete_slice(client, namespace, name)
+
+
+def _delete_slice(client, namespace: str, name: str):
+    try:
+        client.delete("endpointslices", name, namespace)
+    except ApiError as e:
+        if e.status != 404:
+            raise
+
+
+def applied_fingerprints(namespace: str, kubeconfig_name: str = None) -> dict[str, Optional[str]]:
+    """FINGERPRINT_ANNOTATION of all endpoints of the namespace by their names, only metadata is fetched"""
+    client = k8s.helpers.client(kubeconfig_name)
+    return {
+        endpoint["metadata"]["name"]: (endpoint["metadata"].get("annotations") or {}).get(FINGERPRINT_ANNOTATION)
+        for endpoint in client.list_metadata("endpoints", namespace)["items"]
+    }
+
+
+def update_multi_cluster_proxy_endpoints(namespace: str, kubeconfig_name: str = None, backend: str = "endpoints"):
+    """
+    apply endpoints of components of the multi-cluster proxy which are missing or outdated
+
+    components whose fingerprint matches the annotation of their endpoint are skipped
+    without fetching it, the others are compared with the full endpoints
+
+    Args:
+        backend: one of BACKENDS. "endpointslices" splits addresses of a component across EndpointSlices
+            of MAX_ENDPOINTS_PER_SLICE addresses and rewrites only the slices which changed,
+            it has no limit of 1000 addresses of Endpoints. Endpoints written before aren't deleted,
+            they must be deleted once a component is switched, otherwise their mirrored slices duplicate addresses
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown backend '{backend}', expected one of: {', '.join(BACKENDS)}")
+    labels = PROXY_LABELS
+    proxy_services = services_with_labels(namespace, labels, kubeconfig_name)
+    if not proxy_services:
+        log.info(f"No services found in {namespace} with labels: {labels}")
+        return
+    grouped_services = group_by_component(proxy_services)
+    if backend == "endpointslices":
+        update_endpoint_slices(namespace, grouped_services, kubeconfig_name)
+        return
+
+    fingerprints = applied_fingerprints(namespace, kubeconfig_name)
+    changed = {}
+    for component, services in grouped_services.items():
+        if fingerprints.get(component) == desired_endpoint(namespace, component, services).fingerprint:
+            log.info(f"Endpoint {namespace}/{component} is up-to-date. Nothing to do")
+        else:
+            changed[component] = services
+    existing_endpoints = {}
+    if changed.keys() & fingerprints.keys():
+        existing_endpoints = Endpoint.list(namespace, kubeconfig_name)
+    endpoints = outdated_endpoints(namespace, changed, existing_endpoints)
+    outdated = {endpoint.name for endpoint in endpoints}
+    for component in changed.keys() - outdated:
+        existing_endpoint = existing_endpoints.get(component)
+        if existing_endpoint and len(existing_endpoint.subsets) == 1:
+            # up to date but applied without the annotation, it's added once so the next run skips it
+            endpoints.append(desired_endpoint(namespace, component, changed[component]))
+
+    if not endpoints:
         log.info("No endpoints to apply")
         return
 
-    k8s.helpers.apply(endpoints_manifest, namespace, kubeconfig_name)
+    k8s.helpers.client(kubeconfig_name).apply([endpoint.manifest() for endpoint in endpoints], namespace)
+
+
+class ProxyEndpointsController:
+    """
+    long-running counterpart of `update_multi_cluster_proxy_endpoints`
+
+    services and endpoints (or EndpointSlices of the proxy) are listed once, then watch streams keep them in memory,
+    only components whose services or endpoints changed are reconciled,
+    events which come within `debounce` seconds are reconciled together.
+    An expired watch (410 Gone) lists its resource again, components which failed to apply are retried
+
+        controller = ProxyEndpointsController("proxy")
+        controller.run()  # until controller.stop() is called from another thread
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        kubeconfig_name: str = None,
+        debounce: float = 0.5,
+        retry_interval: float = 5,
+        watch_timeout: int = 300,
+        backend: str = "endpoints",
+    ):
+        """
+        Args:
+            watch_timeout: seconds a watch request lasts, it's started again from the last resource version then
+            backend: one of BACKENDS, see `update_multi_cluster_proxy_endpoints`
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"unknown backend '{backend}', expected one of: {', '.join(BACKENDS)}")
+        self.namespace = namespace
+        self.backend = backend
+        self.client = k8s.helpers.client(kubeconfig_name)
+        self.debounce = debounce
+        self.retry_interval = retry_interval
+        self.watch_timeout = watch_timeout
+        self.label_selector = Selector.from_labels(PROXY_LABELS)
+        # services of the proxy, all endpoints of the namespace and slices of the proxy by names
+        self.services: dict[str, dict] = {}
+        self.endpoints: dict[str, Endpoint] = {}
+        self.slices: dict[str, dict] = {}
+        self._selectors = {
+            "services": self.label_selector,
+            "endpoints": None,
+            "endpointslices": Selector.from_labels({MANAGED_BY_LABEL: SLICE_MANAGER}),
+        }
+        # labels of the services, so services of a component are found without a scan
+        self._labels = LabelIndex()
+        self._events: queue.Queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._failed: set[str] = set()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        versions = self.sync()
+        for resource, version in versions.items():
+            thread = threading.Thread(
+                target=self._watch,
+                args=(resource, self._selectors[resource], version),
+                name=f"watch-{resource}",
+                daemon=True,
+            )
+            thread.start()
+
+        last_retry = monotonic()
+        try:
+            while not self._stopped.is_set():
+                try:
+                    event = self._events.get(timeout=1)
+                except queue.Empty:
+                    if self._failed and monotonic() - last_retry >= self.retry_interval:
+                        last_retry = monotonic()
+                        self.reconcile(self._failed)
+                    continue
+                components = self._handle(*event)
+                deadline = monotonic() + self.debounce
+                while monotonic() < deadline:
+                    try:
+                        event = self._events.get(timeout=max(deadline - monotonic(), 0))
+                    except queue.Empty:
+                        break
+                    components |= self._handle(*event)
+                if components:
+                    self.reconcile(components)
+        finally:
+            self._stopped.set()
+
+    def sync(self) -> dict[str, str]:
+        """list services and endpoints or slices, reconcile all components, resource versions of the lists"""
+        versions = {}
+        for resource in ("services", self.backend):
+            listed = self._list(resource)
+            self._replace(resource, listed["items"])
+            versions[resource] = listed["metadata"]["resourceVersion"]
+        self.reconcile()
+        return versions
+
+    def reconcile(self, components: Iterable[str] = None):
+        """apply outdated endpoints of the components, of all components if they aren't set"""
+        if components is None:
+            grouped_services = group_by_component(self.services.values())
+        else:
+            components = set(components)
+            grouped_services = {}
+            for component in components:
+                names = self._labels.select({COMPONENT_LABEL: component})
+                if names:
+                    grouped_services[component] = [self.services[name] for name in sorted(names)]
+        if self.backend == "endpointslices":
+            failed = self._reconcile_slices(grouped_services)
+        else:
+            failed = self._reconcile_endpoints(grouped_services)
+        # components which have no services anymore or are up to date now aren't retried
+        self._failed = (self._failed - set(grouped_services) - set(components or ())) | failed
+
+    def _reconcile_endpoints(self, grouped_services: dict[str, list]) -> set[str]:
+        failed = set()
+        for endpoint in outdated_endpoints(self.namespace, grouped_services, self.endpoints):
+            try:
+                applied = self.client.apply(endpoint.manifest(), self.namespace)
+            except Exception:
+                log.exception(f"applying endpoint {self.namespace}/{endpoint.name} failed, it will be retried")
+                failed.add(endpoint.name)
+                continue
+            # the watch event of the change may come later, it mustn't be applied once more meanwhile
+            self.endpoints[endpoint.name] = Endpoint.from_dict(applied[0], self.namespace)
+        return failed
+
+    def _reconcile_slices(self, grouped_services: dict[str, list]) -> set[str]:
+        failed = set()
+        slices_by_component = defaultdict(list)
+        for endpoint_slice in self.slices.values():
+            slices_by_component[endpoint_slice["metadata"]["labels"].get(SERVICE_NAME_LABEL)].append(endpoint_slice)
+        for component, services in grouped_services.items():
+            to_apply, to_delete = endpoint_slices_plan(
+                self.namespace, component, services, slices_by_component[component]
+            )
+            if not to_apply and not to_delete:
+                continue
+            log.info(
+                f"EndpointSlices of {self.namespace}/{component} are outdated. "
+                f"Applying {len(to_apply)}, deleting {len(to_delete)}"
+            )
+            try:
+                for applied in self.client.apply(to_apply, self.namespace):
+                    self.slices[applied["metadata"]["name"]] = applied
+                for name in to_delete:
+                    _delete_slice(self.client, self.namespace, name)
+                    self.slices.pop(name, None)
+            except Exception:
+                log.exception(f"updating EndpointSlices of {self.namespace}/{component} failed, it will be retried")
+                failed.add(component)
+        return failed
+
+    def _list(self, resource: str) -> dict:
+        return self.client.list(resource, self.namespace, label_selector=self._selectors[resource])
+
+    def _replace(self, resource: str, objects: list) -> set[str]:
+        """replace cached objects of the resource, components they affect"""
+        components = set(self._components())
+        if resource == "services":
+            self.services = {service["metadata"]["name"]: service for service in objects}
+            self._labels.clear()
+            for name, service in self.services.items():
+                self._labels.set(name, service["metadata"].get("labels"))
+        elif resource == "endpointslices":
+            self.slices = {endpoint_slice["metadata"]["name"]: endpoint_slice for endpoint_slice in objects}
+        else:
+            self.endpoints = {
+                endpoint["metadata"]["name"]: Endpoint.from_dict(endpoint, self.namespace)
+                for endpoint in objects
+            }
+        return components | self._components()
+
+    def _components(self) -> set[str]:
+        return self._labels.values(COMPONENT_LABEL) - {""}
+
+    def _handle(self, resource: str, event: dict) -> set[str]:
+        """update the cache with the event, components it affects"""
+        if event["type"] == "RELIST":
+            return self._replace(resource, event["items"])
+        obj = event["object"]
+        name = obj["metadata"]["name"]
+        deleted = event["type"] == "DELETED"
+        if resource == "services":
+            previous = self.services.pop(name, None)
+            self._labels.discard(name)
+            if not deleted:
+                self.services[name] = obj
+                self._labels.set(name, obj["metadata"].get("labels"))
+            return {component_of(previous), component_of(obj)} - {None, ""}
+
+        if resource == "endpointslices":
+            self.slices.pop(name, None)
+            if not deleted:
+                self.slices[name] = obj
+            # slices changed or deleted by someone else are restored
+            return {obj["metadata"].get("labels", {}).get(SERVICE_NAME_LABEL)} & self._components()
+
+        self.endpoints.pop(name, None)
+        if not deleted:
+            self.endpoints[name] = Endpoint.from_dict(obj, self.namespace)
+        # endpoints changed or deleted by someone else are restored
+        return {name} & self._components()
+
+    def _watch(self, resource: str, label_selector: Optional[Selector], version: str):
+        backoff = 1
+        while not self._stopped.is_set():
+            try:
+                for event in self.client.watch(
+                    resource,
+                    self.namespace,
+                    label_selector=label_selector,
+                    resource_version=version,
+                    timeout=self.watch_timeout,
+                ):
+                    version = event["object"]["metadata"].get("resourceVersion") or version
+                    if event["type"] != "BOOKMARK":
+                        self._events.put((resource, event))
+                    if self._stopped.is_set():
+                        return
+                backoff = 1
+            except ApiError as e:
+                if e.status != 410:
+                    log.warning(f"watch of {resource} failed: {e}")
+                    self._stopped.wait(backoff)
+                    backoff = min(backoff * 2, 60)
+                    continue
+                log.info(f"watch of {resource} expired, listing them again")
+                listed_version = self._relist(resource)
+                if listed_version is None:
+                    self._stopped.wait(backoff)
+                    backoff = min(backoff * 2, 60)
+                else:
+                    version = listed_version
+            except Exception as e:
+                log.warning(f"watch of {resource} failed: {e!r}")
+                self._stopped.wait(backoff)
+                backoff = min(backoff * 2, 60)
+
+    def _relist(self, resource: str) -> Optional[str]:
+        try:
+            listed = self._list(resource)
+        except Exception as e:
+            log.warning(f"listing {resource} failed: {e!r}")
+            return None
+        self._events.put((resource, {"type": "RELIST", "items": listed["items"]}))
+        return listed["metadata"]["resourceVersion"]
+
 
+def watch_multi_cluster_proxy_endpoints(namespace: str, kubeconfig_name: str = None, backend: str = "endpoints"):
+    """keep endpoints of the multi-cluster proxy up to date until interrupted"""
+    ProxyEndpointsController(namespace, kubeconfig_name, backend=backend).run()
@@ -0,0 +1,461 @@
+"""
+shared on-disk cache of downloaded files
+
+files are stored by their sha256, so the same content downloaded by different URLs
+is kept once, and a file with known sha256 is taken from the cache without any request.
+Known URLs are revalidated with ETag/Last-Modified, interrupted downloads are resumed
+with HTTP Range requests, least recently used files are evicted when the cache is full.
+Many files are fetched concurrently by `fetch_many` over a single pooled async client.
+
+    TOOLSPY_DOWNLOAD_CACHE       cache folder, ~/.cache/toolspy/downloads by default
+    TOOLSPY_DOWNLOAD_CACHE_SIZE  max size of cached files in bytes, 5 GiB by default
+"""
+from pathlib import Path
+from dataclasses import dataclass, field
+from collections.abc import Iterable
+from typing import Callable, Iterator, Optional, Union
+from urllib.parse import urlsplit
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+import logging
+import httpx
+
+try:
+    import fcntl
+except ImportError:
+    # without locks every transfer writes its own file and nothing is resumed
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 5 * 1024 ** 3
+# progress callback is called at most this often while bytes are coming
+PROGRESS_INTERVAL = 0.5
+
+
+class DownloadError(RuntimeError):
+    """
+    some of many downloads failed
+
+    `errors` has an exception by every failed URL, `results` has cached files of the others
+    """
+
+    def __init__(self, errors: dict[str, BaseException], results: dict[str, Path] = None):
+        self.errors = errors
+        self.results = results or {}
+        lines = "\n".join(f"  {url}: {error!r}" for url, error in errors.items())
+        super().__init__(f"{len(errors)} download(s) failed:\n{lines}")
+
+
+@dataclass
+class Progress:
+    total: int
+    done: int = 0
+    failed: int = 0
+    bytes: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def throughput(self) -> float:
+        """downloaded bytes per second"""
+        return self.bytes / max(self.elapsed, 1e-6)
+
+    def __str__(self):
+        failed = f", {self.failed} failed" if self.failed else ""
+        return (
+            f"{self.done}/{self.total} files{failed}, {self.bytes / 1024 ** 2:.1f} MiB "
+            f"in {self.elapsed:.1f}s ({self.throughput / 1024 ** 2:.1f} MiB/s)"
+        )
+
+
+def _log_progress(progress: Progress):
+    log.info(f"downloading: {progress}")
+
+
+def _default_path() -> Path:
+    if "TOOLSPY_DOWNLOAD_CACHE" in os.environ:
+        return Path(os.environ["TOOLSPY_DOWNLOAD_CACHE"]).expanduser()
+    cache_home = Path(os.environ.get("XDG_CACHE_HOME", "~/.cache")).expanduser()
+    return cache_home / "toolspy" / "downloads"
+
+
+class DownloadCache:
+    def __init__(self, path: Path = None, max_size: int = None):
+        self.path = path or _default_path()
+        self.max_size = max_size or int(os.environ.get("TOOLSPY_DOWNLOAD_CACHE_SIZE", DEFAULT_MAX_SIZE))
+        self.objects = self.path / "objects"
+        self.urls = self.path / "urls"
+        self.partial = self.path / "partial"
+        self._client: httpx.Client = None
+
+    @property
+    def client(self) -> httpx.Client:
+        """client shared by all downloads, so connections are kept alive"""
+        if self._client is None:
+            self._client = httpx.Client(follow_redirects=True)
+        return self._client
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    def fetch(self, url: str, sha256: str = None) -> Path:
+        """
+        path of the cached file downloaded from URL
+
+        Args:
+            url: file URL
+            sha256: expected hex digest of the file,
+                if it is cached already no request is made at all
+
+        Raises:
+            RuntimeError: if downloaded file doesn't match expected sha256
+        """
+        cached = self.lookup(url, sha256)
+        if isinstance(cached, Path):
+            return cached
+        try:
+            for transfer in self._transfers(url, sha256, cached):
+                with transfer, self.client.stream("GET", url, headers=transfer.headers) as response:
+                    result = transfer.start(response)
+                    if result is None:
+                        for chunk in response.iter_bytes():
+                            transfer.write(chunk)
+                        result = transfer.finish()
+                if result is not _RESTART:
+                    return result
+        except httpx.TransportError as e:
+            return self._fallback(url, sha256, cached, e)
+        raise RuntimeError(f"cannot download {url}, the server rejects the range of a new download")
+
+    def fetch_many(
+        self,
+        items: Iterable[tuple[str, Optional[str]]],
+        max_concurrency: int = 8,
+        max_per_host: int = 4,
+        progress: Callable[[Progress], None] = _log_progress,
+    ) -> dict[str, Path]:
+        """
+        cached files downloaded concurrently, see `fetch_many_async`
+
+        Raises:
+            DownloadError: if any download failed, files of other URLs are cached anyway
+        """
+        return asyncio.run(self.fetch_many_async(items, max_concurrency, max_per_host, progress))
+
+    async def fetch_many_async(
+        self,
+        items: Iterable[tuple[str, Optional[str]]],
+        max_concurrency: int = 8,
+        max_per_host: int = 4,
+        progress: Callable[[Progress], None] = _log_progress,
+    ) -> dict[str, Path]:
+        """
+        cached files of many URLs downloaded over a single pooled connection pool
+
+        Args:
+            items: URL and expected sha256 or None, repeated URLs are downloaded once
+            max_concurrency: max number of downloads at the same time
+            max_per_host: max number of downloads from the same host at the same time
+            progress: called with progress as files are finished and periodically while bytes are coming
+
+        Returns:
+            cached files by URLs
+
+        Raises:
+            DownloadError: if any download failed, files of other URLs are cached anyway
+        """
+        items = dict(items)
+        state = Progress(total=len(items))
+        reported = time.monotonic()
+
+        def on_bytes(count: int):
+            nonlocal reported
+            state.bytes += count
+            if progress and time.monotonic() - reported >= PROGRESS_INTERVAL:
+                reported = time.monotonic()
+                progress(state)
+
+        total_limit = asyncio.Semaphore(max_concurrency)
+        host_limits: dict[str, asyncio.Semaphore] = {}
+        limits = httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency)
+
+        async with httpx.AsyncClient(follow_redirects=True, limits=limits) as client:
+            async def fetch(url: str, sha256: Optional[str]) -> Path:
+                host = urlsplit(url).netloc
+                host_limit = host_limits.setdefault(host, asyncio.Semaphore(max_per_host))
+                async with total_limit, host_limit:
+                    try:
+                        return await self._fetch_async(client, url, sha256, on_bytes)
+                    except BaseException:
+                        state.failed += 1
+                        raise
+                    finally:
+                        state.done += 1
+                        if progress:
+                            progress(state)
+
+            results = await asyncio.gather(
+                *(fetch(url, sha256) for url, sha256 in items.items()),
+                return_exceptions=True,
+            )
+
+        paths = {}
+        errors = {}
+        for url, result in zip(items, results):
+            if isinstance(result, BaseException):
+                errors[url] = result
+            else:
+                paths[url] = result
+        if errors:
+            raise DownloadError(errors, paths)
+        return paths
+
+    async def _fetch_async(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        sha256: Optional[str],
+        on_bytes: Callable[[int], None],
+    ) -> Path:
+        cached = self.lookup(url, sha256)
+        if isinstance(cached, Path):
+            return cached
+        try:
+            for transfer in self._transfers(url, sha256, cached):
+                with transfer:
+                    async with client.stream("GET", url, headers=transfer.headers) as response:
+                        # file operations which may take long are done on threads not to block other downloads
+                        result = await asyncio.to_thread(transfer.start, response)
+                        if result is None:
+                            async for chunk in response.aiter_bytes():
+                                transfer.write(chunk)
+                                on_bytes(len(chunk))
+                            result = await asyncio.to_thread(transfer.finish)
+                if result is not _RESTART:
+                    return result
+        except httpx.TransportError as e:
+            return self._fallback(url, sha256, cached, e)
+        raise RuntimeError(f"cannot download {url}, the server rejects the range of a new download")
+
+    def lookup(self, url: str, sha256: str = None) -> Union[Path, dict, None]:
+        """
+        cached file if it can be used without request,
+        otherwise URL entry to revalidate the file or None
+        """
+        if sha256:
+            cached = self.objects / sha256.lower()
+            if cached.exists():
+                return self._touch(cached)
+
+        entry = self._load_entry(url)
+        if not entry or not (self.objects / entry["sha256"]).exists():
+            return None
+        if sha256 and entry["sha256"] != sha256.lower():
+            # cached file isn't what is expected, it must not be revalidated
+            return None
+        return entry
+
+    def _transfers(self, url: str, sha256: Optional[str], entry: Optional[dict]) -> Iterator["_Transfer"]:
+        """transfer to try, and one more without partial file if server rejects its range"""
+        yield _Transfer(self, url, sha256, entry)
+        yield _Transfer(self, url, sha256, entry)
+
+    def _fallback(self, url: str, sha256: Optional[str], entry: Optional[dict], error: Exception) -> Path:
+        if entry and (not sha256 or entry["sha256"] == sha256.lower()):
+            log.warning(f"cannot revalidate {url} ({error}), using cached file")
+            return self._touch(self.objects / entry["sha256"])
+        raise error
+
+    def evict(self, keep: Path = None):
+        """remove least recently used files until the cache fits `max_size`"""
+        if not self.objects.exists():
+            return
+        files = [(path, path.stat()) for path in self.objects.iterdir()]
+        total = sum(stat.st_size for _, stat in files)
+        for path, stat in sorted(files, key=lambda item: item[1].st_mtime):
+            if total <= self.max_size:
+                break
+            if path == keep:
+                continue
+            log.debug(f"evicting {path.name} from download cache")
+            path.unlink(missing_ok=True)
+            total -= stat.st_size
+
+    def _touch(self, path: Path) -> Path:
+        # mtime marks the last use of the file for eviction
+        now = time.time()
+        os.utime(path, (now, now))
+        return path
+
+    def _entry_path(self, url: str) -> Path:
+        return self.urls / f"{hashlib.sha256(url.encode()).hexdigest()}.json"
+
+    def _load_entry(self, url: str) -> Optional[dict]:
+        try:
+            return json.loads(self._entry_path(url).read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _save_entry(self, url: str, entry: dict):
+        self.urls.mkdir(parents=True, exist_ok=True)
+        entry_path = self._entry_path(url)
+        # unique per call, threads saving the same entry don't replace each other's file
+        fd, tmp_path = tempfile.mkstemp(prefix=f"{entry_path.stem}.", suffix=".tmp", dir=self.urls)
+        with os.fdopen(fd, "w") as f:
+            f.write(json.dumps(entry))
+        os.replace(tmp_path, entry_path)
+
+
+class _Transfer:
+    """
+    download of a single URL into the cache, regardless of the client doing requests
+
+    the partial file of the URL is kept between attempts to resume it, it's written only by the transfer
+    which holds its lock. Concurrent transfers of the same URL, e.g. by parallel jobs sharing the cache,
+    download into their own temporary files
+    """
+
+    def __init__(self, cache: DownloadCache, url: str, sha256: Optional[str], entry: Optional[dict]):
+        self.cache = cache
+        self.url = url
+        self.sha256 = sha256
+        self.entry = entry
+        self.headers = {}
+        if entry and entry.get("etag"):
+            self.headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            self.headers["If-Modified-Since"] = entry["last_modified"]
+        self._sha = hashlib.sha256()
+        # bytes hashed so far, the partial file must have all of them
+        self._size = 0
+        self._file = None
+        self._lock = None
+
+        url_key = hashlib.sha256(url.encode()).hexdigest()
+        cache.partial.mkdir(parents=True, exist_ok=True)
+        self._lock = self._acquire(cache.partial / f"{url_key}.lock")
+        if self._lock is None:
+            fd, path = tempfile.mkstemp(prefix=f"{url_key}.", suffix=".tmp", dir=cache.partial)
+            os.close(fd)
+            self.partial = Path(path)
+            self.partial_meta = None
+            return
+        self.partial = cache.partial / url_key
+        self.partial_meta = cache.partial / f"{url_key}.json"
+
+        validator = None
+        if self.partial.exists() and self.partial_meta.exists():
+            validator = json.loads(self.partial_meta.read_text()).get("validator")
+        if validator:
+            # If-Range returns the rest of the file only if it didn't change meanwhile
+            self.headers["Range"] = f"bytes={self.partial.stat().st_size}-"
+            self.headers["If-Range"] = validator
+
+    @staticmethod
+    def _acquire(path: Path):
+        """open lock file, None if another transfer holds it"""
+        if fcntl is None:
+            return None
+        lock = path.open("a")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return None
+        return lock
+
+    def __enter__(self) -> "_Transfer":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """close the partial file, it's kept to resume only if the transfer holds the lock"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._lock is None:
+            self.partial.unlink(missing_ok=True)
+        else:
+            self._lock.close()
+            self._lock = None
+
+    def start(self, response: httpx.Response):
+        """
+        handle response status
+
+        Returns:
+            cached file if it isn't modified, _RESTART if the transfer must be repeated,
+            None if response content is to be written
+        """
+        if response.status_code == 304 and self.entry:
+            log.debug(f"{self.url} is not modified")
+            return self.cache._touch(self.cache.objects / self.entry["sha256"])
+        if response.status_code == 416:
+            # partial file is bigger than the file or something else is wrong with it
+            self.partial.unlink(missing_ok=True)
+            if self.partial_meta:
+                self.partial_meta.unlink(missing_ok=True)
+            return _RESTART
+        response.raise_for_status()
+
+        self.etag = response.headers.get("ETag")
+        self.last_modified = response.headers.get("Last-Modified")
+        resumed = response.status_code == 206 and "Range" in self.headers
+        if self.partial_meta:
+            self.partial_meta.write_text(json.dumps({"url": self.url, "validator": self.etag or self.last_modified}))
+        if resumed:
+            log.debug(f"resuming {self.url} from {self.partial.stat().st_size} bytes")
+            with self.partial.open("rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    self._sha.update(chunk)
+                    self._size += len(chunk)
+        self._file = self.partial.open("ab" if resumed else "wb")
+        return None
+
+    def write(self, chunk: bytes):
+        self._sha.update(chunk)
+        self._size += len(chunk)
+        self._file.write(chunk)
+
+    def finish(self) -> Path:
+        self._file.close()
+        self._file = None
+        digest = self._sha.hexdigest()
+        if self.partial_meta:
+            self.partial_meta.unlink(missing_ok=True)
+        if self.sha256 and digest != self.sha256.lower():
+            self.partial.unlink(missing_ok=True)
+            raise RuntimeError(f"sha256 of {self.url} is {digest}, expected {self.sha256}")
+        if self.partial.stat().st_size != self._size:
+            # the file isn't what was received, it is never published under a wrong name
+            self.partial.unlink(missing_ok=True)
+            raise RuntimeError(f"partial file of {self.url} was changed during the download")
+
+        self.cache.objects.mkdir(parents=True, exist_ok=True)
+        cached = self.cache.objects / digest
+        os.replace(self.partial, cached)
+        self.cache._save_entry(self.url, {
+            "url": self.url,
+            "sha256": digest,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+        })
+        self.cache.evict(keep=cached)
+        return self.cache._touch(cached)
+
+
+_RESTART = object()
+
+DEFAULT_CACHE = DownloadCache()
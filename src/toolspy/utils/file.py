@@ -2,22 +2,69 @@ from pathlib import Path
 import shutil
 import hashlib
 import base64
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from collections.abc import Iterable
 import httpx
 
 
+# files of this size and bigger are hashed through memory mapping
+MMAP_THRESHOLD = 4 * 1024 * 1024
+# files of this size and bigger are hashed in threads by `sha256_many`
+PARALLEL_THRESHOLD = 1024 * 1024
+
+
 def sha256(path: Path, blocksize=65536):
     """calculate sha256 of given file"""
-    sha = hashlib.sha256()
-    hashlib.sha256()
     with path.open("rb") as file:
-        file_buffer = file.read(blocksize)
-        while len(file_buffer) > 0:
-            sha.update(file_buffer)
+        size = os.fstat(file.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            # whole file is hashed by a single call which releases the GIL
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                sha = hashlib.sha256(mapped)
+        elif hasattr(hashlib, "file_digest"):
+            sha = hashlib.file_digest(file, "sha256")
+        else:
+            sha = hashlib.sha256()
             file_buffer = file.read(blocksize)
-    encoded_digest = base64.urlsafe_b64encode(sha.digest()).decode().strip("=")
-    return encoded_digest
+            while len(file_buffer) > 0:
+                sha.update(file_buffer)
+                file_buffer = file.read(blocksize)
+    return encode_digest(sha)
+
+
+def sha256_many(paths: Iterable[Path], max_workers: int = None, min_size: int = PARALLEL_THRESHOLD) -> dict[Path, str]:
+    """
+    calculate sha256 of many files, big ones concurrently
+
+    hashlib releases the GIL while hashing, so threads scale with CPU cores for big files.
+    For small files the thread handoff costs more than the hashing (see benchmarks/hashing.py),
+    they are hashed serially
+
+    Args:
+        paths: files to hash
+        max_workers: number of threads, number of CPUs by default
+        min_size: files of this size and bigger are hashed in threads
+
+    Returns:
+        digests by paths
+    """
+    paths = list(paths)
+    big = [path for path in paths if path.stat().st_size >= min_size]
+    max_workers = min(max_workers or os.cpu_count() or 1, len(big))
+    if max_workers < 2:
+        return {path: sha256(path) for path in paths}
+    with ThreadPoolExecutor(max_workers) as executor:
+        digests = dict(zip(big, executor.map(sha256, big)))
+    # in the order of paths
+    return {path: digests[path] if path in digests else sha256(path) for path in paths}
+
+
+def encode_digest(sha) -> str:
+    """urlsafe base64 digest without padding, as it is used in wheel RECORD"""
+    return base64.urlsafe_b64encode(sha.digest()).decode().strip("=")
 
 
 def from_iterable(path: Path, lines: Iterable[str]):
@@ -36,17 +83,70 @@ def temp_dir(dir_path: Path):
         shutil.rmtree(dir_path)
 
 
-def download(url: str, path: Path):
+def download(url: str, path: Path, sha256: str = None, cache: bool = True):
     """Download a file from URL to local path
 
     Args:
         url: file URL to download
         path: local path to save file
+        sha256: expected hex digest of the file, the download fails if it differs
+        cache: take the file from the shared download cache (see `toolspy.utils.downloads`)
     """
+    if cache:
+        from toolspy.utils.downloads import DEFAULT_CACHE
+
+        cached = DEFAULT_CACHE.fetch(url, sha256)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(cached, path)
+        return
+
+    digest = hashlib.sha256()
     with httpx.Client() as client:
         with client.stream("GET", url, follow_redirects=True) as response:
             response.raise_for_status()
             path.parent.mkdir(parents=True, exist_ok=True)
             with path.open("wb") as f:
                 for chunk in response.iter_bytes():
-                    f.write(chunk)
\ No newline at end of file
+                    digest.update(chunk)
+                    f.write(chunk)
+    if sha256 and digest.hexdigest() != sha256.lower():
+        path.unlink()
+        raise RuntimeError(f"sha256 of {url} is {digest.hexdigest()}, expected {sha256}")
+
+
+def download_many(
+    downloads: Iterable[tuple],
+    max_concurrency: int = 8,
+    max_per_host: int = 4,
+    progress=None,
+):
+    """Download many files concurrently through the shared download cache
+
+    the total time is about the time of the slowest download rather than the sum of all of them
+
+    Args:
+        downloads: `(url, path)` or `(url, path, sha256)` tuples
+        max_concurrency: max number of downloads at the same time
+        max_per_host: max number of downloads from the same host at the same time
+        progress: called with `toolspy.utils.downloads.Progress`, logged by default
+
+    Raises:
+        DownloadError: with errors of all failed downloads, successful ones are saved anyway
+    """
+    from toolspy.utils.downloads import DEFAULT_CACHE, DownloadError
+
+    downloads = [(url, Path(path), *rest) for url, path, *rest in downloads]
+    kwargs = {"progress": progress} if progress else {}
+    items = [(url, rest[0] if rest else None) for url, _, *rest in downloads]
+    try:
+        cached = DEFAULT_CACHE.fetch_many(items, max_concurrency, max_per_host, **kwargs)
+        errors = {}
+    except DownloadError as e:
+        cached, errors = e.results, e.errors
+
+    for url, path, *_ in downloads:
+        if url in cached:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(cached[url], path)
+    if errors:
+        raise DownloadError(errors, cached)
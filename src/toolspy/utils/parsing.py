@@ -0,0 +1,35 @@
+"""
+parsing of command outputs and config files
+
+kubectl output is requested as JSON and parsed by the stdlib json module,
+YAML which can't be avoided (manifests, kubeconfigs, configs of the toolbox) is parsed by libyaml
+if PyYAML is built with it, which is several times faster than the pure python loader.
+Both accept the same input as `json.loads` and `yaml.safe_load`
+"""
+from typing import Any, Iterator, TextIO, Union
+import json
+
+import yaml
+
+try:
+    from yaml import CSafeDumper as SafeDumper, CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeDumper, SafeLoader
+
+
+def load_json(text: Union[str, bytes, TextIO]) -> Any:
+    if hasattr(text, "read"):
+        return json.load(text)
+    return json.loads(text)
+
+
+def load_yaml(text: Union[str, bytes, TextIO]) -> Any:
+    return yaml.load(text, Loader=SafeLoader)
+
+
+def load_yaml_all(text: Union[str, bytes, TextIO]) -> Iterator[Any]:
+    return yaml.load_all(text, Loader=SafeLoader)
+
+
+def dump_yaml(data: Any, **kwargs) -> str:
+    return yaml.dump(data, Dumper=SafeDumper, **kwargs)
@@ -1,4 +1,5 @@
 from .env import Env
+from .async_env import AsyncEnv
 
 
 DEFAULT_ENV = Env()
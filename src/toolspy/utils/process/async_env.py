@@ -0,0 +1,204 @@
+"""
+asyncio counterpart of `Env`
+
+commands run as asyncio subprocesses, so many of them run concurrently from a single event loop
+without a thread per command:
+
+    env = AsyncEnv(KUBECONFIG=...)
+    outputs = await asyncio.gather(*(env.run(f"kubectl --context {name} get nodes") for name in contexts))
+"""
+import asyncio
+import os
+import shlex
+import signal
+import subprocess
+import time
+from pathlib import Path
+from subprocess import CompletedProcess
+from typing import Callable, Optional
+import logging
+
+from toolspy.utils.process.cache import CommandCache, DEFAULT_CACHE
+from toolspy.utils.process.instrument import HOOKS, CommandRecord, Hook, emit, output_size
+
+log = logging.getLogger(__name__)
+
+# max length of a line passed to line callbacks
+LINE_LIMIT = 16 * 1024 * 1024
+
+
+class AsyncEnv:
+    _cwd: Path
+
+    def __init__(self, **kwargs) -> None:
+        self.env_vars = {**os.environ, **kwargs}
+        self._cwd = Path().absolute()
+        self.last_result: CompletedProcess = None
+        # outputs of commands run with `cache=True` are reused, off unless set
+        self.cache: CommandCache = DEFAULT_CACHE
+        # called with `CommandRecord` of every command, resource usage of asyncio subprocesses is unknown
+        self.hooks: list[Hook] = []
+
+    @property
+    def cwd(self) -> Path:
+        return self._cwd
+
+    @cwd.setter
+    def cwd(self, value: str):
+        self._cwd = Path(value)
+
+    async def run(
+        self,
+        *cmds: str,
+        input: str = None,
+        ignore_errors=None,
+        exit_on_first_error=False,
+        verbose=False,
+        cache=False,
+        timeout: float = None,
+        on_stdout: Callable[[str], None] = None,
+        on_stderr: Callable[[str], None] = None,
+    ) -> str:
+        """
+        run commands one after another and return their joined stdout, see `Env.run`
+
+        Args:
+            timeout: seconds every command may run, it is killed and `subprocess.TimeoutExpired` is raised then
+            on_stdout: called with every line of stdout without line break as soon as it is printed
+            on_stderr: called with every line of stderr without line break as soon as it is printed
+
+        a command is killed if the task running it is cancelled, together with processes it started,
+        so they don't keep its output open. Every command runs in its own session for that,
+        it doesn't get signals sent to the process group of the terminal, e.g. by Ctrl+C
+        """
+        outputs = []
+        for cmd in cmds:
+            result = await self._run(cmd, input, cache, timeout, on_stdout, on_stderr)
+            self.last_result = result
+            if result.stdout:
+                if verbose:
+                    print(result.stdout)
+                outputs.append(result.stdout)
+            if result.stderr and verbose:
+                print(result.stderr)
+            if not ignore_errors:
+                if result.returncode != 0:
+                    print(result.stderr)
+                result.check_returncode()
+            if exit_on_first_error and result.returncode != 0:
+                break
+
+        return "\n".join(outputs)
+
+    async def _run(
+        self,
+        cmd: str,
+        input: Optional[str],
+        cache: bool,
+        timeout: Optional[float],
+        on_stdout: Optional[Callable[[str], None]],
+        on_stderr: Optional[Callable[[str], None]],
+    ) -> CompletedProcess:
+        started = time.time(), time.perf_counter()
+        key = None
+        if self.cache is not None and cache:
+            key = self.cache.key(cmd, input, self.env_vars, self._cwd)
+            stdout = self.cache.get(key)
+            if stdout is not None:
+                log.debug(f"cached: '{cmd}'")
+                self._record(cmd, started, 0, stdout_bytes=output_size(stdout), stderr_bytes=0, cached=True)
+                return CompletedProcess(shlex.split(cmd), 0, stdout, "")
+
+        log.debug(f"run: '{cmd}'")
+        args = shlex.split(cmd)
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            stdin=subprocess.PIPE if input is not None else None,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=self.env_vars,
+            cwd=self._cwd,
+            limit=LINE_LIMIT,
+            # the command leads a process group, which is killed as a whole
+            start_new_session=True,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(
+                _communicate(process, input, on_stdout, on_stderr), timeout
+            )
+        except asyncio.TimeoutError:
+            await _kill(process)
+            self._record(cmd, started, None)
+            raise subprocess.TimeoutExpired(args, timeout) from None
+        except BaseException:
+            # cancelled, the child must not outlive the task
+            await _kill(process)
+            self._record(cmd, started, None)
+            raise
+        result = CompletedProcess(args, process.returncode, stdout, stderr)
+        self._record(cmd, started, result.returncode, stdout_bytes=output_size(stdout), stderr_bytes=output_size(stderr))
+
+        if key is not None and result.returncode == 0:
+            self.cache.put(key, result.stdout)
+        elif self.cache is not None and not cache:
+            self.cache.invalidate_after(cmd)
+        return result
+
+    def _record(self, cmd: str, started: tuple[float, float], returncode: Optional[int], **fields):
+        hooks = [*HOOKS, *self.hooks]
+        if not hooks:
+            return
+        start, counter = started
+        emit(hooks, CommandRecord(cmd, start, time.perf_counter() - counter, returncode, **fields))
+
+
+async def _communicate(
+    process: asyncio.subprocess.Process,
+    input: Optional[str],
+    on_stdout: Optional[Callable[[str], None]],
+    on_stderr: Optional[Callable[[str], None]],
+) -> tuple[str, str]:
+    async def write_input():
+        if input is None:
+            return
+        process.stdin.write(input.encode())
+        try:
+            await process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # the command doesn't read its input, like subprocess.run it isn't an error
+            pass
+        process.stdin.close()
+
+    _, stdout, stderr = await asyncio.gather(
+        write_input(),
+        _read(process.stdout, on_stdout),
+        _read(process.stderr, on_stderr),
+    )
+    await process.wait()
+    return stdout, stderr
+
+
+async def _read(stream: asyncio.StreamReader, on_line: Optional[Callable[[str], None]]) -> str:
+    if on_line is None:
+        return (await stream.read()).decode()
+    lines = []
+    while True:
+        line = await stream.readline()
+        if not line:
+            break
+        text = line.decode()
+        lines.append(text)
+        on_line(text.rstrip("\r\n"))
+    return "".join(lines)
+
+
+async def _kill(process: asyncio.subprocess.Process):
+    """kill the command and processes it started, waiting for it returns once they closed its output"""
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(process.pid, signal.SIGKILL)
+        elif process.returncode is None:
+            process.kill()
+    except ProcessLookupError:
+        pass
+    await process.wait()
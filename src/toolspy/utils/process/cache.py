@@ -0,0 +1,163 @@
+"""
+cache of outputs of read-only commands and API reads
+
+a command is cached only if it is run with `Env.run(..., cache=True)`,
+its output is reused while it is younger than TTL for the same command, input,
+cwd and values of env vars which select the target (KUBECONFIG by default).
+Reads of `toolspy.toolbox.k8s.client.K8sClient` made with `cache=True` are kept the same way by the server and request.
+Both use `DEFAULT_CACHE`, so any change invalidates all of it: a mutating command (`kubectl apply`, `scale`, ...)
+run through `Env` and every patch, apply and delete of the client.
+
+    TOOLSPY_COMMAND_CACHE_TTL  seconds outputs are kept by the default cache, it is off if not set
+    TOOLSPY_COMMAND_CACHE_DIR  folder to keep outputs across runs, they are kept in memory only if not set
+"""
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, Optional
+import hashlib
+import json
+import os
+import shlex
+import tempfile
+import threading
+import time
+import logging
+
+log = logging.getLogger(__name__)
+
+DEFAULT_ENV_KEYS = ("KUBECONFIG",)
+# words of commands which change what read-only commands return
+MUTATING_WORDS = frozenset([
+    "annotate",
+    "apply",
+    "create",
+    "delete",
+    "delete-context",
+    "edit",
+    "label",
+    "patch",
+    "rename-context",
+    "replace",
+    "rollout",
+    "scale",
+    "set",
+    "set-context",
+    "taint",
+    "use-context",
+])
+
+
+class CommandCache:
+    def __init__(
+        self,
+        ttl: float = 30.0,
+        max_entries: int = 256,
+        path: Path = None,
+        env_keys: Iterable[str] = DEFAULT_ENV_KEYS,
+    ):
+        """
+        Args:
+            ttl: seconds an output is reused
+            max_entries: least recently used outputs are evicted above it
+            path: folder to keep outputs across runs
+            env_keys: env vars which are a part of the key
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self.env_keys = tuple(env_keys)
+        # key: (expiration time, stdout)
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        # commands run in parallel use the cache from several threads
+        self._lock = threading.RLock()
+
+    def key(self, cmd: str, input: Optional[str], env_vars: dict[str, str], cwd: Path) -> str:
+        env = {name: env_vars.get(name) for name in self.env_keys}
+        content = json.dumps([cmd, input, env, str(cwd)])
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None and self.path:
+            entry = self._load(key)
+            if entry is not None:
+                self._entries[key] = entry
+        if entry is None:
+            return None
+        expires, stdout = entry
+        if expires < time.time():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return stdout
+
+    def put(self, key: str, stdout: str):
+        with self._lock:
+            self._put(key, stdout)
+
+    def _put(self, key: str, stdout: str):
+        entry = (time.time() + self.ttl, stdout)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            oldest, _ = self._entries.popitem(last=False)
+            self._remove(oldest)
+        if self.path:
+            self._save(key, entry)
+
+    def invalidate(self):
+        """forget all outputs, e.g. after a command changed the state they describe"""
+        with self._lock:
+            self._entries.clear()
+            if self.path and self.path.exists():
+                for entry_path in self.path.glob("*.json"):
+                    entry_path.unlink(missing_ok=True)
+
+    def invalidate_after(self, cmd: str):
+        """invalidate if the command is a mutating one"""
+        if MUTATING_WORDS.intersection(shlex.split(cmd)):
+            log.debug(f"'{cmd}' invalidates command cache")
+            self.invalidate()
+
+    def _remove(self, key: str):
+        self._entries.pop(key, None)
+        if self.path:
+            (self.path / f"{key}.json").unlink(missing_ok=True)
+
+    def _load(self, key: str) -> Optional[tuple[float, str]]:
+        try:
+            expires, stdout = json.loads((self.path / f"{key}.json").read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+        return expires, stdout
+
+    def _save(self, key: str, entry: tuple[float, str]):
+        self.path.mkdir(parents=True, exist_ok=True)
+        entry_path = self.path / f"{key}.json"
+        # unique per call, like the entries of `DownloadCache`
+        fd, tmp_path = tempfile.mkstemp(prefix=f"{key}.", suffix=".tmp", dir=self.path)
+        with os.fdopen(fd, "w") as f:
+            f.write(json.dumps(entry))
+        os.replace(tmp_path, entry_path)
+
+        # outputs of other runs are evicted too
+        entry_paths = list(self.path.glob("*.json"))
+        if len(entry_paths) > self.max_entries:
+            entry_paths.sort(key=lambda path: path.stat().st_mtime)
+            for entry_path in entry_paths[:len(entry_paths) - self.max_entries]:
+                entry_path.unlink(missing_ok=True)
+
+
+def _default_cache() -> Optional[CommandCache]:
+    ttl = float(os.environ.get("TOOLSPY_COMMAND_CACHE_TTL", 0))
+    if not ttl:
+        return None
+    path = os.environ.get("TOOLSPY_COMMAND_CACHE_DIR")
+    return CommandCache(ttl=ttl, path=Path(path).expanduser() if path else None)
+
+
+DEFAULT_CACHE = _default_cache()
@@ -1,12 +1,28 @@
 import subprocess
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
 from pathlib import Path
+from typing import Callable, Iterator, Optional, TextIO
 import shlex
+import signal
 from subprocess import CompletedProcess
+import threading
+import time
 import logging
 
+from toolspy.utils.process.cache import CommandCache, DEFAULT_CACHE
+from toolspy.utils.process.instrument import HOOKS, CommandRecord, Hook, emit, output_size, usage, wait
+
 log = logging.getLogger(__name__)
 
+# stderr of streamed commands is kept up to this number of last lines
+STDERR_TAIL_LINES = 1000
+# `Popen.kill` sends it, the returncode of a killed process is its negative
+_SIGKILL = getattr(signal, "SIGKILL", 9)
+
 
 class Env:
     _cwd: Path
@@ -15,6 +31,11 @@ class Env:
         self.env_vars = {**os.environ, **kwargs}
         self._cwd = Path().absolute()
         self.last_result: CompletedProcess = None
+        self.results: list[Optional[CompletedProcess]] = []
+        # outputs of commands run with `cache=True` are reused, off unless set
+        self.cache: CommandCache = DEFAULT_CACHE
+        # called with `CommandRecord` of every command, after global `instrument.HOOKS`
+        self.hooks: list[Hook] = []
 
     @property
     def cwd(self) -> Path:
@@ -31,44 +52,289 @@ class Env:
         ignore_errors=None,
         exit_on_first_error=False,
         verbose=False,
+        cache=False,
+        parallel=False,
+        max_workers: int = None,
     ):
-        stdout = ""
-        for cmd in cmds:
-            log.debug(f"run: '{cmd}'")
-            result = subprocess.run(
-                shlex.split(cmd),
-                input=input,
-                encoding="utf-8",
-                capture_output=True,
-                env=self.env_vars,
-                cwd=self._cwd,
-            )
-            self.last_result = result
-            if result.stdout:
-                if verbose:
-                    print(result.stdout)
-                if stdout:
-                    stdout += "\n"
-                stdout += result.stdout
-            if result.stderr and verbose:
-                print(result.stderr)
-            if not ignore_errors:
-                if result.returncode != 0:
+        """
+        run commands and return their joined stdout
+
+        Args:
+            cache: commands are read-only, their outputs may be taken from `self.cache`
+            parallel: commands are independent and run concurrently, outputs are still in their order.
+                A failed command cancels the others if errors aren't ignored or `exit_on_first_error` is set
+            max_workers: number of commands running at the same time in parallel mode,
+                the default of `ThreadPoolExecutor` if not set
+
+        `self.results` gets CompletedProcess of every command, None for commands which didn't run
+        """
+        self.results = []
+        outputs = []
+        if parallel and len(cmds) > 1:
+            stop_on_error = exit_on_first_error or not ignore_errors
+            results = self._run_parallel(cmds, input, cache, max_workers, stop_on_error)
+        else:
+            results = (self._run(cmd, input, cache) for cmd in cmds)
+
+        try:
+            for result in results:
+                self.results.append(result)
+                if result is None:
+                    continue
+                self.last_result = result
+                if result.stdout:
+                    if verbose:
+                        print(result.stdout)
+                    outputs.append(result.stdout)
+                if result.stderr and verbose:
                     print(result.stderr)
-                result.check_returncode()
-            if exit_on_first_error and result.returncode != 0:
-                break
+                if not ignore_errors:
+                    if result.returncode != 0:
+                        print(result.stderr)
+                    result.check_returncode()
+                if exit_on_first_error and result.returncode != 0:
+                    break
+        finally:
+            if isinstance(results, list):
+                # parallel commands are all done, the ones after a failure keep their results too
+                self.results = results
+            else:
+                self.results += [None] * (len(cmds) - len(self.results))
+
+        return "\n".join(outputs)
+
+    def _run_parallel(
+        self,
+        cmds: tuple[str, ...],
+        input: Optional[str],
+        cache: bool,
+        max_workers: Optional[int],
+        stop_on_error: bool,
+    ) -> list[Optional[CompletedProcess]]:
+        cancellation = _Cancellation()
+
+        def run(cmd: str) -> Optional[CompletedProcess]:
+            result = self._run(cmd, input, cache, cancellation)
+            if stop_on_error and result is not None and result.returncode != 0:
+                cancellation.cancel()
+            return result
 
-        return stdout
+        with ThreadPoolExecutor(max_workers) as executor:
+            return list(executor.map(run, cmds))
+
+    def _run(
+        self,
+        cmd: str,
+        input: Optional[str],
+        cache: bool,
+        cancellation: "_Cancellation" = None,
+    ) -> Optional[CompletedProcess]:
+        """CompletedProcess of the command, None if it is cancelled"""
+        started = time.time(), time.perf_counter()
+        key = None
+        if self.cache is not None and cache:
+            key = self.cache.key(cmd, input, self.env_vars, self._cwd)
+            stdout = self.cache.get(key)
+            if stdout is not None:
+                log.debug(f"cached: '{cmd}'")
+                self._record(cmd, started, 0, stdout_bytes=output_size(stdout), stderr_bytes=0, cached=True)
+                return CompletedProcess(shlex.split(cmd), 0, stdout, "")
+
+        log.debug(f"run: '{cmd}'")
+        args = shlex.split(cmd)
+        popen = partial(
+            subprocess.Popen,
+            args,
+            stdin=subprocess.PIPE if input is not None else None,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            encoding="utf-8",
+            env=self.env_vars,
+            cwd=self._cwd,
+        )
+        process = cancellation.start(popen) if cancellation else popen()
+        if process is None:
+            return None
+        with process:
+            try:
+                stdout, stderr = _communicate(process, input)
+                rusage = wait(process)
+            except BaseException:
+                process.kill()
+                raise
+            finally:
+                if cancellation:
+                    cancellation.finish(process)
+        killed = cancellation and cancellation.is_killed(process)
+        self._record(
+            cmd,
+            started,
+            None if killed else process.returncode,
+            stdout_bytes=output_size(stdout),
+            stderr_bytes=output_size(stderr),
+            **usage(rusage),
+        )
+        if killed:
+            return None
+        result = CompletedProcess(args, process.returncode, stdout, stderr)
+
+        if key is not None and result.returncode == 0:
+            self.cache.put(key, result.stdout)
+        elif self.cache is not None and not cache:
+            self.cache.invalidate_after(cmd)
+        return result
+
+    @contextmanager
+    def open(self, cmd: str, input: str = None, ignore_errors=None) -> Iterator[TextIO]:
+        """
+        run command and give its stdout as a file, so it's read incrementally with bounded memory,
+        e.g. by lines with `for line in stdout` or by chunks with `stdout.read(size)`
+
+        the command is killed if the block raises, output which isn't read is dropped.
+        Only the tail of stderr is kept for `self.last_result`, which has no stdout
+        """
+        log.debug(f"run: '{cmd}'")
+        started = time.time(), time.perf_counter()
+        args = shlex.split(cmd)
+        process = subprocess.Popen(
+            args,
+            stdin=subprocess.PIPE if input is not None else None,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            encoding="utf-8",
+            env=self.env_vars,
+            cwd=self._cwd,
+        )
+        # stderr and input are handled by threads, so the command never blocks on them
+        stderr_tail: deque[str] = deque(maxlen=STDERR_TAIL_LINES)
+        threads = [threading.Thread(target=stderr_tail.extend, args=(process.stderr,), daemon=True)]
+        if input is not None:
+            threads.append(threading.Thread(target=_write_input, args=(process.stdin, input), daemon=True))
+        for thread in threads:
+            thread.start()
+
+        try:
+            yield process.stdout
+        except BaseException:
+            process.kill()
+            raise
+        finally:
+            # the command stops on SIGPIPE if it has more to print
+            process.stdout.close()
+            rusage = wait(process)
+            returncode = process.returncode
+            for thread in threads:
+                thread.join()
+            process.stderr.close()
+            result = CompletedProcess(args, returncode, None, "".join(stderr_tail))
+            self.last_result = result
+            self._record(
+                cmd, started, returncode, stderr_bytes=output_size(result.stderr), **usage(rusage)
+            )
+
+        if returncode == -getattr(signal, "SIGPIPE", 0):
+            return
+        if not ignore_errors:
+            if result.returncode != 0:
+                print(result.stderr)
+            result.check_returncode()
 
     def run_non_block(
         self, cmd: str, ignore_errors=None, exit_on_first_error=False, verbose=False
     ):
         log.debug(f"run: '{cmd}'")
+        started = time.time(), time.perf_counter()
         p = subprocess.Popen(
             shlex.split(cmd),
             encoding="utf-8",
             env=self.env_vars,
             cwd=self._cwd,
         )
+        if HOOKS or self.hooks:
+            # output isn't captured, the record is made once the process exits.
+            # It's waited for by `Popen.wait`, which is safe along with `poll` of the caller,
+            # so the record has no resource usage
+            def record():
+                p.wait()
+                self._record(cmd, started, p.returncode)
+
+            threading.Thread(target=record, daemon=True).start()
         return p
+
+    def _record(self, cmd: str, started: tuple[float, float], returncode: Optional[int], **fields):
+        """pass record of the command to hooks, `started` is its time.time() and time.perf_counter()"""
+        hooks = [*HOOKS, *self.hooks]
+        if not hooks:
+            return
+        start, counter = started
+        record = CommandRecord(cmd, start, time.perf_counter() - counter, returncode, **fields)
+        emit(hooks, record)
+
+
+def _communicate(process: subprocess.Popen, input: Optional[str]) -> tuple[str, str]:
+    """
+    stdout and stderr of the process, which is read until they are closed
+    like by `Popen.communicate`, but the process isn't reaped, see `instrument.wait`
+    """
+    stderr: list[str] = []
+    threads = [threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)]
+    if input is not None:
+        threads.append(threading.Thread(target=_write_input, args=(process.stdin, input), daemon=True))
+    for thread in threads:
+        thread.start()
+    try:
+        stdout = process.stdout.read()
+    finally:
+        for thread in threads:
+            thread.join()
+        process.stdout.close()
+        process.stderr.close()
+    return stdout, stderr[0]
+
+
+def _write_input(stdin: TextIO, input: str):
+    try:
+        stdin.write(input)
+        stdin.close()
+    except BrokenPipeError:
+        # the command doesn't read its input, like subprocess.run it isn't an error
+        pass
+
+
+class _Cancellation:
+    """processes of commands running in parallel, which are killed together"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._running: set[subprocess.Popen] = set()
+        self._killed: set[subprocess.Popen] = set()
+        self.cancelled = False
+
+    def start(self, popen: Callable[[], subprocess.Popen]) -> Optional[subprocess.Popen]:
+        """started process, None if commands are cancelled already"""
+        with self._lock:
+            if self.cancelled:
+                return None
+            process = popen()
+            self._running.add(process)
+            return process
+
+    def finish(self, process: subprocess.Popen):
+        with self._lock:
+            self._running.discard(process)
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            for process in self._running:
+                if process.returncode is None:
+                    process.kill()
+                    self._killed.add(process)
+
+    def is_killed(self, process: subprocess.Popen) -> bool:
+        """
+        the process is killed by `cancel`, a process which exited before the signal
+        keeps its own status and its result
+        """
+        with self._lock:
+            return process in self._killed and process.returncode == -_SIGKILL
@@ -0,0 +1,178 @@
+"""
+instrumentation of commands run by `Env` and `AsyncEnv`
+
+every finished command is passed as `CommandRecord` to hooks of its env and to global `HOOKS`,
+`Collector` is a hook which keeps records to print a summary or to dump them:
+
+    collector = Collector()
+    HOOKS.append(collector)
+    ...
+    print(collector.summary())
+    collector.dump_chrome_trace(Path("trace.json"))  # open in ui.perfetto.dev or chrome://tracing
+
+    TOOLSPY_TRACE  file to write Chrome trace of all commands to at exit
+"""
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+import atexit
+import json
+import os
+import subprocess
+import sys
+import threading
+import logging
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class CommandRecord:
+    """
+    Args:
+        start: unix time the command started
+        duration: seconds
+        returncode: None if the command didn't finish, e.g. it was killed
+        user_time, system_time: CPU seconds of the command, None if unknown
+        max_rss: peak resident memory of the command in bytes, None if unknown
+        cached: output is taken from the command cache, the command didn't run
+    """
+    cmd: str
+    start: float
+    duration: float
+    returncode: Optional[int]
+    stdout_bytes: Optional[int] = None
+    stderr_bytes: Optional[int] = None
+    user_time: Optional[float] = None
+    system_time: Optional[float] = None
+    max_rss: Optional[int] = None
+    cached: bool = False
+    thread: int = field(default_factory=threading.get_ident)
+
+
+Hook = Callable[[CommandRecord], None]
+
+# hooks of all envs
+HOOKS: list[Hook] = []
+
+
+def emit(hooks: Iterable[Hook], record: CommandRecord):
+    for hook in hooks:
+        try:
+            hook(record)
+        except Exception:
+            # instrumentation never breaks commands
+            log.exception(f"command hook {hook!r} failed")
+
+
+def output_size(output: Optional[str]) -> Optional[int]:
+    return None if output is None else len(output.encode("utf-8", errors="replace"))
+
+
+def wait(process: subprocess.Popen):
+    """
+    wait for the process and return its resource usage, None if it's unknown
+
+    the process is reaped by `os.wait4` and its returncode is set like by `Popen.wait`,
+    it must not be polled or waited for by other threads meanwhile
+    """
+    if process.returncode is None and hasattr(os, "wait4"):
+        try:
+            _, status, rusage = os.wait4(process.pid, 0)
+        except ChildProcessError:
+            # reaped meanwhile, e.g. by `poll` of `Popen.kill`, which knows the returncode
+            pass
+        else:
+            process.returncode = os.waitstatus_to_exitcode(status)
+            return rusage
+    process.wait()
+    return None
+
+
+def usage(rusage) -> dict:
+    """CommandRecord fields of resource usage"""
+    if rusage is None:
+        return {}
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    max_rss = rusage.ru_maxrss if sys.platform == "darwin" else rusage.ru_maxrss * 1024
+    return {"user_time": rusage.ru_utime, "system_time": rusage.ru_stime, "max_rss": max_rss}
+
+
+class Collector:
+    """hook which keeps all records"""
+
+    def __init__(self):
+        self.records: list[CommandRecord] = []
+        self._lock = threading.Lock()
+
+    def __call__(self, record: CommandRecord):
+        with self._lock:
+            self.records.append(record)
+
+    def summary(self, limit: int = 20, key: Callable[[CommandRecord], str] = None) -> str:
+        """
+        table of commands which took the most time
+
+        Args:
+            limit: number of rows
+            key: groups records, by the command line by default
+        """
+        key = key or (lambda record: record.cmd)
+        groups: dict[str, list[CommandRecord]] = {}
+        for record in list(self.records):
+            groups.setdefault(key(record), []).append(record)
+
+        rows = []
+        for name, records in groups.items():
+            total = sum(record.duration for record in records)
+            cpu = sum((record.user_time or 0) + (record.system_time or 0) for record in records)
+            max_rss = max((record.max_rss or 0 for record in records), default=0)
+            output = sum(record.stdout_bytes or 0 for record in records)
+            failed = sum(1 for record in records if record.returncode != 0)
+            rows.append((total, name, len(records), failed, max(record.duration for record in records), cpu, max_rss, output))
+        rows.sort(reverse=True)
+
+        header = f"{'total s':>9} {'count':>6} {'failed':>6} {'max s':>8} {'cpu s':>8} {'rss MiB':>8} {'out KiB':>9}  command"
+        lines = [header]
+        for total, name, count, failed, longest, cpu, max_rss, output in rows[:limit]:
+            lines.append(
+                f"{total:9.3f} {count:6} {failed:6} {longest:8.3f} {cpu:8.3f} "
+                f"{max_rss / 1024 ** 2:8.1f} {output / 1024:9.1f}  {name}"
+            )
+        if len(rows) > limit:
+            lines.append(f"... {len(rows) - limit} more")
+        return "\n".join(lines)
+
+    def dump_json(self, path: Path):
+        path.write_text(json.dumps([asdict(record) for record in self.records], indent=1))
+
+    def dump_chrome_trace(self, path: Path):
+        """Chrome trace event format, every command is a complete event on the thread which ran it"""
+        pid = os.getpid()
+        events = []
+        for record in list(self.records):
+            args = asdict(record)
+            del args["cmd"], args["start"], args["duration"], args["thread"]
+            events.append({
+                "name": record.cmd,
+                "cat": "cached" if record.cached else "command",
+                "ph": "X",
+                "ts": record.start * 1e6,
+                "dur": record.duration * 1e6,
+                "pid": pid,
+                "tid": record.thread,
+                "args": args,
+            })
+        path.write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}))
+
+
+def _trace_from_environ():
+    path = os.environ.get("TOOLSPY_TRACE")
+    if not path:
+        return
+    collector = Collector()
+    HOOKS.append(collector)
+    atexit.register(collector.dump_chrome_trace, Path(path).expanduser())
+
+
+_trace_from_environ()
@@ -1,5 +1,18 @@
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Callable, Iterable, Any, Tuple, List
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from collections import deque
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from functools import partial
+from time import perf_counter
+from typing import Callable, Iterable, Iterator, Any, Optional, Tuple, List, Dict, Set
+import os
 import traceback
 
 
@@ -26,17 +39,289 @@ def run_in_parallel(
         
         results = run_in_parallel([partial(task, 1), partial(task, 2)])
         # Returns ([1, 4], [])
+
+    see `iter_in_parallel` to keep the link between tasks and their results
     """
     
     results = []
     exceptions = []
-    
-    with ThreadPoolExecutor(max_workers) as executor:
-        futures = [executor.submit(task) for task in tasks]
-        for future in as_completed(futures):
+
+    for task in iter_in_parallel(_call, tasks, max_workers):
+        if task.ok:
+            results.append(task.result)
+        else:
+            exceptions.append("".join(traceback.format_exception(type(task.error), task.error, task.error.__traceback__)))
+
+    return results, exceptions
+
+
+@dataclass
+class TaskResult:
+    """
+    Args:
+        item: input of the task
+        index: position of the item in the input
+        error: exception raised by the task, `TimeoutError` if it didn't finish in time
+        duration: seconds the task ran, the time it waited for if it timed out
+    """
+    item: Any
+    index: int
+    result: Any = None
+    error: Optional[BaseException] = None
+    duration: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def get(self) -> Any:
+        """result of the task, its exception is raised if it failed"""
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def iter_in_parallel(
+    function: Callable[[Any], Any],
+    items: Iterable[Any],
+    max_workers: int = None,
+    ordered: bool = False,
+    timeout: float = None,
+    task_timeout: float = None,
+    max_in_flight: int = None,
+    processes: bool = False,
+    fail_fast: bool = False,
+) -> Iterator[TaskResult]:
+    """
+    Call function with every item in parallel and yield TaskResult of every call as it is done.
+
+    Items are taken lazily, no more than `max_in_flight` calls are submitted at once,
+    so a huge or endless iterable isn't materialized and a slow consumer holds back submission.
+
+    Args:
+        function: called with an item, it must be picklable with items if `processes` is set
+        max_workers: Maximum number of worker threads (or processes)
+        ordered: yield results in the order of items, otherwise in the order of completion
+        timeout: seconds for all calls, submitted calls which aren't done then are yielded as timed out
+            and the remaining items are not called
+        task_timeout: seconds for every call, a timed out call is yielded with `TimeoutError`.
+            Threads and processes can't be interrupted, so its worker is busy until the call returns
+        max_in_flight: number of calls submitted at once, twice the number of workers by default.
+            With `task_timeout` it's the number of workers, so a call starts as soon as it is submitted
+        processes: call function in a process pool, for CPU bound work
+        fail_fast: after the first failed call the remaining items are not called,
+            calls which aren't started are cancelled and the running ones are still yielded
+
+    Example:
+        for task in iter_in_parallel(check, configs, ordered=True, task_timeout=30):
+            print(task.item, task.result if task.ok else task.error)
+    """
+    if processes:
+        workers = max_workers or os.cpu_count() or 1
+        executor: Executor = ProcessPoolExecutor(workers)
+    else:
+        # the default of ThreadPoolExecutor
+        workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        executor = ThreadPoolExecutor(workers)
+    if task_timeout is not None:
+        max_in_flight = workers
+    max_in_flight = max_in_flight or workers * 2
+    deadline = None if timeout is None else perf_counter() + timeout
+
+    items = enumerate(items)
+    running: Dict[Future, Tuple[int, Any, float]] = {}
+    # timed out calls which still occupy workers
+    abandoned: Set[Future] = set()
+    # indexes of submitted items in order, and results waiting for their turn in ordered mode
+    order: deque = deque()
+    done: Dict[int, TaskResult] = {}
+    stopped = False
+    exhausted = False
+
+    def submit():
+        nonlocal exhausted
+        while not exhausted and len(running) + len(abandoned) < max_in_flight:
             try:
-                results.append(future.result())
-            except Exception:
-                exceptions.append(traceback.format_exc())
+                index, item = next(items)
+            except StopIteration:
+                exhausted = True
+                return
+            future = executor.submit(_timed, partial(function, item))
+            running[future] = index, item, perf_counter()
+            order.append(index)
+
+    def stop():
+        nonlocal stopped
+        stopped = True
+        for future in list(running):
+            if future.cancel():
+                index, _, _ = running.pop(future)
+                order.remove(index)
+
+    def finish(result: TaskResult):
+        done[result.index] = result
+        if fail_fast and result.error is not None and not stopped:
+            stop()
+
+    def ready() -> Iterator[TaskResult]:
+        if ordered:
+            while order and order[0] in done:
+                yield done.pop(order.popleft())
+        else:
+            for index in list(done):
+                order.remove(index)
+                yield done.pop(index)
+
+    try:
+        submit()
+        # calls which timed out hold their workers, so new ones wait for them
+        while running or (abandoned and not stopped and not exhausted):
+            now = perf_counter()
+            wakeups = [] if deadline is None else [deadline]
+            if task_timeout is not None:
+                wakeups += [started + task_timeout for _, _, started in running.values()]
+            wait_timeout = max(min(wakeups) - now, 0) if wakeups else None
+            completed, _ = wait(list(running) + list(abandoned), wait_timeout, FIRST_COMPLETED)
+            abandoned -= completed
+
+            now = perf_counter()
+            for future in list(running):
+                if future not in running:
+                    # cancelled by fail_fast
+                    continue
+                index, item, started = running[future]
+                if future in completed:
+                    del running[future]
+                    try:
+                        result, duration = future.result()
+                    except Exception as e:
+                        finish(TaskResult(item, index, error=e, duration=now - started))
+                    else:
+                        finish(TaskResult(item, index, result, duration=duration))
+                elif deadline is not None and now >= deadline:
+                    if not future.cancel():
+                        abandoned.add(future)
+                    del running[future]
+                    error = TimeoutError(f"calls didn't finish within {timeout} s")
+                    finish(TaskResult(item, index, error=error, duration=now - started))
+                    stopped = True
+                elif task_timeout is not None and now >= started + task_timeout:
+                    abandoned.add(future)
+                    del running[future]
+                    error = TimeoutError(f"call didn't finish within {task_timeout} s")
+                    finish(TaskResult(item, index, error=error, duration=now - started))
+
+            yield from ready()
+            if not stopped:
+                submit()
+        yield from ready()
+    finally:
+        for future in running:
+            future.cancel()
+        # abandoned calls aren't waited for, a consumer which stopped early doesn't wait for the running ones
+        executor.shutdown(wait=not abandoned and not running, cancel_futures=True)
+
+
+def _call(task: Callable) -> Any:
+    return task()
+
+@dataclass
+class GraphResult:
+    results: Dict[str, Any] = field(default_factory=dict)
+    errors: Dict[str, BaseException] = field(default_factory=dict)
+    skipped: List[str] = field(default_factory=list)
+    durations: Dict[str, float] = field(default_factory=dict)
+
+
+def run_graph(
+    tasks: Dict[str, Callable],
+    dependencies: Dict[str, Iterable[str]] = None,
+    max_workers: int = None,
+    process_tasks: Iterable[str] = (),
+) -> GraphResult:
+    """
+    Execute tasks in parallel as soon as tasks they depend on are done.
+
+    Args:
+        tasks: callables by task names
+        dependencies: names of tasks each task depends on
+        max_workers: Maximum number of worker threads (and processes)
+        process_tasks: names of tasks executed in a process pool,
+            these callables must be picklable
+
+    Returns:
+        GraphResult with results, exceptions and durations by task names,
+        tasks depending on failed ones are not executed and listed as skipped
+
+    Example:
+        result = run_graph(
+            {"download": download, "unpack": unpack},
+            {"unpack": ["download"]},
+        )
+    """
+    dependencies = {name: set((dependencies or {}).get(name, ())) for name in tasks}
+    topological_order(dependencies)
+    process_tasks = set(process_tasks)
+
+    graph = GraphResult()
+    waiting = dict(dependencies)
+    running: Dict[Future, str] = {}
+
+    with ExitStack() as stack:
+        threads = stack.enter_context(ThreadPoolExecutor(max_workers))
+        processes = None
+        if process_tasks:
+            processes = stack.enter_context(ProcessPoolExecutor(max_workers))
+
+        def submit_ready():
+            changed = True
+            while changed:
+                changed = False
+                for name, task_dependencies in list(waiting.items()):
+                    if task_dependencies & (graph.errors.keys() | set(graph.skipped)):
+                        graph.skipped.append(name)
+                    elif task_dependencies <= graph.results.keys():
+                        executor = processes if name in process_tasks else threads
+                        running[executor.submit(_timed, tasks[name])] = name
+                    else:
+                        continue
+                    del waiting[name]
+                    changed = True
+
+        submit_ready()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    graph.results[name], graph.durations[name] = future.result()
+                except Exception as e:
+                    graph.errors[name] = e
+            submit_ready()
+
+    return graph
+
+
+def _timed(task: Callable) -> Tuple[Any, float]:
+    start = perf_counter()
+    result = task()
+    return result, perf_counter() - start
+
+
+def topological_order(dependencies: Dict[str, Iterable[str]]) -> List[str]:
+    """names of tasks ordered so that every task follows the tasks it depends on"""
+    pending = {name: set(task_dependencies) for name, task_dependencies in dependencies.items()}
+    for name, task_dependencies in pending.items():
+        unknown = task_dependencies - pending.keys()
+        if unknown:
+            raise ValueError(f"task '{name}' depends on unknown tasks: {', '.join(sorted(unknown))}")
 
-    return results, exceptions
\ No newline at end of file
+    order = []
+    while pending:
+        ready = [name for name, task_dependencies in pending.items() if task_dependencies <= set(order)]
+        if not ready:
+            raise ValueError(f"tasks have cyclic dependencies: {', '.join(sorted(pending))}")
+        for name in ready:
+            order.append(name)
+            del pending[name]
+    return order
@@ -0,0 +1,236 @@
+"""fake Kubernetes API server for tests of the k8s toolbox"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+import json
+import threading
+import time
+
+import pytest
+
+from toolspy.toolbox.k8s.client import BUILTIN_RESOURCES
+from toolspy.toolbox.k8s.labels import Selector
+from toolspy.utils.parsing import dump_yaml
+
+TOKEN = "t0ken"
+
+DISCOVERY = {
+    "/api": {"kind": "APIVersions", "versions": ["v1"]},
+    "/apis": {"kind": "APIGroupList", "groups": [
+        {"name": "apps", "preferredVersion": {"groupVersion": "apps/v1"}},
+        {"name": "example.com", "preferredVersion": {"groupVersion": "example.com/v1"}},
+    ]},
+    "/api/v1": {"resources": [
+        {"name": "services", "kind": "Service", "namespaced": True},
+        {"name": "endpoints", "kind": "Endpoints", "namespaced": True},
+        {"name": "pods/log", "kind": "Pod", "namespaced": True},
+    ]},
+    "/apis/apps/v1": {"resources": [{"name": "deployments", "kind": "Deployment", "namespaced": True}]},
+    "/apis/example.com/v1": {"resources": [{"name": "widgets", "kind": "Widget", "namespaced": True}]},
+}
+
+RESOURCE_NAMES = {resource.name for resource in BUILTIN_RESOURCES} | {
+    resource["name"] for group in DISCOVERY.values() for resource in group.get("resources", [])
+}
+
+
+class FakeApi:
+    """
+    objects by collection paths like `/api/v1/namespaces/default/services`
+
+    every change gets the next resourceVersion and is sent to watches,
+    a watch from a version older than `compacted` gets 410 Gone
+    """
+
+    def __init__(self):
+        self.objects: dict[str, dict[str, dict]] = {}
+        self.events: list[tuple[int, str, dict]] = []
+        self.version = 100
+        self.compacted = 0
+        # (method, path, query, headers) of every request
+        self.requests: list[tuple[str, str, dict, dict]] = []
+        self.changed = threading.Condition()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(self))
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def put(self, collection: str, obj: dict, event: str = None):
+        with self.changed:
+            self.version += 1
+            obj.setdefault("metadata", {})["resourceVersion"] = str(self.version)
+            name = obj["metadata"]["name"]
+            objects = self.objects.setdefault(collection, {})
+            event = event or ("MODIFIED" if name in objects else "ADDED")
+            if event == "DELETED":
+                objects.pop(name, None)
+            else:
+                objects[name] = obj
+            self.events.append((self.version, collection, {"type": event, "object": obj}))
+            self.changed.notify_all()
+
+    def requested(self, method: str, path: str) -> int:
+        return sum(1 for request in self.requests if request[:2] == (method, path))
+
+
+def _status(code: int, reason: str, message: str = "") -> dict:
+    return {"kind": "Status", "status": "Failure", "code": code, "reason": reason, "message": message}
+
+
+def _handler(api: FakeApi):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def send(self, code: int, body):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def parse(self):
+            url = urlsplit(self.path)
+            query = {name: values[0] for name, values in parse_qs(url.query).items()}
+            api.requests.append((self.command, url.path, query, dict(self.headers)))
+            if self.headers.get("Authorization") != f"Bearer {TOKEN}":
+                self.send(401, _status(401, "Unauthorized"))
+                return None
+            return url.path, query
+
+        def body(self):
+            return json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+
+        def do_GET(self):
+            parsed = self.parse()
+            if parsed is None:
+                return
+            path, query = parsed
+            if path == "/version":
+                return self.send(200, {"major": "1", "minor": "30", "gitVersion": "v1.30.0"})
+            if path in DISCOVERY:
+                return self.send(200, DISCOVERY[path])
+            if "watch" in query:
+                return self.watch(path, query)
+            with api.changed:
+                if path.rpartition("/")[2] in RESOURCE_NAMES:
+                    return self.list(path, query)
+                collection, _, name = path.rpartition("/")
+                obj = api.objects.get(collection, {}).get(name)
+                if obj is None:
+                    return self.send(404, _status(404, "NotFound", f'"{name}" not found'))
+                return self.send(200, obj)
+
+        def list(self, path: str, query: dict):
+            selector = Selector.parse(query.get("labelSelector", ""))
+            items = sorted(
+                (obj for obj in api.objects.get(path, {}).values() if selector.matches_object(obj)),
+                key=lambda obj: obj["metadata"]["name"],
+            )
+            start = int(query.get("continue", 0))
+            limit = int(query.get("limit", len(items) or 1))
+            metadata = {"resourceVersion": str(api.version)}
+            if start + limit < len(items):
+                metadata["continue"] = str(start + limit)
+            page = items[start:start + limit]
+            if "as=PartialObjectMetadataList" in self.headers.get("Accept", ""):
+                page = [{"kind": "PartialObjectMetadata", "metadata": obj["metadata"]} for obj in page]
+                return self.send(200, {"kind": "PartialObjectMetadataList", "metadata": metadata, "items": page})
+            self.send(200, {"kind": "List", "metadata": metadata, "items": page})
+
+        def watch(self, path: str, query: dict):
+            version = int(query.get("resourceVersion") or 0)
+            selector = Selector.parse(query.get("labelSelector", ""))
+            if version and version < api.compacted:
+                return self.send(410, _status(410, "Expired", "too old resource version"))
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            deadline = time.time() + int(query.get("timeoutSeconds", 5))
+            while time.time() < deadline:
+                with api.changed:
+                    events = [(v, e) for v, collection, e in api.events if collection == path and v > version]
+                    if not events:
+                        api.changed.wait(0.05)
+                        continue
+                version = events[-1][0]
+                for _, event in events:
+                    if not selector.matches_object(event["object"]):
+                        continue
+                    line = (json.dumps(event) + "\n").encode()
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                    self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+
+        def do_PATCH(self):
+            parsed = self.parse()
+            if parsed is None:
+                return
+            path, query = parsed
+            collection, _, name = path.rpartition("/")
+            patch = self.body()
+            content_type = self.headers["Content-Type"]
+            current = api.objects.get(collection, {}).get(name)
+            if content_type == "application/apply-patch+yaml":
+                obj = patch
+            elif current is None:
+                return self.send(404, _status(404, "NotFound", f'"{name}" not found'))
+            else:
+                obj = _merge(json.loads(json.dumps(current)), patch)
+            api.put(collection, obj)
+            self.send(200, obj)
+
+        def do_DELETE(self):
+            parsed = self.parse()
+            if parsed is None:
+                return
+            path, _ = parsed
+            collection, _, name = path.rpartition("/")
+            obj = api.objects.get(collection, {}).get(name)
+            if obj is None:
+                return self.send(404, _status(404, "NotFound", f'"{name}" not found'))
+            api.put(collection, obj, "DELETED")
+            self.send(200, obj)
+
+    return Handler
+
+
+def _merge(target: dict, patch: dict) -> dict:
+    """JSON merge patch"""
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        elif isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            target[key] = value
+    return target
+
+
+@pytest.fixture
+def fake_api():
+    api = FakeApi()
+    thread = threading.Thread(target=api.server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield api
+    api.server.shutdown()
+    api.server.server_close()
+
+
+def write_kubeconfig(path: Path, server: str, namespace: str = "default") -> Path:
+    path.write_text(dump_yaml({
+        "apiVersion": "v1",
+        "kind": "Config",
+        "current-context": "fake",
+        "contexts": [{"name": "fake", "context": {"cluster": "fake", "user": "fake", "namespace": namespace}}],
+        "clusters": [{"name": "fake", "cluster": {"server": server}}],
+        "users": [{"name": "fake", "user": {"token": TOKEN}}],
+    }))
+    return path
+
+
+@pytest.fixture
+def kubeconfig(fake_api, tmp_path) -> Path:
+    return write_kubeconfig(tmp_path / "kubeconfig", fake_api.url)
@@ -0,0 +1,116 @@
+"""archives compressed in chunks on a thread pool, read back by zipfile and gzip"""
+import gzip
+import io
+import random
+import tarfile
+import zipfile
+
+import pytest
+
+from toolspy.project.archive import CHUNK_SIZE, Compression, GzipFile, ZipArchive
+from toolspy.project.sdist import SdistWriter
+
+COMPRESSIONS = [
+    Compression(store=True),
+    Compression(level=0, workers=4),
+    Compression(level=9, workers=4),
+    Compression(level=6, workers=1),
+]
+
+
+def data(size: int, seed: int = 0) -> bytes:
+    """half random, half repeated, so chunks both compress and refer to the previous ones"""
+    noise = random.Random(seed).randbytes(size // 2)
+    return noise + (noise[:1000] * (size // 2000 + 1))[:size - len(noise)]
+
+
+def chunks(content: bytes, size: int = CHUNK_SIZE):
+    for offset in range(0, len(content), size):
+        yield content[offset:offset + size]
+
+
+MEMBERS = {
+    "empty": b"",
+    "small": b"hello",
+    "large": data(3 * CHUNK_SIZE + 12345),
+    "aligned": data(2 * CHUNK_SIZE, seed=1),
+}
+
+
+def write_zip(path, compression: Compression, members: dict = MEMBERS):
+    archive = ZipArchive(path, compression)
+    try:
+        for name, content in members.items():
+            zinfo = zipfile.ZipInfo(name, (2020, 2, 2, 0, 0, 0))
+            zinfo.file_size = len(content)
+            archive.add(zinfo, chunks(content))
+    finally:
+        archive.close()
+
+
+@pytest.mark.parametrize("compression", COMPRESSIONS, ids=repr)
+def test_zip_members_round_trip(tmp_path, compression):
+    path = tmp_path / "test.zip"
+    write_zip(path, compression)
+    with zipfile.ZipFile(path) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == list(MEMBERS)
+        for name, content in MEMBERS.items():
+            info = archive.getinfo(name)
+            assert info.compress_type == (zipfile.ZIP_STORED if compression.store else zipfile.ZIP_DEFLATED)
+            assert info.file_size == len(content)
+            assert archive.read(name) == content
+
+
+def test_deflate_compresses_and_store_does_not(tmp_path):
+    sizes = {}
+    for level, compression in [("store", Compression(store=True)), (0, Compression(level=0)), (9, Compression(level=9))]:
+        write_zip(tmp_path / f"{level}.zip", compression)
+        with zipfile.ZipFile(tmp_path / f"{level}.zip") as archive:
+            sizes[level] = archive.getinfo("large").compress_size
+    assert sizes["store"] == len(MEMBERS["large"])
+    # level 0 keeps data in raw blocks, which have a small overhead
+    assert sizes[0] > sizes["store"]
+    assert sizes[9] < 0.6 * sizes["store"]
+
+
+def test_parallel_output_is_the_same_as_serial(tmp_path):
+    write_zip(tmp_path / "serial.zip", Compression(workers=1))
+    write_zip(tmp_path / "parallel.zip", Compression(workers=4))
+    assert (tmp_path / "serial.zip").read_bytes() == (tmp_path / "parallel.zip").read_bytes()
+
+
+def test_raw_members_are_copied(tmp_path):
+    write_zip(tmp_path / "source.zip", Compression(workers=4))
+    archive = ZipArchive(tmp_path / "copy.zip", Compression(store=True))
+    with zipfile.ZipFile(tmp_path / "source.zip") as source:
+        for name in source.namelist():
+            archive.add_raw(source, name)
+        archive.close()
+    with zipfile.ZipFile(tmp_path / "copy.zip") as copy:
+        assert copy.testzip() is None
+        assert {name: copy.read(name) for name in copy.namelist()} == MEMBERS
+        assert copy.getinfo("large").compress_type == zipfile.ZIP_DEFLATED
+
+
+@pytest.mark.parametrize("compression", COMPRESSIONS, ids=repr)
+def test_gzip_round_trip(tmp_path, compression):
+    content = data(3 * CHUNK_SIZE + 7)
+    path = tmp_path / "test.gz"
+    with GzipFile(path, compression) as file:
+        # writes of any size, split across chunks
+        for part in chunks(content, 700_000):
+            file.write(part)
+    assert gzip.decompress(path.read_bytes()) == content
+
+
+def test_sdist_stream_is_valid_gzip(tmp_path):
+    large = tmp_path / "large.bin"
+    large.write_bytes(data(2 * CHUNK_SIZE + 1))
+    with SdistWriter(tmp_path / "test-1.0.tar.gz", "test-1.0", Compression(workers=4)) as writer:
+        writer.add_file(large, "large.bin")
+        writer.add_bytes("PKG-INFO", b"Name: test\n")
+    tar = gzip.decompress((tmp_path / "test-1.0.tar.gz").read_bytes())
+    with tarfile.open(fileobj=io.BytesIO(tar)) as archive:
+        assert archive.extractfile("test-1.0/large.bin").read() == large.read_bytes()
+        assert archive.extractfile("test-1.0/PKG-INFO").read() == b"Name: test\n"
@@ -0,0 +1,84 @@
+"""commands of AsyncEnv run from an event loop"""
+import asyncio
+import os
+from pathlib import Path
+import subprocess
+import time
+
+import pytest
+
+from toolspy.utils.process import AsyncEnv
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def is_running(pid: int) -> bool:
+    """the process exists and isn't a zombie waiting to be reaped"""
+    try:
+        stat = Path(f"/proc/{pid}/stat").read_text()
+    except FileNotFoundError:
+        return False
+    return stat.rsplit(")", 1)[1].split()[0] != "Z"
+
+
+def test_input_and_output():
+    env = AsyncEnv()
+    assert run(env.run("cat", input="in")) == "in"
+    assert run(env.run("sh -c 'echo out; echo err >&2; exit 3'", ignore_errors=True)) == "out\n"
+    assert (env.last_result.returncode, env.last_result.stderr) == (3, "err\n")
+    with pytest.raises(subprocess.CalledProcessError):
+        run(env.run("false"))
+
+
+def test_lines_are_streamed():
+    stdout, stderr = [], []
+
+    async def main():
+        return await AsyncEnv().run(
+            "sh -c 'echo a; echo e >&2; echo b'", on_stdout=stdout.append, on_stderr=stderr.append
+        )
+
+    assert run(main()) == "a\nb\n"
+    assert (stdout, stderr) == (["a", "b"], ["e"])
+
+
+def test_commands_run_concurrently():
+    env = AsyncEnv()
+
+    async def main():
+        return await asyncio.gather(*(env.run(f"sh -c 'sleep 0.3; echo {index}'") for index in range(5)))
+
+    started = time.perf_counter()
+    assert run(main()) == [f"{index}\n" for index in range(5)]
+    assert time.perf_counter() - started < 1.2
+
+
+@pytest.mark.skipif(not hasattr(os, "killpg"), reason="process groups are POSIX only")
+def test_timeout_kills_processes_started_by_the_command(tmp_path):
+    # the shell forks sleep, which keeps the pipes open
+    pid_file = tmp_path / "pid"
+    started = time.perf_counter()
+    with pytest.raises(subprocess.TimeoutExpired):
+        run(AsyncEnv().run(f"sh -c 'sleep 5 & echo $! > {pid_file}; wait'", timeout=0.5))
+    assert time.perf_counter() - started < 2
+    assert not is_running(int(pid_file.read_text()))
+
+
+@pytest.mark.skipif(not hasattr(os, "killpg"), reason="process groups are POSIX only")
+def test_cancelled_command_is_killed(tmp_path):
+    pid_file = tmp_path / "pid"
+
+    async def main():
+        task = asyncio.create_task(AsyncEnv().run(f"sh -c 'echo $$ > {pid_file}; sleep 5; true'"))
+        while not pid_file.exists() or not pid_file.read_text():
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    started = time.perf_counter()
+    run(main())
+    assert time.perf_counter() - started < 2
+    assert not is_running(int(pid_file.read_text()))
@@ -0,0 +1,106 @@
+"""cached builds of a project with a build script"""
+import json
+import sys
+import zipfile
+
+import pytest
+
+from toolspy.project import build
+
+PYPROJECT = """
+[project]
+name = "plat"
+version = "1.0"
+
+[tool.toolspy.build_scripts]
+gen = {}
+"""
+
+BUILD_SCRIPT = """
+def run(dirs, config):
+    dirs.data_platlib.mkdir(parents=True, exist_ok=True)
+    (dirs.data_platlib / "bin").write_bytes(dirs.platform.encode())
+"""
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    (tmp_path / "src" / "plat").mkdir(parents=True)
+    (tmp_path / "src" / "plat" / "__init__.py").write_text("")
+    (tmp_path / "tools").mkdir()
+    (tmp_path / "tools" / "gen.py").write_text(BUILD_SCRIPT)
+    (tmp_path / "pyproject.toml").write_text(PYPROJECT)
+    monkeypatch.chdir(tmp_path)
+    forget_build_script(monkeypatch)
+    return tmp_path
+
+
+def forget_build_script(monkeypatch):
+    """build scripts are imported once per process, as by a build frontend"""
+    for name in ["tools", "tools.gen"]:
+        monkeypatch.delitem(sys.modules, name, raising=False)
+
+
+def platform_output(wheel_name: str) -> bytes:
+    with zipfile.ZipFile(f"dist/{wheel_name}") as wheel:
+        return wheel.read("plat-1.0.data/platlib/bin")
+
+
+def report(project) -> dict:
+    """hits and misses of the last build"""
+    return json.loads((project / "target" / ".toolspy-cache" / "plat-1.0" / "any" / "wheel" / "report.json").read_text())
+
+
+def test_cache_is_kept_in_the_project(project):
+    build.build_wheel("dist")
+    assert [path.name for path in (project / "dist").iterdir()] == ["plat-1.0-py3-none-any.whl"]
+    assert report(project)["wheel"] == {"hit": 0, "miss": 1}
+    build.build_wheel("dist")
+    assert report(project) == {
+        "sources": {"hit": 1, "miss": 0},
+        "build scripts": {"hit": 1, "miss": 0},
+        "wheel": {"hit": 1, "miss": 0},
+    }
+
+
+def test_build_scripts_are_cached_per_platform(project):
+    for platform in ["manylinux_2_17_x86_64", "manylinux_2_17_aarch64", "manylinux_2_17_x86_64"]:
+        wheel_name = build.build_wheel("dist", {"platform": platform})
+        assert platform_output(wheel_name) == platform.encode()
+
+
+def test_changed_source_is_a_miss(project):
+    build.build_wheel("dist")
+    (project / "src" / "plat" / "__init__.py").write_text("x = 1\n")
+    wheel_name = build.build_wheel("dist")
+    assert report(project)["sources"] == {"hit": 0, "miss": 1}
+    assert report(project)["wheel"] == {"hit": 0, "miss": 1}
+    with zipfile.ZipFile(f"dist/{wheel_name}") as wheel:
+        assert wheel.read("plat-1.0.data/purelib/plat/__init__.py") == b"x = 1\n"
+
+
+def test_changed_config_settings_are_a_miss(project):
+    build.build_wheel("dist")
+    wheel_name = build.build_wheel("dist", {"compression": "store"})
+    assert report(project)["wheel"] == {"hit": 0, "miss": 1}
+    with zipfile.ZipFile(f"dist/{wheel_name}") as wheel:
+        assert {info.compress_type for info in wheel.infolist()} == {zipfile.ZIP_STORED}
+
+
+def test_changed_build_script_output_is_a_miss(project, monkeypatch):
+    build.build_wheel("dist")
+    (project / "tools" / "gen.py").write_text(BUILD_SCRIPT.replace("dirs.platform.encode()", "b'changed'"))
+    forget_build_script(monkeypatch)
+    wheel_name = build.build_wheel("dist")
+    assert report(project)["build scripts"] == {"hit": 0, "miss": 1}
+    assert report(project)["wheel"] == {"hit": 0, "miss": 1}
+    assert platform_output(wheel_name) == b"changed"
+
+
+def test_removed_build_script_output_runs_the_script_again(project):
+    build.build_wheel("dist")
+    stage = project / "target" / ".toolspy-cache" / "plat-1.0" / "any" / "wheel"
+    (next(stage.rglob("bin"))).unlink()
+    wheel_name = build.build_wheel("dist")
+    assert report(project)["build scripts"] == {"hit": 0, "miss": 1}
+    assert platform_output(wheel_name) == b"any"
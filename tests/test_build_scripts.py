@@ -0,0 +1,68 @@
+"""build scripts depending on each other"""
+import pytest
+
+from toolspy.project.project import Project
+
+PYPROJECT = """
+[project]
+name = "scripts"
+version = "1.0"
+
+[tool.toolspy.build_scripts]
+download = {}
+unpack = {depends_on = ["download"]}
+fail = {}
+after_fail = {depends_on = ["fail"]}
+"""
+
+SCRIPTS = {
+    "download": """
+def run(dirs, config):
+    dirs.wheel.mkdir(parents=True, exist_ok=True)
+    (dirs.wheel / "archive.txt").write_text("a,b")
+""",
+    "unpack": """
+def run(dirs, config):
+    archive = dirs.dependencies["download"].wheel / "archive.txt"
+    dirs.data_purelib.mkdir(parents=True)
+    for name in archive.read_text().split(","):
+        (dirs.data_purelib / name).write_text(name)
+    # sources of the project are read from the source tree
+    (dirs.data_purelib / "module").write_text((dirs.source_src / "module.py").read_text())
+""",
+    "fail": """
+def run(dirs, config):
+    raise ValueError("broken")
+""",
+    "after_fail": """
+def run(dirs, config):
+    raise AssertionError("must not run")
+""",
+}
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch) -> Project:
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "module.py").write_text("x = 1")
+    (tmp_path / "tools").mkdir()
+    for name, script in SCRIPTS.items():
+        (tmp_path / "tools" / f"{name}.py").write_text(script)
+    (tmp_path / "pyproject.toml").write_text(PYPROJECT)
+    monkeypatch.chdir(tmp_path)
+    return Project(tmp_path / "dist", tmp_path)
+
+
+def test_dependent_script_reads_output_of_its_dependency(project):
+    project.run_build_scripts(["download", "unpack"])
+    purelib = project.script_dirs("unpack").data_purelib
+    assert sorted(path.name for path in purelib.iterdir()) == ["a", "b", "module"]
+    assert (purelib / "module").read_text() == "x = 1"
+
+
+def test_dependents_of_failed_script_are_skipped(project):
+    with pytest.raises(RuntimeError, match="failed: fail, not run: after_fail") as error:
+        project.run_build_scripts(max_workers=2)
+    assert isinstance(error.value.__cause__, ValueError)
+    # independent scripts still run
+    assert (project.script_dirs("unpack").data_purelib / "a").exists()
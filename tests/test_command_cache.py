@@ -0,0 +1,86 @@
+"""CommandCache on its own and shared by Env and K8sClient"""
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+from toolspy.toolbox.k8s.client import K8sClient
+from toolspy.utils.process import Env
+from toolspy.utils.process.cache import CommandCache
+
+SERVICES = "/api/v1/namespaces/default/services"
+
+
+def test_outputs_expire():
+    cache = CommandCache(ttl=0.05)
+    cache.put("key", "output")
+    assert cache.get("key") == "output"
+    time.sleep(0.1)
+    assert cache.get("key") is None
+
+
+def test_least_recently_used_are_evicted():
+    cache = CommandCache(max_entries=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    cache.get("a")
+    cache.put("c", "3")
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == ("1", None, "3")
+
+
+def test_outputs_are_kept_across_runs(tmp_path):
+    CommandCache(path=tmp_path).put("key", "output")
+    assert CommandCache(path=tmp_path).get("key") == "output"
+    CommandCache(path=tmp_path).invalidate()
+    assert CommandCache(path=tmp_path).get("key") is None
+
+
+def test_key_has_selected_env_vars(tmp_path):
+    cache = CommandCache()
+    key = cache.key("kubectl get pods", None, {"KUBECONFIG": "a", "HOME": "x"}, tmp_path)
+    assert key == cache.key("kubectl get pods", None, {"KUBECONFIG": "a", "HOME": "y"}, tmp_path)
+    assert key != cache.key("kubectl get pods", None, {"KUBECONFIG": "b", "HOME": "x"}, tmp_path)
+
+
+def test_only_mutating_commands_invalidate():
+    cache = CommandCache()
+    cache.put("key", "output")
+    cache.invalidate_after("kubectl get pods -o json")
+    assert cache.get("key") == "output"
+    cache.invalidate_after("kubectl --namespace web scale deployment web --replicas 0")
+    assert cache.get("key") is None
+
+
+def test_env_reuses_outputs_of_read_only_commands(tmp_path):
+    counter = tmp_path / "counter"
+    env = Env()
+    env.cache = CommandCache()
+    cmd = f"sh -c 'echo x >> {counter}; wc -l < {counter}'"
+    assert env.run(cmd, cache=True) == env.run(cmd, cache=True)
+    assert counter.read_text() == "x\n"
+
+
+def test_env_and_client_invalidate_each_other(kubeconfig, fake_api):
+    cache = CommandCache()
+    env = Env()
+    env.cache = cache
+    client = K8sClient.from_kubeconfig(kubeconfig)
+    client.cache = cache
+
+    client.list("services", cache=True)
+    env.run("echo scale", cache=True)
+    assert cache.get(cache.key("echo scale", None, env.env_vars, env.cwd)) == "scale\n"
+    # a mutating command run through the env
+    env.run("true scale")
+    client.list("services", cache=True)
+    assert fake_api.requested("GET", SERVICES) == 2
+
+    env.run("echo scale", cache=True)
+    client.apply({"apiVersion": "v1", "kind": "Service", "metadata": {"name": "web"}})
+    assert cache.get(cache.key("echo scale", None, env.env_vars, env.cwd)) is None
+
+
+def test_concurrent_saves_of_same_output(tmp_path):
+    cache = CommandCache(path=tmp_path)
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(lambda index: cache._save("key", (time.time() + 60, str(index))), range(200)))
+    assert CommandCache(path=tmp_path).get("key") is not None
+    assert list(tmp_path.glob("*.tmp")) == []
@@ -0,0 +1,64 @@
+"""several clusters, their deployments stored and scaled through fan_out and their cleanup"""
+import threading
+
+import pytest
+
+from conftest import FakeApi, write_kubeconfig
+from toolspy.toolbox.k8s import cluster, config, deployments
+from toolspy.utils.parsing import dump_yaml, load_yaml
+
+DEPLOYMENTS = "/apis/apps/v1/namespaces/default/deployments"
+
+
+@pytest.fixture
+def clusters(fake_api, tmp_path, monkeypatch):
+    """two clusters named `a` and `b`, found in `tmp_path` like kubeconfigs in `~/.kube`"""
+    other_api = FakeApi()
+    threading.Thread(target=other_api.server.serve_forever, args=(0.05,), daemon=True).start()
+    write_kubeconfig(tmp_path / "a", fake_api.url)
+    write_kubeconfig(tmp_path / "b", other_api.url)
+    monkeypatch.setattr(config, "FOLDERS_TO_SEARCH", [tmp_path])
+    monkeypatch.setattr(deployments, "DEPLOYMENTS_PATH", tmp_path / "deployments.yaml")
+    fake_api.put(DEPLOYMENTS, {"metadata": {"name": "web"}, "spec": {"replicas": 2}})
+    other_api.put(DEPLOYMENTS, {"metadata": {"name": "web"}, "spec": {"replicas": 5}})
+    other_api.put(DEPLOYMENTS, {"metadata": {"name": "worker"}, "spec": {"replicas": 1}})
+    yield {"a": fake_api, "b": other_api}
+    other_api.server.shutdown()
+    other_api.server.server_close()
+
+
+def replicas(api) -> dict:
+    return {name: obj["spec"]["replicas"] for name, obj in api.objects[DEPLOYMENTS].items()}
+
+
+def test_clusters_are_stored_and_scaled_separately(clusters):
+    assert cluster.select("a,b") == [config.K8sConfig.find("a"), config.K8sConfig.find("b")]
+
+    assert cluster.fan_out(deployments.store, "default", clusters="a,b").ok
+    assert load_yaml(deployments.DEPLOYMENTS_PATH.read_text()) == {
+        "a": {"default": {"web": 2}},
+        "b": {"default": {"web": 5, "worker": 1}},
+    }
+
+    assert cluster.fan_out(deployments.scale_down, "default", clusters="a,b").ok
+    assert (replicas(clusters["a"]), replicas(clusters["b"])) == ({"web": 0}, {"web": 0, "worker": 0})
+
+    assert cluster.fan_out(deployments.scale_up, "default", clusters="a,b").ok
+    assert (replicas(clusters["a"]), replicas(clusters["b"])) == ({"web": 2}, {"web": 5, "worker": 1})
+
+
+def test_replicas_stored_by_namespace_only_are_scaled_up(clusters):
+    deployments.DEPLOYMENTS_PATH.write_text(dump_yaml({"default": {"web": 3}}))
+    deployments.scale_up("a", "default")
+    assert replicas(clusters["a"]) == {"web": 3}
+
+
+def test_cleanup_offers_unavailable_and_broken_clusters(clusters, tmp_path, monkeypatch, capsys):
+    (tmp_path / "broken").write_text("apiVersion: v1\nkind: Config\n")
+    write_kubeconfig(tmp_path / "down", "http://127.0.0.1:9")
+    monkeypatch.setattr(config, "KUBECONFIG_DIR", tmp_path)
+    monkeypatch.setattr("builtins.input", lambda prompt: "n")
+
+    cluster.cleanup(timeout=2)
+    offered = capsys.readouterr().out.split(":", 1)[1].split()
+    assert offered == ["broken", "down"]
@@ -0,0 +1,147 @@
+"""DownloadCache against a local HTTP server"""
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hashlib
+import threading
+import time
+
+import httpx
+import pytest
+
+from toolspy.utils.downloads import DownloadCache
+
+CONTENT = bytes(range(256)) * 4096
+ETAG = '"v1"'
+
+
+class Handler(BaseHTTPRequestHandler):
+    # set by the test to change behaviour of the server
+    requests: list = []
+    chunk_delay = 0.0
+    always_416 = False
+    cut_after = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        Handler.requests.append(dict(self.headers))
+        if Handler.always_416:
+            self.send_response(416)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        start = 0
+        range_header = self.headers.get("Range")
+        if range_header and self.headers.get("If-Range") == ETAG:
+            start = int(range_header.split("=")[1].rstrip("-"))
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(CONTENT) - 1}/{len(CONTENT)}")
+        else:
+            self.send_response(200)
+        body = CONTENT[start:]
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", ETAG)
+        self.end_headers()
+        if Handler.cut_after is not None:
+            # the connection is lost in the middle of the body
+            self.wfile.write(body[:Handler.cut_after])
+            self.wfile.flush()
+            self.connection.shutdown(2)
+            return
+        for offset in range(0, len(body), 64 * 1024):
+            self.wfile.write(body[offset:offset + 64 * 1024])
+            time.sleep(Handler.chunk_delay)
+
+
+@pytest.fixture
+def url():
+    Handler.requests = []
+    Handler.chunk_delay = 0.0
+    Handler.always_416 = False
+    Handler.cut_after = None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/file.bin"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = DownloadCache(tmp_path / "cache")
+    yield cache
+    cache.close()
+
+
+def digest() -> str:
+    return hashlib.sha256(CONTENT).hexdigest()
+
+
+def test_fetch_stores_file_by_digest(cache, url):
+    path = cache.fetch(url)
+    assert path == cache.objects / digest()
+    assert path.read_bytes() == CONTENT
+    assert list(cache.partial.glob("*.tmp")) == []
+
+
+def test_known_sha256_is_served_without_request(cache, url):
+    cache.fetch(url)
+    assert cache.fetch(url, digest()).read_bytes() == CONTENT
+    assert len(Handler.requests) == 1
+
+
+def test_known_url_is_revalidated(cache, url):
+    cache.fetch(url)
+    assert cache.fetch(url).read_bytes() == CONTENT
+    assert Handler.requests[1]["If-None-Match"] == ETAG
+
+
+def test_wrong_sha256_is_not_published(cache, url):
+    with pytest.raises(RuntimeError, match="expected"):
+        cache.fetch(url, "0" * 64)
+    assert not (cache.objects / digest()).exists()
+
+
+def test_interrupted_download_is_resumed(cache, url):
+    Handler.cut_after = 100_000
+    with pytest.raises(httpx.TransportError):
+        cache.fetch(url)
+    Handler.cut_after = None
+
+    path = cache.fetch(url)
+    assert path.read_bytes() == CONTENT
+    assert Handler.requests[1]["Range"] == "bytes=100000-"
+
+
+def test_concurrent_fetches_of_same_url(cache, url):
+    Handler.chunk_delay = 0.01
+    with ThreadPoolExecutor(4) as executor:
+        paths = list(executor.map(lambda _: cache.fetch(url), range(4)))
+    assert all(path.read_bytes() == CONTENT for path in paths)
+    assert [path.name for path in cache.objects.iterdir()] == [digest()]
+    assert list(cache.partial.glob("*.tmp")) == []
+
+
+def test_rejected_range_twice_raises(cache, url):
+    Handler.always_416 = True
+    with pytest.raises(RuntimeError, match="rejects the range"):
+        cache.fetch(url)
+
+
+def test_fetch_many(cache, url):
+    paths = cache.fetch_many([(url, None), (url + "?copy", digest())], progress=None)
+    assert {path.read_bytes() for path in paths.values()} == {CONTENT}
+
+
+def test_concurrent_saves_of_same_entry(cache, url):
+    entry = {"url": url, "sha256": digest(), "etag": ETAG, "last_modified": None}
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(lambda _: cache._save_entry(url, entry), range(200)))
+    assert cache._load_entry(url) == entry
+    assert list(cache.urls.glob("*.tmp")) == []
@@ -0,0 +1,64 @@
+"""editable wheels installed into a site folder and imported by another interpreter"""
+import subprocess
+import sys
+import zipfile
+
+import pytest
+
+from toolspy.project import build
+
+PYPROJECT = """
+[project]
+name = "edit-me"
+version = "1.0"
+"""
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    package = tmp_path / "src" / "edit_me"
+    package.mkdir(parents=True)
+    (package / "__init__.py").write_text("from edit_me.sub import VALUE\n")
+    (package / "sub.py").write_text("VALUE = 42\n")
+    (tmp_path / "src" / "single.py").write_text("SINGLE = True\n")
+    # must not shadow the module of stdlib
+    (tmp_path / "src" / "json.py").write_text("raise ImportError('project shadows stdlib')\n")
+    (tmp_path / "pyproject.toml").write_text(PYPROJECT)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def install(project, mode: str):
+    """extract purelib of the editable wheel, the way an installer does"""
+    wheel_name = build.build_editable("dist", {"editable-mode": mode, "cache": "false"})
+    site = project / f"site-{mode}"
+    purelib = "edit_me-1.0.data/purelib/"
+    with zipfile.ZipFile(project / "dist" / wheel_name) as wheel:
+        for name in wheel.namelist():
+            if name.startswith(purelib):
+                (site / name[len(purelib):]).parent.mkdir(parents=True, exist_ok=True)
+                (site / name[len(purelib):]).write_bytes(wheel.read(name))
+    return site
+
+
+@pytest.mark.parametrize("mode", ["pth", "finder"])
+def test_installed_project_imports(project, mode):
+    site = install(project, mode)
+    code = (
+        f"import site; site.addsitedir({str(site)!r}); "
+        "import edit_me, single, json; "
+        "print(edit_me.VALUE, single.SINGLE, edit_me.__file__, json.__file__)"
+    )
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    value, single, package_file, json_file = output.split()
+    assert (value, single) == ("42", "True")
+    assert package_file == str(project / "src" / "edit_me" / "__init__.py")
+    assert not json_file.startswith(str(project))
+
+
+def test_finder_finds_modules_added_after_install(project):
+    site = install(project, "finder")
+    (project / "src" / "added.py").write_text("ADDED = 1\n")
+    code = f"import site; site.addsitedir({str(site)!r}); import added; print(added.ADDED)"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == "1"
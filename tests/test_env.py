@@ -0,0 +1,94 @@
+"""commands of Env, run in parallel and recorded by hooks"""
+import subprocess
+import time
+
+import pytest
+
+from toolspy.utils.process import Env
+from toolspy.utils.process.env import _Cancellation
+from toolspy.utils.process.instrument import Collector
+
+
+def returncodes(env: Env) -> list:
+    return [None if result is None else result.returncode for result in env.results]
+
+
+def test_failure_cancels_running_commands():
+    env = Env()
+    with pytest.raises(subprocess.CalledProcessError):
+        env.run("sleep 5", "sh -c 'sleep 0.5; exit 1'", "echo x", parallel=True)
+    # echo is done before the failure, its result is kept, sleep is killed
+    assert returncodes(env) == [None, 1, 0]
+    assert env.results[2].stdout == "x\n"
+
+
+def test_exited_process_is_not_killed():
+    cancellation = _Cancellation()
+    process = cancellation.start(lambda: subprocess.Popen(["true"]))
+    # exited, but not waited for yet, like while `communicate` is returning
+    time.sleep(0.2)
+    cancellation.cancel()
+    process.wait()
+    assert process.returncode == 0
+    assert not cancellation.is_killed(process)
+
+
+def test_running_process_is_killed():
+    cancellation = _Cancellation()
+    process = cancellation.start(lambda: subprocess.Popen(["sleep", "5"]))
+    cancellation.cancel()
+    process.wait()
+    assert cancellation.is_killed(process)
+    assert cancellation.start(lambda: subprocess.Popen(["true"])) is None
+
+
+@pytest.fixture
+def recorded():
+    env = Env()
+    collector = Collector()
+    env.hooks.append(collector)
+    return env, collector.records
+
+
+def test_records_have_resource_usage(recorded):
+    env, records = recorded
+    assert env.run("sh -c 'echo out; echo err >&2; exit 3'", ignore_errors=True) == "out\n"
+    assert env.last_result.stderr == "err\n"
+    assert env.run("cat", input="in") == "in"
+    with env.open("cat", input="line\n") as stdout:
+        assert list(stdout) == ["line\n"]
+    assert [record.returncode for record in records] == [3, 0, 0]
+    assert all(record.max_rss > 0 and record.user_time is not None for record in records)
+
+
+def test_non_blocking_command_is_recorded_once_exited(recorded):
+    env, records = recorded
+    process = env.run_non_block("sh -c 'exit 2'")
+    while process.poll() is None:
+        time.sleep(0.01)
+    assert process.returncode == 2
+    for _ in range(100):
+        if records:
+            break
+        time.sleep(0.01)
+    assert [record.returncode for record in records] == [2]
+
+
+def test_open_reads_output_incrementally():
+    env = Env()
+    with env.open("sh -c 'for i in 1 2 3; do echo $i; done; echo err >&2'") as stdout:
+        assert [line.strip() for line in stdout] == ["1", "2", "3"]
+    assert (env.last_result.returncode, env.last_result.stderr) == (0, "err\n")
+
+
+def test_open_stops_early():
+    env = Env()
+    started = time.perf_counter()
+    # the command has endless output, it stops on SIGPIPE once stdout is closed
+    with env.open("yes") as stdout:
+        assert stdout.readline() == "y\n"
+    with pytest.raises(KeyError):
+        with env.open("sleep 5"):
+            raise KeyError("the block failed")
+    assert time.perf_counter() - started < 2
+    assert env.last_result.returncode == -9
@@ -0,0 +1,159 @@
+"""K8sClient against the fake API server"""
+import os
+
+import pytest
+
+from toolspy.toolbox.k8s import client as k8s_client
+from toolspy.toolbox.k8s.client import ApiError, ClusterConfig, K8sClient
+from toolspy.toolbox.k8s.port_forward import Pod, PortForwardConf
+from toolspy.utils.process import Env
+from toolspy.utils.process.cache import CommandCache
+
+SERVICES = "/api/v1/namespaces/default/services"
+ENDPOINTS = "/api/v1/namespaces/default/endpoints"
+DEPLOYMENTS = "/apis/apps/v1/namespaces/default/deployments"
+
+
+def service(name: str, **labels) -> dict:
+    return {"apiVersion": "v1", "kind": "Service", "metadata": {"name": name, "labels": labels}}
+
+
+@pytest.fixture
+def client(kubeconfig):
+    with K8sClient.from_kubeconfig(kubeconfig) as client:
+        client.cache = None
+        yield client
+
+
+def test_kubeconfig(kubeconfig, fake_api):
+    config = ClusterConfig.from_kubeconfig(kubeconfig)
+    assert config.server == fake_api.url
+    assert config.namespace == "default"
+    assert config.token == "t0ken"
+
+
+def test_version(client):
+    assert client.version()["gitVersion"] == "v1.30.0"
+
+
+def test_list_follows_pages_and_sends_selector(client, fake_api):
+    for index in range(5):
+        fake_api.put(SERVICES, service(f"s{index}", app="web" if index % 2 else "db"))
+
+    assert len(client.list("services", limit=2)["items"]) == 5
+    assert fake_api.requested("GET", SERVICES) == 3
+
+    names = [item["metadata"]["name"] for item in client.list("services", label_selector="app in (web)")["items"]]
+    assert names == ["s1", "s3"]
+    assert fake_api.requests[-1][2]["labelSelector"] == "app=web"
+
+
+def test_list_metadata(client, fake_api):
+    fake_api.put(SERVICES, service("s0"))
+    result = client.list_metadata("services")
+    assert result["kind"] == "PartialObjectMetadataList"
+    assert result["items"][0]["metadata"]["name"] == "s0"
+
+
+def test_get_missing_raises_api_error(client):
+    with pytest.raises(ApiError) as error:
+        client.get("services", "missing")
+    assert error.value.status == 404
+    assert error.value.reason == "NotFound"
+
+
+def test_apply_is_server_side(client, fake_api):
+    applied = client.apply("""
+apiVersion: v1
+kind: Service
+metadata:
+  name: web
+---
+apiVersion: apps/v1
+kind: Deployment
+metadata:
+  name: web
+  namespace: default
+spec:
+  replicas: 2
+""")
+    assert [obj["kind"] for obj in applied] == ["Service", "Deployment"]
+    method, path, query, headers = fake_api.requests[-1]
+    assert (method, path) == ("PATCH", f"{DEPLOYMENTS}/web")
+    assert query == {"fieldManager": "toolspy", "force": "true"}
+    assert headers["Content-Type"] == "application/apply-patch+yaml"
+    assert client.get("deployments", "web")["spec"]["replicas"] == 2
+
+
+def test_patch_and_delete(client, fake_api):
+    fake_api.put(DEPLOYMENTS, {"metadata": {"name": "web"}, "spec": {"replicas": 3}})
+    client.patch("deployments", "web", {"spec": {"replicas": 0}})
+    assert fake_api.objects[DEPLOYMENTS]["web"]["spec"]["replicas"] == 0
+
+    client.delete("deployments", "web")
+    assert "web" not in fake_api.objects[DEPLOYMENTS]
+
+
+def test_unknown_resource_is_discovered(client, fake_api):
+    assert client.resource("widgets").group_version == "example.com/v1"
+    assert client.resource("widget.example.com").name == "widgets"
+    with pytest.raises(KeyError):
+        client.resource("gadgets")
+    # discovery is done once
+    assert fake_api.requested("GET", "/apis") == 1
+
+
+def test_watch(client, fake_api):
+    fake_api.put(SERVICES, service("old"))
+    version = str(fake_api.version)
+    fake_api.put(SERVICES, service("new"))
+    events = list(client.watch("services", resource_version=version, timeout=1))
+    assert [(event["type"], event["object"]["metadata"]["name"]) for event in events] == [("ADDED", "new")]
+
+
+def test_watch_of_expired_version(client, fake_api):
+    fake_api.compacted = 200
+    with pytest.raises(ApiError) as error:
+        list(client.watch("services", resource_version="150", timeout=1))
+    assert error.value.status == 410
+
+
+def test_reads_are_cached_until_client_changes_something(client, fake_api):
+    client.cache = CommandCache(ttl=60)
+    fake_api.put(SERVICES, service("s0"))
+
+    client.list("services", cache=True)
+    client.list("services", cache=True)
+    assert fake_api.requested("GET", SERVICES) == 1
+    # reads which aren't marked are always made
+    client.list("services")
+    assert fake_api.requested("GET", SERVICES) == 2
+
+    client.apply(service("s1"), namespace="default")
+    assert len(client.list("services", cache=True)["items"]) == 2
+    assert fake_api.requested("GET", SERVICES) == 3
+
+
+def test_pooled_client_is_reloaded_with_kubeconfig(kubeconfig):
+    pooled = k8s_client.client(kubeconfig)
+    assert k8s_client.client(kubeconfig) is pooled
+    stat = kubeconfig.stat()
+    os.utime(kubeconfig, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert k8s_client.client(kubeconfig) is not pooled
+
+
+def test_pods_of_port_forward_config(kubeconfig, fake_api):
+    fake_api.put(ENDPOINTS, {"metadata": {"name": "web"}, "subsets": [{
+        "ports": [{"port": 8080}],
+        "addresses": [
+            {"ip": "10.0.0.2", "targetRef": {"kind": "Pod", "name": "web-b"}},
+            {"ip": "10.0.0.1", "targetRef": {"kind": "Pod", "name": "web-a"}},
+        ],
+    }]})
+    config = PortForwardConf(endpoint="web", namespace="default", port=80, localPort0=9000)
+
+    env = Env()
+    env.env_vars["KUBECONFIG"] = str(kubeconfig)
+    pods = Pod.from_config(config, env)
+    assert [(pod.name, pod.port, pod.localPort) for pod in pods] == [("web-a", 8080, 9000), ("web-b", 8080, 9001)]
+    assert Pod.from_config(config, client=K8sClient.from_kubeconfig(kubeconfig)) == pods
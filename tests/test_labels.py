@@ -0,0 +1,149 @@
+"""label selectors, their matching and LabelIndex"""
+import pytest
+
+from toolspy.toolbox.k8s.helpers import match_labels
+from toolspy.toolbox.k8s.labels import (
+    DOES_NOT_EXIST,
+    EXISTS,
+    IN,
+    NOT_IN,
+    LabelIndex,
+    Requirement,
+    Selector,
+    to_query,
+)
+
+WEB = {"app": "web", "tier": "front"}
+API = {"app": "api", "tier": "back", "canary": "true"}
+BARE: dict = {}
+
+
+def matching(selector: str) -> list:
+    parsed = Selector.parse(selector)
+    return [name for name, labels in (("web", WEB), ("api", API), ("bare", BARE)) if parsed.matches(labels)]
+
+
+@pytest.mark.parametrize("selector, names", [
+    ("app=web", ["web"]),
+    ("app==web", ["web"]),
+    ("app!=web", ["api", "bare"]),
+    ("app in (web, api)", ["web", "api"]),
+    ("app notin (web,api)", ["bare"]),
+    ("canary", ["api"]),
+    ("!canary", ["web", "bare"]),
+    ("app in (web,api),!canary", ["web"]),
+    ("tier=front,app=api", []),
+    ("", ["web", "api", "bare"]),
+])
+def test_operators(selector, names):
+    assert matching(selector) == names
+
+
+def test_parsed_requirements():
+    selector = Selector.parse("example.com/part-of=proxy, tier in (web,api), !canary, app notin (x), team")
+    assert {(requirement.key, requirement.operator, requirement.values) for requirement in selector.requirements} == {
+        ("example.com/part-of", IN, frozenset(["proxy"])),
+        ("tier", IN, frozenset(["web", "api"])),
+        ("canary", DOES_NOT_EXIST, frozenset()),
+        ("app", NOT_IN, frozenset(["x"])),
+        ("team", EXISTS, frozenset()),
+    }
+
+
+@pytest.mark.parametrize("selector", [
+    "a,,b",
+    "a,",
+    ",a",
+    "app=web=x",
+    "app in web",
+    "app=-web",
+    "-app=web",
+    "app=" + "x" * 64,
+    "Example.com/app=web",
+    "app in (web",
+])
+def test_malformed_selector_raises(selector):
+    with pytest.raises(ValueError):
+        Selector.parse(selector)
+
+
+def test_empty_value():
+    # like on the server, an empty set is the empty value
+    assert Selector.parse("app in ()") == Selector.parse("app=")
+    assert Selector.parse("app=").matches({"app": ""})
+
+
+def test_invalid_requirement_raises():
+    with pytest.raises(ValueError, match="operator"):
+        Requirement("app", "Equals", frozenset(["web"]))
+    with pytest.raises(ValueError, match="no values"):
+        Requirement("app", IN)
+
+
+def test_canonical_text_and_query():
+    selector = Selector.parse("tier in (web, api),!canary,app==x,b!=y")
+    assert str(selector) == "app=x,b!=y,!canary,tier in (api,web)"
+    assert Selector.parse(str(selector)) == selector
+    assert to_query({"app": "web"}) == "app=web"
+    assert to_query("app in (web)") == "app=web"
+    assert to_query(Selector()) is None
+    assert to_query(None) is None
+    assert to_query("") is None
+
+
+def test_from_label_selector():
+    selector = Selector.from_label_selector({
+        "matchLabels": {"app": "web"},
+        "matchExpressions": [
+            {"key": "tier", "operator": "In", "values": ["front", "edge"]},
+            {"key": "canary", "operator": "DoesNotExist"},
+        ],
+    })
+    assert selector == Selector.parse("app=web,tier in (front,edge),!canary")
+    assert Selector.from_label_selector({}) == Selector()
+
+
+def test_coerce():
+    selector = Selector.parse("app=web")
+    assert Selector.coerce(selector) is selector
+    assert Selector.coerce("app=web") == selector
+    assert Selector.coerce({"app": "web"}) == selector
+    assert not Selector.coerce(None)
+
+
+def test_empty_selector_matches_object_without_labels():
+    # it used to match only objects with some labels, the API server matches all of them
+    assert Selector().matches_object({"metadata": {}})
+    assert match_labels({"metadata": {"name": "bare"}}, {})
+    assert not match_labels({"metadata": {"name": "bare"}}, {"app": "web"})
+
+
+def test_filter():
+    objects = [{"metadata": {"name": "web", "labels": WEB}}, {"metadata": {"name": "bare"}}]
+    assert [obj["metadata"]["name"] for obj in Selector.parse("!app").filter(objects)] == ["bare"]
+
+
+def test_label_index():
+    index = LabelIndex()
+    index.set("web", WEB)
+    index.set("api", API)
+    index.set("bare", None)
+    assert len(index) == 3 and "bare" in index
+    assert index.values("app") == {"web", "api"}
+
+    assert index.select("app in (web,api)") == {"web", "api"}
+    assert index.select("canary") == {"api"}
+    assert index.select("app=web,tier=back") == set()
+    assert index.select("app!=web") == {"api", "bare"}
+    assert index.select({}) == {"web", "api", "bare"}
+
+    # changed labels replace the indexed ones
+    index.set("api", {"app": "web"})
+    assert index.select("app=web") == {"web", "api"}
+    assert index.values("canary") == set()
+
+    index.discard("web")
+    index.discard("missing")
+    assert index.select("app=web") == {"api"}
+    index.clear()
+    assert len(index) == 0 and index.select("") == set()
@@ -0,0 +1,46 @@
+"""wheels built with the metadata prepared by prepare_metadata_for_build_wheel"""
+import zipfile
+
+import pytest
+
+from toolspy.project import build
+
+PYPROJECT = """
+[project]
+name = "meta"
+version = "1.0"
+"""
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    (tmp_path / "src" / "meta").mkdir(parents=True)
+    (tmp_path / "src" / "meta" / "__init__.py").write_text("")
+    (tmp_path / "pyproject.toml").write_text(PYPROJECT)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.mark.parametrize("cache", ["true", "false"])
+def test_wheel_has_prepared_dist_info(project, cache):
+    dist_info = build.prepare_metadata_for_build_wheel("metadata")
+    assert dist_info == "meta-1.0.dist-info"
+    prepared = project / "metadata" / dist_info
+    # the wheel takes the prepared files as they are, not generated again
+    (prepared / "METADATA").write_text((prepared / "METADATA").read_text() + "Summary: prepared\n")
+
+    if cache == "true":
+        # a cached wheel of the same sources is built before
+        build.build_wheel("dist", {"cache": cache})
+    wheel_name = build.build_wheel("dist", {"cache": cache}, str(project / "metadata"))
+    with zipfile.ZipFile(project / "dist" / wheel_name) as wheel:
+        assert wheel.read(f"{dist_info}/METADATA") == (prepared / "METADATA").read_bytes()
+        assert wheel.read(f"{dist_info}/WHEEL") == (prepared / "WHEEL").read_bytes()
+        assert f"{dist_info}/RECORD" in wheel.namelist()
+
+
+def test_prepared_metadata_is_the_same_as_built(project):
+    dist_info = build.prepare_metadata_for_build_wheel("metadata")
+    wheel_name = build.build_wheel("dist", {"cache": "false"})
+    with zipfile.ZipFile(project / "dist" / wheel_name) as wheel:
+        assert wheel.read(f"{dist_info}/METADATA") == (project / "metadata" / dist_info / "METADATA").read_bytes()
@@ -0,0 +1,56 @@
+"""reproducible sdists built from the source tree"""
+import os
+import tarfile
+
+import pytest
+
+from toolspy.project import build
+
+PYPROJECT = """
+[project]
+name = "repro-dist"
+version = "1.0"
+
+[tool.toolspy.build_scripts]
+gen = {}
+"""
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    package = tmp_path / "src" / "repro"
+    (package / "__pycache__").mkdir(parents=True)
+    (package / "__init__.py").write_text("x = 1\n")
+    (package / "stale.pyc").write_bytes(b"\0")
+    (package / "__pycache__" / "__init__.cpython-311.pyc").write_bytes(b"\0")
+    (tmp_path / "tools").mkdir()
+    (tmp_path / "tools" / "gen.py").write_text("def run(dirs, config):\n    pass\n")
+    (tmp_path / "pyproject.toml").write_text(PYPROJECT)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "1700000000")
+    return tmp_path
+
+
+def members(path) -> dict:
+    with tarfile.open(path) as sdist:
+        return {member.name: member for member in sdist.getmembers()}
+
+
+def test_same_sources_give_identical_sdists(project):
+    first = (project / "dist" / build.build_sdist("dist")).read_bytes()
+    # only mtimes of the sources change
+    os.utime(project / "src" / "repro" / "__init__.py", (1, 1))
+    second = (project / "dist" / build.build_sdist("dist")).read_bytes()
+    assert first == second
+    assert {member.mtime for member in members(project / "dist" / "repro_dist-1.0.tar.gz").values()} == {1700000000}
+
+
+def test_members(project):
+    sdist = members(project / "dist" / build.build_sdist("dist"))
+    assert sorted(sdist) == [
+        "repro_dist-1.0/PKG-INFO",
+        "repro_dist-1.0/pyproject.toml",
+        "repro_dist-1.0/src/repro/__init__.py",
+        "repro_dist-1.0/tools/gen.py",
+    ]
+    assert {(member.uid, member.gid, member.uname, member.gname) for member in sdist.values()} == {(0, 0, "", "")}
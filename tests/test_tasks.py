@@ -0,0 +1,151 @@
+"""parallel execution of tasks"""
+from itertools import count, islice
+import threading
+import time
+
+import pytest
+
+from toolspy.utils.tasks import iter_in_parallel, run_graph, run_in_parallel, topological_order
+
+
+def sleep(seconds: float) -> float:
+    time.sleep(seconds)
+    return seconds
+
+
+def square(x: int) -> int:
+    return x * x
+
+
+def test_results_in_completion_or_item_order():
+    delays = [0.3, 0.1, 0.2]
+    assert [task.result for task in iter_in_parallel(sleep, delays, max_workers=3)] == [0.1, 0.2, 0.3]
+    ordered = list(iter_in_parallel(sleep, delays, max_workers=3, ordered=True))
+    assert [task.item for task in ordered] == delays
+    assert [task.index for task in ordered] == [0, 1, 2]
+
+
+def test_timeout_leaves_remaining_items_unstarted():
+    started = []
+
+    def call(item):
+        started.append(item)
+        time.sleep(0.5)
+
+    begin = time.perf_counter()
+    tasks = list(iter_in_parallel(call, range(10), max_workers=2, max_in_flight=2, timeout=0.2))
+    assert time.perf_counter() - begin < 0.45
+    assert sorted(task.item for task in tasks) == [0, 1]
+    assert all(isinstance(task.error, TimeoutError) for task in tasks)
+    assert sorted(started) == [0, 1]
+
+
+def test_task_timeout():
+    begin = time.perf_counter()
+    tasks = list(iter_in_parallel(sleep, [0.05, 1.0, 0.05], max_workers=3, ordered=True, task_timeout=0.3))
+    assert time.perf_counter() - begin < 0.9
+    assert [task.ok for task in tasks] == [True, False, True]
+    assert isinstance(tasks[1].error, TimeoutError)
+    with pytest.raises(TimeoutError):
+        tasks[1].get()
+
+
+def test_items_are_taken_lazily():
+    taken = []
+
+    def items():
+        for item in count():
+            taken.append(item)
+            yield item
+
+    results = [task.result for task in islice(iter_in_parallel(square, items(), max_workers=2, ordered=True), 5)]
+    assert results == [0, 1, 4, 9, 16]
+    # no more than `max_in_flight` items ahead of the consumer
+    assert len(taken) <= 5 + 4
+
+
+def test_fail_fast_cancels_queued_calls():
+    called = []
+
+    def call(item):
+        called.append(item)
+        if item == 0:
+            raise ValueError("broken")
+        time.sleep(0.01)
+
+    tasks = list(iter_in_parallel(call, range(100), max_workers=2, fail_fast=True))
+    assert [task.item for task in tasks if not task.ok] == [0]
+    assert len(called) < 10
+    assert len(tasks) == len(called)
+
+
+def test_processes():
+    tasks = iter_in_parallel(square, range(5), max_workers=2, ordered=True, processes=True)
+    assert [task.result for task in tasks] == [0, 1, 4, 9, 16]
+
+
+def test_run_in_parallel_returns_results_and_tracebacks():
+    def fail():
+        raise ValueError("boom")
+
+    results, tracebacks = run_in_parallel([lambda: 1, fail, lambda: 2])
+    assert sorted(results) == [1, 2]
+    assert len(tracebacks) == 1
+    assert tracebacks[0].startswith("Traceback") and "ValueError: boom" in tracebacks[0]
+
+
+def test_topological_order():
+    order = topological_order({"unpack": ["download"], "install": ["unpack", "config"], "download": [], "config": []})
+    assert order.index("download") < order.index("unpack") < order.index("install")
+    assert order.index("config") < order.index("install")
+
+
+def test_topological_order_rejects_unknown_and_cyclic_dependencies():
+    with pytest.raises(ValueError, match="unknown tasks: missing"):
+        topological_order({"a": ["missing"]})
+    with pytest.raises(ValueError, match="cyclic"):
+        topological_order({"a": ["b"], "b": ["a"], "c": []})
+
+
+def test_graph_runs_independent_tasks_concurrently():
+    barrier = threading.Barrier(2, timeout=5)
+    order = []
+
+    def task(name: str, meet: bool = False):
+        def call():
+            if meet:
+                # fails unless the other independent task runs at the same time
+                barrier.wait()
+            order.append(name)
+            return name
+        return call
+
+    graph = run_graph(
+        {"a": task("a", True), "b": task("b", True), "c": task("c")},
+        {"c": ["a", "b"]},
+        max_workers=2,
+    )
+    assert graph.results == {"a": "a", "b": "b", "c": "c"}
+    assert order[-1] == "c"
+    assert graph.durations.keys() == {"a", "b", "c"}
+
+
+def test_graph_skips_dependents_of_failed_tasks():
+    def fail():
+        raise ValueError("broken")
+
+    graph = run_graph(
+        {"fail": fail, "child": lambda: 1, "grandchild": lambda: 2, "other": lambda: 3},
+        {"child": ["fail"], "grandchild": ["child"]},
+    )
+    assert list(graph.errors) == ["fail"]
+    assert isinstance(graph.errors["fail"], ValueError)
+    assert sorted(graph.skipped) == ["child", "grandchild"]
+    assert graph.results == {"other": 3}
+
+
+def test_graph_rejects_cycles_before_running():
+    started = []
+    with pytest.raises(ValueError, match="cyclic"):
+        run_graph({"a": lambda: started.append("a"), "b": lambda: started.append("b")}, {"a": ["b"], "b": ["a"]})
+    assert started == []
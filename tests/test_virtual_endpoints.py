@@ -0,0 +1,114 @@
+"""multi-cluster proxy endpoints against the fake API server"""
+import threading
+import time
+
+import pytest
+
+from toolspy.toolbox.k8s import virtual_endpoints
+from toolspy.toolbox.k8s.virtual_endpoints import FINGERPRINT_ANNOTATION, PROXY_LABELS, ProxyEndpointsController
+
+SERVICES = "/api/v1/namespaces/default/services"
+ENDPOINTS = "/api/v1/namespaces/default/endpoints"
+SLICES = "/apis/discovery.k8s.io/v1/namespaces/default/endpointslices"
+
+
+def proxy_service(name: str, component: str, cluster_ip: str) -> dict:
+    labels = {**PROXY_LABELS, "app.kubernetes.io/component": component}
+    return {
+        "metadata": {"name": name, "labels": labels},
+        "spec": {"clusterIP": cluster_ip, "ports": [{"name": "http", "port": 80, "protocol": "TCP"}]},
+    }
+
+
+def patches(fake_api) -> list:
+    return [path for method, path, _, _ in fake_api.requests if method == "PATCH"]
+
+
+def full_lists(fake_api, path: str) -> int:
+    """lists of whole objects, not of their metadata"""
+    return sum(
+        1 for method, request_path, _, headers in fake_api.requests
+        if (method, request_path) == ("GET", path) and "PartialObjectMetadataList" not in headers.get("Accept", "")
+    )
+
+
+def test_endpoints_are_applied_once(kubeconfig, fake_api):
+    fake_api.put(SERVICES, proxy_service("web-a", "web", "10.0.0.1"))
+    fake_api.put(SERVICES, proxy_service("web-b", "web", "10.0.0.2"))
+    fake_api.put(SERVICES, {"metadata": {"name": "other"}, "spec": {"clusterIP": "10.0.0.9"}})
+
+    virtual_endpoints.update_multi_cluster_proxy_endpoints("default", str(kubeconfig))
+    endpoint = fake_api.objects[ENDPOINTS]["web"]
+    assert [address["ip"] for address in endpoint["subsets"][0]["addresses"]] == ["10.0.0.1", "10.0.0.2"]
+    assert FINGERPRINT_ANNOTATION in endpoint["metadata"]["annotations"]
+    assert patches(fake_api) == [f"{ENDPOINTS}/web"]
+
+    # the fingerprint matches, the endpoints aren't even fetched
+    virtual_endpoints.update_multi_cluster_proxy_endpoints("default", str(kubeconfig))
+    assert patches(fake_api) == [f"{ENDPOINTS}/web"]
+    assert full_lists(fake_api, ENDPOINTS) == 0
+
+    fake_api.put(SERVICES, proxy_service("web-c", "web", "10.0.0.3"))
+    virtual_endpoints.update_multi_cluster_proxy_endpoints("default", str(kubeconfig))
+    assert len(fake_api.objects[ENDPOINTS]["web"]["subsets"][0]["addresses"]) == 3
+
+
+def test_endpoint_slices(kubeconfig, fake_api):
+    for index in range(150):
+        fake_api.put(SERVICES, proxy_service(f"web-{index:03}", "web", f"10.0.{index // 250}.{index % 250 + 1}"))
+
+    virtual_endpoints.update_multi_cluster_proxy_endpoints("default", str(kubeconfig), backend="endpointslices")
+    slices = fake_api.objects[SLICES]
+    assert sorted(len(endpoint_slice["endpoints"]) for endpoint_slice in slices.values()) == [50, 100]
+
+    # a removed address rewrites only the slice which has it
+    fake_api.put(SERVICES, fake_api.objects[SERVICES]["web-000"], "DELETED")
+    applied = len(patches(fake_api))
+    virtual_endpoints.update_multi_cluster_proxy_endpoints("default", str(kubeconfig), backend="endpointslices")
+    assert len(patches(fake_api)) == applied + 1
+    assert sum(len(endpoint_slice["endpoints"]) for endpoint_slice in slices.values()) == 149
+
+
+def addresses(fake_api, backend: str) -> list:
+    """addresses of the `web` component applied by the backend"""
+    if backend == "endpoints":
+        endpoint = fake_api.objects.get(ENDPOINTS, {}).get("web")
+        return sorted(address["ip"] for address in endpoint["subsets"][0]["addresses"]) if endpoint else []
+    return sorted(
+        address
+        for endpoint_slice in fake_api.objects.get(SLICES, {}).values()
+        for endpoint in endpoint_slice["endpoints"]
+        for address in endpoint["addresses"]
+    )
+
+
+def eventually(check, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not check():
+        assert time.monotonic() < deadline, "condition wasn't met in time"
+        time.sleep(0.02)
+
+
+@pytest.mark.parametrize("backend", ["endpoints", "endpointslices"])
+def test_controller_follows_changes(kubeconfig, fake_api, backend):
+    fake_api.put(SERVICES, proxy_service("web-a", "web", "10.0.0.1"))
+    fake_api.put(SERVICES, proxy_service("web-b", "web", "10.0.0.2"))
+    controller = ProxyEndpointsController("default", str(kubeconfig), debounce=0.05, watch_timeout=1, backend=backend)
+    thread = threading.Thread(target=controller.run, daemon=True)
+    thread.start()
+    try:
+        # initial sync
+        eventually(lambda: addresses(fake_api, backend) == ["10.0.0.1", "10.0.0.2"])
+
+        fake_api.put(SERVICES, proxy_service("web-c", "web", "10.0.0.3"))
+        eventually(lambda: addresses(fake_api, backend) == ["10.0.0.1", "10.0.0.2", "10.0.0.3"])
+
+        # applied objects removed by someone else are restored
+        collection = ENDPOINTS if backend == "endpoints" else SLICES
+        for obj in list(fake_api.objects[collection].values()):
+            fake_api.put(collection, obj, "DELETED")
+        eventually(lambda: addresses(fake_api, backend) == ["10.0.0.1", "10.0.0.2", "10.0.0.3"])
+    finally:
+        controller.stop()
+        thread.join(5)
+    assert not thread.is_alive()